@@ -0,0 +1,135 @@
+"""
+Verify that cached catalog data stays coherent across worker processes.
+
+Starts --workers reader processes, each with its own server module, caches
+and invalidation listener, the same as separate uvicorn workers. The parent
+then renames a probe category --rounds times through publish_invalidation().
+Each reader polls category_cache and reports when it first sees the new
+name. The script prints staleness percentiles and exits non-zero when any
+reader took longer than --bound-ms.
+
+Run with --no-bus to see the TTL-only bound (CATALOG_CACHE_TTL_SECONDS)
+that applies when the invalidation bus is down. Needs a real MongoDB;
+tailable cursors need a capped collection.
+
+    cd backend
+    python benchmarks/cache_coherence.py --workers 4 --rounds 20 --bound-ms 1000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import queue
+import sys
+import time
+
+import common
+
+PROBE_ID = "coherence-probe"
+SHOP_ID = "coherence-shop"
+
+
+def reader(worker_no: int, use_bus: bool, poll_ms: float, ready, events, stop):
+    import server
+
+    async def run():
+        server.connect_db()
+        if use_bus:
+            listener = asyncio.create_task(server.invalidation_listener())
+            while not server.invalidation_state["connected"]:
+                await asyncio.sleep(0.05)
+        last_seen = None
+        ready.put(worker_no)
+        while not stop.is_set():
+            categories = await server.category_cache.get(SHOP_ID)
+            name = next((c["name_en"] for c in categories if c["id"] == PROBE_ID), None)
+            if name != last_seen:
+                events.put((worker_no, name, time.time()))
+                last_seen = name
+            await asyncio.sleep(poll_ms / 1000)
+        if use_bus:
+            listener.cancel()
+
+    asyncio.run(run())
+
+
+async def write_probe(server, name: str):
+    await server.db.categories.update_one(
+        {"shop_id": SHOP_ID, "id": PROBE_ID},
+        {"$set": {"name_en": name, "name_np": name, "icon": "test", "is_active": True}},
+        upsert=True,
+    )
+    await server.publish_invalidation("categories", SHOP_ID)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--interval-ms", type=float, default=500, help="pause between writes")
+    parser.add_argument("--poll-ms", type=float, default=10, help="how often readers look at their cache")
+    parser.add_argument("--bound-ms", type=float, default=1000, help="fail when any reader is staler than this")
+    parser.add_argument("--no-bus", action="store_true", help="readers rely on the cache TTL only")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    import server
+
+    server.connect_db()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(write_probe(server, "probe-initial"))
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, events, stop = ctx.Queue(), ctx.Queue(), ctx.Event()
+    workers = [
+        ctx.Process(target=reader, args=(n, not args.no_bus, args.poll_ms, ready, events, stop))
+        for n in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.get(timeout=60)
+
+    written_at = {}
+    for round_no in range(args.rounds):
+        name = f"probe-{round_no}"
+        written_at[name] = time.time()
+        loop.run_until_complete(write_probe(server, name))
+        time.sleep(args.interval_ms / 1000)
+    # Give TTL-only readers time to catch up with the last write
+    deadline = time.time() + (server.CATALOG_CACHE_TTL_SECONDS + 2 if args.no_bus else 2)
+
+    seen = {}
+    while time.time() < deadline or not events.empty():
+        try:
+            worker_no, name, at = events.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        seen.setdefault((worker_no, name), at)
+    stop.set()
+    for worker in workers:
+        worker.join(timeout=10)
+
+    staleness = []
+    missed = 0
+    for name, at in written_at.items():
+        for worker_no in range(args.workers):
+            if (worker_no, name) in seen:
+                staleness.append(max(0.0, (seen[(worker_no, name)] - at) * 1000))
+            else:
+                # Overwritten before this reader looked; the next name bounds it
+                missed += 1
+
+    summary = common.percentiles(staleness)
+    common.print_table([{"mode": "ttl only" if args.no_bus else "bus", **summary, "missed": missed}],
+                       ["mode", "n", "p50", "p95", "p99", "max", "missed"])
+    if args.output:
+        common.write_results(args.output, "cache_coherence", {"params": vars(args), "staleness_ms": summary, "missed": missed})
+
+    if not staleness or summary["max"] > args.bound_ms:
+        print(f"FAIL: staleness above {args.bound_ms:.0f} ms")
+        sys.exit(1)
+    print(f"OK: every reader saw every write within {summary['max']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
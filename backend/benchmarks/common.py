@@ -0,0 +1,82 @@
+"""
+Shared helpers for the backend benchmark scripts.
+
+Import this module before ``server``: it puts the backend directory on
+``sys.path`` and points the app at a throwaway benchmark database, so a
+benchmark run can never touch the real shop data.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+load_dotenv(BACKEND_DIR / '.env')
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+# Never benchmark against the real shop database
+os.environ['DB_NAME'] = os.environ.get('BENCH_DB_NAME', 'pasal_sathi_bench')
+
+
+def percentiles(samples):
+    """Summarise a list of millisecond samples (nearest-rank percentiles)"""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    return {
+        "n": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "min": ordered[0],
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": ordered[-1],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, results):
+    """Write results with enough metadata to compare runs across commits"""
+    payload = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    Path(path).write_text(json.dumps(payload, indent=2, ensure_ascii=False))
+    print(f"Results written to {path}")
+
+
+def print_table(rows, columns):
+    """Print a list of dicts as an aligned text table"""
+    widths = {c: max(len(c), *(len(_fmt(r.get(c))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(_fmt(row.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return "" if value is None else str(value)
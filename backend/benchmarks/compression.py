@@ -0,0 +1,101 @@
+"""
+Benchmark response compression: bytes on the wire and CPU time per payload.
+
+Builds the payloads the app actually sends (product list, a month of sales
+as JSON and NDJSON, the inventory XLSX and the sales PDF) and runs them
+through the same StreamEncoder the CompressionMiddleware uses. Transfer
+time is estimated for a slow mobile link. No database is needed.
+
+    cd backend
+    python benchmarks/compression.py --products 3000 --sales 4000 --link-kbps 750
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import common  # noqa: F401  (must come before server)
+
+import server  # noqa: E402
+
+
+def build_payloads(products: int, sales: int, rng: random.Random):
+    base = datetime(2024, 1, 1)
+    product_docs = [server.Product(
+        name_en=f"Item {i:05d}", name_np="चामल", category=rng.choice(server.CATEGORIES)["id"],
+        selling_price=rng.randint(20, 5000), quantity=rng.randint(0, 200),
+    ).model_dump() for i in range(products)]
+    sale_docs = []
+    for i in range(sales):
+        items = [server.SaleItem(
+            product_id=product_docs[rng.randrange(products)]["id"], product_name="Wai Wai Noodles",
+            quantity=rng.randint(1, 5), unit_price=25, total=25
+        ) for _ in range(rng.randint(1, 5))]
+        total = sum(item.total for item in items)
+        sale_docs.append(server.Sale(
+            items=items, subtotal=total, total=total, payment_type=rng.choice(["cash", "credit"]),
+            created_at=base + timedelta(minutes=11 * i),
+        ).model_dump())
+
+    return [
+        ("products.json", "application/json", server.fast_list_response(server.Product, product_docs).body),
+        ("sales.json", "application/json", server.fast_list_response(server.Sale, sale_docs).body),
+        ("sales.ndjson", "application/x-ndjson",
+         b"".join(json.dumps(d, default=str).encode() + b"\n" for d in sale_docs)),
+        ("inventory.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+         server.render_inventory_excel(product_docs)),
+        ("sales.pdf", "application/pdf", server.render_sales_pdf(sale_docs, "2024-01-01", "2024-01-31")),
+    ]
+
+
+def compress(encoding: str, body: bytes):
+    started = time.perf_counter()
+    out = server.StreamEncoder(encoding).encode(body, final=True)
+    return len(out), (time.perf_counter() - started) * 1000
+
+
+def run(args):
+    payloads = build_payloads(args.products, args.sales, random.Random(42))
+    encodings = ["gzip"] + (["br"] if server.brotli is not None else [])
+    bytes_per_ms = args.link_kbps * 1000 / 8 / 1000
+
+    rows = []
+    for name, content_type, body in payloads:
+        compressed_by_app = content_type.startswith(server.COMPRESSIBLE_TYPES)
+        row = {
+            "payload": name, "raw_kb": len(body) / 1024, "app": "compress" if compressed_by_app else "skip",
+            "raw_transfer_ms": len(body) / bytes_per_ms,
+        }
+        for encoding in encodings:
+            size, ms = compress(encoding, body)
+            row[f"{encoding}_kb"] = size / 1024
+            row[f"{encoding}_ratio"] = len(body) / size if size else None
+            row[f"{encoding}_cpu_ms"] = ms
+            row[f"{encoding}_transfer_ms"] = size / bytes_per_ms + ms
+        rows.append(row)
+
+    columns = ["payload", "app", "raw_kb", "raw_transfer_ms"]
+    for encoding in encodings:
+        columns += [f"{encoding}_kb", f"{encoding}_ratio", f"{encoding}_cpu_ms", f"{encoding}_transfer_ms"]
+    common.print_table(rows, columns)
+
+    if args.output:
+        common.write_results(args.output, "compression", {
+            "params": vars(args),
+            "settings": {"gzip_level": server.GZIP_LEVEL, "brotli_quality": server.BROTLI_QUALITY},
+            "rows": rows,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=3000)
+    parser.add_argument("--sales", type=int, default=4000, help="roughly a busy month")
+    parser.add_argument("--link-kbps", type=float, default=750, help="downlink used to estimate transfer time")
+    parser.add_argument("--output", help="write JSON results to this path")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure how long ``import server`` takes in a fresh interpreter, using
+``python -X importtime``, and fail when it goes over budget.
+
+Exits non-zero when the best of --runs cold imports is slower than
+--budget-ms, or when a module that must stay lazy (report and scan
+libraries) is imported at startup, so it can gate CI.
+
+    cd backend
+    python benchmarks/import_time.py --budget-ms 900
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+import common
+
+# Loaded on first use or by warm_up_imports(), never while the app boots
+LAZY_MODULES = ["openpyxl", "reportlab", "PIL", "openai"]
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def import_profile():
+    """One cold import; returns {module: (self_us, cumulative_us, depth)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=common.BACKEND_DIR, env=os.environ.copy(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("import server failed")
+    profile = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            profile[module] = (int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get('IMPORT_BUDGET_MS', '900')))
+    parser.add_argument("--top", type=int, default=15, help="heaviest top-level imports to list")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    best = min(profiles, key=lambda p: p["server"][1])
+    totals = [p["server"][1] / 1000 for p in profiles]
+
+    # Direct imports of server.py, heaviest first
+    direct = [(m, v) for m, v in best.items() if v[2] == 1]
+    direct.sort(key=lambda item: item[1][1], reverse=True)
+    rows = [{"module": m, "cumulative_ms": v[1] / 1000, "self_ms": v[0] / 1000} for m, v in direct[:args.top]]
+    common.print_table(rows, ["module", "cumulative_ms", "self_ms"])
+
+    summary = common.percentiles(totals)
+    print(f"\nimport server: best {summary['min']:.0f} ms, median {summary['p50']:.0f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    eager = sorted({m.split(".")[0] for m in best} & set(LAZY_MODULES))
+    if eager:
+        print(f"Imported at startup but should be lazy: {', '.join(eager)}")
+
+    if args.output:
+        common.write_results(args.output, "import_time", {
+            "params": vars(args), "import_ms": summary, "top_imports": rows, "eager_lazy_modules": eager,
+        })
+
+    if summary["min"] > args.budget_ms or eager:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
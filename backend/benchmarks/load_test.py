@@ -0,0 +1,253 @@
+"""
+Load-test the checkout flow with concurrent virtual users.
+
+Each virtual user logs in as one of the shop's cashiers and then keeps
+picking an action from --mix (weights) until --duration runs out: product
+list, sale create, dashboard poll, sales report export, or a fresh login.
+Latency is recorded per route and reported as p50/p95/p99 with requests
+per second, so results can be compared across commits with --output.
+Requests shed by admission control (429) are counted as "shed", not errors.
+In-process runs also print how many polls shared a coalesced computation.
+
+By default the app runs in-process through httpx's ASGI transport (lifespan
+and background workers included). Pass --base-url to drive a local uvicorn
+instead; start it against the benchmark database so the seeded shop exists:
+
+    cd backend
+    python benchmarks/load_test.py --users 20 --duration 30
+    DB_NAME=pasal_sathi_bench uvicorn server:app --workers 4 &
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000 --users 50
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import common  # noqa: F401  (must come before server)
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+SHOP_ID = "load-test-shop"
+PIN = "1234"
+CASHIERS = 5
+DEFAULT_MIX = "login=2,products=30,sale=25,dashboard=40,report=3"
+
+
+async def seed(args, rng: random.Random):
+    """A shop with cashiers, a catalog and a month of sales history"""
+    db = server.db
+    await db.shop_config.delete_many({"id": SHOP_ID})
+    for name in ("users", "products", "stock_movements"):
+        await db[name].delete_many({"shop_id": SHOP_ID})
+    await server.ensure_sales_storage()
+    await server.sales_collection().delete_many(server.sales_filter({"shop_id": SHOP_ID}))
+
+    pin_hash = server.hash_pin(PIN)
+    await db.shop_config.insert_one(server.ShopConfig(id=SHOP_ID, shop_name_en="Load Test", pin_hash=pin_hash).model_dump())
+    users = [server.User(shop_id=SHOP_ID, name="Owner", pin_hash=pin_hash, role="owner")]
+    users += [server.User(shop_id=SHOP_ID, name=f"Cashier {n}", pin_hash=pin_hash) for n in range(CASHIERS)]
+    await db.users.insert_many([u.model_dump() for u in users])
+
+    products = [server.with_shop(server.Product(
+        name_en=f"Item {i:04d}", category=rng.choice(server.CATEGORIES)["id"],
+        selling_price=rng.randint(20, 2000), quantity=1_000_000,
+    ).model_dump(), SHOP_ID) for i in range(args.products)]
+    await db.products.insert_many(products)
+    await server.bump_catalog_version(SHOP_ID)
+
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    history = []
+    for _ in range(args.history_sales):
+        product = rng.choice(products)
+        item = server.SaleItem(product_id=product["id"], product_name=product["name_en"], quantity=1,
+                               unit_price=product["selling_price"], total=product["selling_price"])
+        history.append(server.to_sales_storage(server.with_shop(server.Sale(
+            items=[item], subtotal=item.total, total=item.total, payment_type="cash",
+            created_at=start + timedelta(seconds=rng.randrange(30 * 86400)),
+        ).model_dump(), SHOP_ID)))
+    if history:
+        await server.sales_collection().insert_many(history)
+    return [u.id for u in users[1:]], [(p["id"], p["name_en"], p["selling_price"]) for p in products]
+
+
+@asynccontextmanager
+async def target(base_url):
+    """An HTTP client for the app, with the database connected for seeding"""
+    if base_url:
+        server.connect_db()
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                yield client
+        finally:
+            server.close_db()
+    else:
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+                yield client
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/health/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("App did not become ready")
+
+
+class VirtualUser:
+    def __init__(self, client, user_id, products, rng, stats):
+        self.client = client
+        self.user_id = user_id
+        self.products = products
+        self.rng = rng
+        self.stats = stats
+        self.headers = {}
+
+    async def request(self, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        elapsed = (time.perf_counter() - started) * 1000
+        entry = self.stats.setdefault(route, {"samples": [], "errors": 0, "shed": 0})
+        entry["samples"].append(elapsed)
+        if response is not None and response.status_code == 429:
+            entry["shed"] += 1
+        elif not ok:
+            entry["errors"] += 1
+        return response if ok else None
+
+    async def login(self):
+        response = await self.request("login", "POST", "/api/auth/login", json={"user_id": self.user_id, "pin": PIN})
+        if response is not None:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def products_list(self):
+        await self.request("products", "GET", "/api/products")
+
+    async def sale(self):
+        items = []
+        for product_id, name, price in self.rng.sample(self.products, self.rng.randint(1, 4)):
+            quantity = self.rng.randint(1, 3)
+            items.append({"product_id": product_id, "product_name": name, "quantity": quantity,
+                          "unit_price": price, "total": price * quantity})
+        total = sum(item["total"] for item in items)
+        await self.request("sale", "POST", "/api/sales", json={
+            "items": items, "subtotal": total, "total": total, "payment_type": self.rng.choice(["cash", "credit"]),
+        })
+
+    async def dashboard(self):
+        await self.request("dashboard", "GET", "/api/dashboard/stats")
+
+    async def report(self):
+        now = datetime.now(timezone.utc)
+        await self.request("report", "GET", "/api/reports/sales/excel", params={
+            "date_from": (now - timedelta(days=7)).isoformat(), "date_to": now.isoformat(),
+        })
+
+    async def run(self, mix, deadline, think_ms):
+        actions = {"login": self.login, "products": self.products_list, "sale": self.sale,
+                   "dashboard": self.dashboard, "report": self.report}
+        names, weights = zip(*mix.items())
+        await self.login()
+        while time.monotonic() < deadline:
+            await actions[self.rng.choices(names, weights)[0]]()
+            if think_ms:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think_ms) / 1000)
+
+
+def coalescing_rows():
+    """Per-route share of coalesced reads that did not run their own computation"""
+    counts = {}
+    for metric in server.COALESCED_REQUESTS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                route = counts.setdefault(sample.labels["route"], {})
+                route[sample.labels["result"]] = sample.value
+    rows = []
+    for route, results in sorted(counts.items()):
+        total = sum(results.values())
+        shared = results.get("joined", 0) + results.get("cached", 0)
+        rows.append({"route": route, "requests": int(total), "computations": int(results.get("leader", 0)),
+                     "coalesced": f"{shared / total:.0%}" if total else "-"})
+    return rows
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"login", "products", "sale", "dashboard", "report"}
+    if unknown:
+        raise SystemExit(f"Unknown actions in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    stats = {}
+    async with target(args.base_url) as client:
+        await wait_ready(client)
+        user_ids, products = await seed(args, rng)
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+        await asyncio.gather(*(
+            VirtualUser(client, user_ids[n % len(user_ids)], products, random.Random(rng.random()), stats)
+            .run(mix, deadline, args.think_ms)
+            for n in range(args.users)
+        ))
+        elapsed = time.monotonic() - started
+
+    rows = []
+    for route, entry in sorted(stats.items()):
+        rows.append({"route": route, **common.percentiles(entry["samples"]),
+                     "rps": len(entry["samples"]) / elapsed, "errors": entry["errors"], "shed": entry["shed"]})
+    total = sum(len(entry["samples"]) for entry in stats.values())
+    rows.append({"route": "all", "n": total, "rps": total / elapsed,
+                 "errors": sum(entry["errors"] for entry in stats.values()),
+                 "shed": sum(entry["shed"] for entry in stats.values())})
+    common.print_table(rows, ["route", "n", "rps", "p50", "p95", "p99", "max", "errors", "shed"])
+    coalescing = [] if args.base_url else coalescing_rows()
+    if coalescing:
+        print()
+        common.print_table(coalescing, ["route", "requests", "computations", "coalesced"])
+
+    if args.output:
+        common.write_results(args.output, "load_test", {
+            "params": vars(args), "elapsed_s": elapsed, "routes": {row["route"]: row for row in rows},
+            "coalescing": coalescing,
+        })
+    if rows[-1]["errors"]:
+        print(f"{rows[-1]['errors']} requests failed")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="action weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--history-sales", type=int, default=3000, help="sales seeded over the last 30 days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this path")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
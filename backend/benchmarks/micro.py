@@ -0,0 +1,178 @@
+"""
+Micro-benchmarks for the hot functions and models in server.py, with a
+stored baseline so regressions show up as numbers.
+
+Covers PIN hashing and checking, token creation and decoding, Product and
+Sale construction and serialisation, scan matching, and the Excel/PDF
+report renderers at each of --sizes rows. No database is needed.
+
+Every benchmark reports the median time per call. With --save the results
+become the baseline (--baseline, default benchmarks/baselines/micro.json);
+otherwise an existing baseline is compared against and the run exits
+non-zero when any median is more than --tolerance slower. Record the
+baseline on the machine that runs the comparison.
+
+    cd backend
+    python benchmarks/micro.py --save
+    python benchmarks/micro.py --sizes 1000,10000 --filter report
+"""
+import argparse
+import importlib
+import json
+import random
+import statistics
+import sys
+import timeit
+from pathlib import Path
+
+import common
+
+import server  # noqa: E402
+from serialization import product_docs, sale_docs  # noqa: E402
+
+DEFAULT_BASELINE = common.BACKEND_DIR / "benchmarks" / "baselines" / "micro.json"
+# Calls are batched until one sample takes at least this long
+SAMPLE_SECONDS = 0.05
+DETECTED_ITEMS = 30
+
+
+def auth_benchmarks(size, rng):
+    pin_hash = server.hash_pin("1234")
+    token = server.create_token("shop", "user")
+    return {
+        "hash_pin": lambda: server.hash_pin("1234"),
+        "verify_pin": lambda: server.verify_pin("1234", pin_hash),
+        "create_token": lambda: server.create_token("shop", "user"),
+        "decode_token": lambda: server.jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM]),
+    }
+
+
+def model_benchmarks(size, rng):
+    products = product_docs(size, rng)
+    sales = sale_docs(size, rng)
+    product_models = [server.Product(**d) for d in products]
+    sale_models = [server.Sale(**d) for d in sales]
+    return {
+        "product_build": lambda: [server.Product(**d) for d in products],
+        "product_dump": lambda: [p.model_dump() for p in product_models],
+        "sale_build": lambda: [server.Sale(**d) for d in sales],
+        "sale_dump": lambda: [s.model_dump() for s in sale_models],
+    }
+
+
+def scan_benchmarks(size, rng):
+    products = product_docs(size, rng)
+    detected = []
+    for n in range(DETECTED_ITEMS):
+        name = rng.choice(products)["name_en"]
+        # A third exact, a third partial names that fall through to the substring scan, a third unknown
+        name = [name, name[:-2], f"Unknown thing {n}"][n % 3]
+        detected.append(server.DetectedItem(name=name, category="other", count=rng.randint(1, 20), confidence="high"))
+    return {"match": lambda: server.match_detected_items(detected, products)}
+
+
+def report_benchmarks(size, rng):
+    products = product_docs(size, rng)
+    sales = sale_docs(size, rng)
+    return {
+        "sales_excel": lambda: server.render_sales_excel(sales),
+        "inventory_excel": lambda: server.render_inventory_excel(products),
+        "sales_pdf": lambda: server.render_sales_pdf(sales, "2024-01-01", "2024-12-31"),
+    }
+
+
+# group -> (builder, whether it scales with --sizes)
+GROUPS = {
+    "auth": (auth_benchmarks, False),
+    "model": (model_benchmarks, True),
+    "scan": (scan_benchmarks, True),
+    "report": (report_benchmarks, True),
+}
+
+
+def measure(fn, min_time: float, min_runs: int, max_time: float):
+    """Milliseconds per call, one sample per batch of calls"""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= SAMPLE_SECONDS or number >= 100_000:
+            break
+        number *= 10
+    samples = [elapsed / number * 1000]
+    total = elapsed
+    while (total < min_time or len(samples) < min_runs) and total < max_time:
+        elapsed = timer.timeit(number)
+        samples.append(elapsed / number * 1000)
+        total += elapsed
+    return samples
+
+
+def load_baseline(path: Path):
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())["results"]["benchmarks"]
+
+
+def run(args):
+    # Report libraries load lazily; keep the import out of the first sample
+    for module in server.WARMUP_MODULES:
+        importlib.import_module(module)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    baseline = None if args.save else load_baseline(Path(args.baseline))
+    results = {}
+    rows = []
+    regressed = []
+    for group, (build, scales) in GROUPS.items():
+        for size in (sizes if scales else [1]):
+            rng = random.Random(42)
+            for name, fn in build(size, rng).items():
+                key = f"{group}.{name}" + (f"@{size}" if scales else "")
+                if args.filter and args.filter not in key:
+                    continue
+                samples = measure(fn, args.min_time, args.min_runs, args.max_time)
+                median = statistics.median(samples)
+                results[key] = {"median_ms": median, "min_ms": min(samples), "runs": len(samples)}
+                row = {"benchmark": key, "median_ms": median, "min_ms": min(samples), "runs": len(samples)}
+                if baseline and key in baseline:
+                    before = baseline[key]["median_ms"]
+                    row["baseline_ms"] = before
+                    row["change"] = f"{(median / before - 1) * 100:+.1f}%"
+                    if median > before * (1 + args.tolerance):
+                        row["change"] += " REGRESSED"
+                        regressed.append(key)
+                rows.append(row)
+                print(f"{key}: {median:.3f} ms", file=sys.stderr)
+
+    common.print_table(rows, ["benchmark", "median_ms", "min_ms", "runs", "baseline_ms", "change"])
+    payload = {"params": vars(args), "benchmarks": results}
+    if args.save:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        common.write_results(args.baseline, "micro", payload)
+    if args.output:
+        common.write_results(args.output, "micro", payload)
+
+    if regressed:
+        print(f"FAIL: {len(regressed)} benchmarks more than {args.tolerance:.0%} slower than the baseline")
+        sys.exit(1)
+    if baseline is None and not args.save:
+        print(f"No baseline at {args.baseline}; run with --save to record one")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="row counts for model, scan and report benchmarks")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds to sample each benchmark for")
+    parser.add_argument("--min-runs", type=int, default=5)
+    parser.add_argument("--max-time", type=float, default=30.0, help="stop sampling a slow benchmark after this")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--output", help="write JSON results to this path")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare the plain sales collection with the time-series one: storage size
+and the speed of the date-range reads the app makes.
+
+Generates the same sales for --shops shops over --days days into both
+collections, then reports collStats sizes and, for randomly chosen shops,
+the time of a 7-day sales list, and 30-day and 365-day per-day
+aggregations through the same helpers the routes use. Needs MongoDB 5.0+.
+
+    cd backend
+    python benchmarks/sales_storage.py --shops 20 --sales 500000 --days 730
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import common  # noqa: F401  (must come before server)
+
+import server  # noqa: E402
+
+MODES = ("plain", "timeseries")
+PAYMENT_TYPES = ["cash", "cash", "cash", "credit"]
+
+
+def generate_sales(shops: int, count: int, days: int, rng: random.Random):
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    users = {n: [f"user-{n}-{u}" for u in range(3)] for n in range(shops)}
+    sales = []
+    for _ in range(count):
+        shop = rng.randrange(shops)
+        items = []
+        for _ in range(rng.randint(1, 4)):
+            price = rng.randint(20, 3000)
+            items.append(server.SaleItem(product_id=f"p{rng.randrange(2000)}", product_name="Steel Plate",
+                                         quantity=1, unit_price=price, total=price))
+        total = sum(item.total for item in items)
+        sales.append(server.with_shop(server.Sale(
+            items=items, subtotal=total, total=total, payment_type=rng.choice(PAYMENT_TYPES),
+            user_id=rng.choice(users[shop]), user_name="Cashier",
+            created_at=start + timedelta(seconds=rng.randrange(days * 86400)),
+        ).model_dump(), f"shop-{shop:03d}"))
+    sales.sort(key=lambda s: s["created_at"])
+    return sales
+
+
+async def load(mode: str, sales, batch_size: int):
+    server.SALES_STORAGE = mode
+    await server.sales_collection().drop()
+    await server.ensure_sales_storage()
+    started = time.perf_counter()
+    for i in range(0, len(sales), batch_size):
+        batch = [server.to_sales_storage(dict(sale)) for sale in sales[i:i + batch_size]]
+        await server.sales_collection().insert_many(batch, ordered=False)
+    return time.perf_counter() - started
+
+
+async def sizes(mode: str):
+    server.SALES_STORAGE = mode
+    stats = await server.db.command("collStats", server.sales_collection().name)
+    return {"data_mb": stats.get("size", 0) / 2 ** 20, "storage_mb": stats.get("storageSize", 0) / 2 ** 20,
+            "index_mb": stats.get("totalIndexSize", 0) / 2 ** 20}
+
+
+async def time_queries(mode: str, shops: int, repeat: int, rng: random.Random):
+    server.SALES_STORAGE = mode
+    now = datetime.now(timezone.utc)
+    queries = {
+        "list_7d": lambda shop: server.find_stored_sales({"shop_id": shop, "created_at": {"$gte": now - timedelta(days=7)}}),
+    }
+    for days in (30, 365):
+        queries[f"daily_{days}d"] = lambda shop, days=days: server.sales_collection().aggregate(server.sales_pipeline(
+            server.daily_sales_pipeline({"shop_id": shop, "created_at": {"$gte": now - timedelta(days=days)}})
+        )).to_list(None)
+    timings = {name: [] for name in queries}
+    for _ in range(repeat):
+        shop = f"shop-{rng.randrange(shops):03d}"
+        for name, query in queries.items():
+            started = time.perf_counter()
+            await query(shop)
+            timings[name].append((time.perf_counter() - started) * 1000)
+    return {name: common.percentiles(samples) for name, samples in timings.items()}
+
+
+async def run(args):
+    server.connect_db()
+    sales = generate_sales(args.shops, args.sales, args.days, random.Random(42))
+    size_rows, query_rows = [], []
+    for mode in MODES:
+        load_s = await load(mode, sales, args.batch_size)
+        size_rows.append({"storage": mode, "sales": len(sales), "load_s": load_s, **await sizes(mode)})
+        for name, summary in (await time_queries(mode, args.shops, args.repeat, random.Random(7))).items():
+            query_rows.append({"storage": mode, "query": name, **summary})
+    server.close_db()
+
+    common.print_table(size_rows, ["storage", "sales", "load_s", "data_mb", "storage_mb", "index_mb"])
+    print()
+    common.print_table(query_rows, ["storage", "query", "n", "p50", "p95", "p99", "max"])
+    if args.output:
+        common.write_results(args.output, "sales_storage", {"params": vars(args), "sizes": size_rows, "queries": query_rows})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shops", type=int, default=20)
+    parser.add_argument("--sales", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=730, help="history the sales are spread over")
+    parser.add_argument("--repeat", type=int, default=30, help="shops sampled per query")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--output", help="write JSON results to this path")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
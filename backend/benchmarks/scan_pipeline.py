@@ -0,0 +1,101 @@
+"""
+Benchmark the AI scan pipeline offline with the stub vision provider.
+
+Measures every stage of run_inventory_scan (decode, preprocess, product load,
+prompt build, provider, parse, match, persist) against a local MongoDB.
+
+    cd backend
+    python benchmarks/scan_pipeline.py --iterations 100 --products 500
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import random
+import time
+
+import common  # noqa: F401  (must come before server)
+
+os.environ['VISION_PROVIDER'] = 'stub'
+
+import server  # noqa: E402
+
+SHOP_ID = "bench-shop"
+STAGES = ["decode", "preprocess", "load_products", "prompt", "provider", "parse", "match", "persist"]
+
+
+def make_photo(width: int, height: int) -> str:
+    """A noisy JPEG is about as hard to compress and resize as a real shelf photo"""
+    from PIL import Image
+
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return base64.b64encode(output.getvalue()).decode()
+
+
+async def seed_products(count: int):
+    rng = random.Random(42)
+    await server.db.products.delete_many({"shop_id": SHOP_ID})
+    docs = []
+    for item in server.STUB_SCAN_ITEMS:
+        docs.append(server.with_shop(server.Product(
+            name_en=item["name"], name_np=item["name_np"], category=item["category"],
+            location=item["location_hint"], selling_price=100, quantity=rng.randint(0, 50)
+        ).model_dump(), SHOP_ID))
+    for i in range(max(0, count - len(docs))):
+        category = rng.choice(server.CATEGORIES)["id"]
+        docs.append(server.with_shop(server.Product(
+            name_en=f"Item {i:05d} {category}", category=category,
+            selling_price=rng.randint(50, 5000), quantity=rng.randint(0, 100)
+        ).model_dump(), SHOP_ID))
+    await server.db.products.insert_many(docs)
+
+
+async def run(args):
+    await server.db.scans.delete_many({"shop_id": SHOP_ID})
+    await seed_products(args.products)
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    photos = [make_photo(width, height) for _ in range(args.distinct_images)]
+
+    samples = {stage: [] for stage in STAGES}
+    totals = []
+    for i in range(args.iterations):
+        timings = {}
+        started = time.perf_counter()
+        await server.run_inventory_scan(SHOP_ID, photos[i % len(photos)], args.mode, timings=timings)
+        totals.append((time.perf_counter() - started) * 1000)
+        for stage in STAGES:
+            samples[stage].append(timings.get(stage, 0.0))
+
+    rows = [{"stage": stage, **common.percentiles(samples[stage])} for stage in STAGES]
+    rows.append({"stage": "total", **common.percentiles(totals)})
+    common.print_table(rows, ["stage", "n", "mean", "p50", "p95", "p99", "max"])
+
+    if args.output:
+        common.write_results(args.output, "scan_pipeline", {
+            "params": vars(args),
+            "stages": {row["stage"]: row for row in rows},
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--mode", choices=["quick", "smart"], default="smart")
+    parser.add_argument("--image-size", default="3000x4000", help="WIDTHxHEIGHT of the generated photo")
+    parser.add_argument("--distinct-images", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated provider latency")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    server.get_vision_provider().latency_ms = args.latency_ms
+    server.connect_db()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark list-route serialization: model-per-document plus FastAPI's
+response_model pass (the old path) against fast_list_response.
+
+No database is needed; documents are generated in memory the way Mongo
+returns them (naive UTC datetimes, no _id).
+
+    cd backend
+    python benchmarks/serialization.py --sizes 1000,10000,100000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import common  # noqa: F401  (must come before server)
+
+import server  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+
+def product_docs(count: int, rng: random.Random):
+    base = datetime(2024, 1, 1)
+    return [server.Product(
+        name_en=f"Item {i:06d}", name_np="चामल", category=rng.choice(server.CATEGORIES)["id"],
+        cost_price=rng.randint(10, 4000), selling_price=rng.randint(20, 5000), quantity=rng.randint(0, 200),
+        created_at=base + timedelta(minutes=i), updated_at=base + timedelta(minutes=i),
+    ).model_dump() for i in range(count)]
+
+
+def sale_docs(count: int, rng: random.Random):
+    base = datetime(2024, 1, 1)
+    docs = []
+    for i in range(count):
+        items = [server.SaleItem(
+            product_id=f"p{rng.randint(0, 999)}", product_name="Wai Wai Noodles", quantity=rng.randint(1, 5),
+            unit_price=25, total=25
+        ) for _ in range(rng.randint(1, 6))]
+        total = sum(item.total for item in items)
+        docs.append(server.Sale(
+            items=items, subtotal=total, total=total, payment_type=rng.choice(["cash", "credit"]),
+            user_id="u1", user_name="Owner", created_at=base + timedelta(minutes=i),
+        ).model_dump())
+    return docs
+
+
+MODELS = {"products": (server.Product, product_docs), "sales": (server.Sale, sale_docs)}
+
+
+async def old_path(model, docs) -> bytes:
+    """What the routes did before: build models, then response_model validates and serialises again"""
+    field = create_response_field(name="Response", type_=List[model])
+    content = await serialize_response(field=field, response_content=[model(**d) for d in docs], is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fast_path(model, docs) -> bytes:
+    return server.fast_list_response(model, docs).body
+
+
+async def measure(fn, model, docs, repeat: int):
+    samples = []
+    body = b""
+    for _ in range(repeat):
+        # Routes get fresh documents from the driver on every request
+        copies = [dict(d) for d in docs]
+        started = time.perf_counter()
+        body = await fn(model, copies)
+        samples.append((time.perf_counter() - started) * 1000)
+    return common.percentiles(samples), len(body)
+
+
+async def run(args):
+    rng = random.Random(42)
+    rows = []
+    for name in args.models.split(","):
+        model, make_docs = MODELS[name]
+        for size in (int(s) for s in args.sizes.split(",")):
+            docs = make_docs(size, rng)
+            repeat = max(1, args.repeat if size < 100000 else args.repeat // 5)
+            old, old_bytes = await measure(old_path, model, docs, repeat)
+            fast, fast_bytes = await measure(fast_path, model, docs, repeat)
+            rows.append({
+                "model": name, "docs": size,
+                "old_p50_ms": old["p50"], "fast_p50_ms": fast["p50"],
+                "speedup": old["p50"] / fast["p50"] if fast["p50"] else None,
+                "old_kb": old_bytes / 1024, "fast_kb": fast_bytes / 1024,
+            })
+
+    common.print_table(rows, ["model", "docs", "old_p50_ms", "fast_p50_ms", "speedup", "old_kb", "fast_kb"])
+    if args.output:
+        common.write_results(args.output, "serialization", {"params": vars(args), "rows": rows})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--models", default="products,sales")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results to this path")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Check that one shop's queries stay as fast with 1,000 shops in the database
+as with one.
+
+Seeds tenants in steps (--steps, cumulative) with the same catalog and sales
+volume each, then times the tenant-scoped routes for randomly chosen shops
+by calling the route functions directly. With shop_id-led indexes every
+query reads only its own shop's index range, so p50 should stay flat as the
+tenant count grows; --max-ratio fails the run when the last step's p50 is
+more than that multiple of the first step's.
+
+    cd backend
+    python benchmarks/tenant_scaling.py --steps 1,10,100,1000 --products 200 --sales 300
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import common  # noqa: F401  (must come before server)
+
+import server  # noqa: E402
+
+SALES_DAYS = 90
+
+
+def shop_id_for(n: int) -> str:
+    return f"tenant-{n:05d}"
+
+
+async def seed_shop(n: int, products: int, sales: int, rng: random.Random):
+    shop_id = shop_id_for(n)
+    await server.db.shop_config.insert_one(
+        server.ShopConfig(id=shop_id, shop_name_en=f"Pasal {n}", pin_hash="", owner_name=f"Owner {n}").model_dump()
+    )
+    product_docs = [server.with_shop(server.Product(
+        name_en=f"Item {i:04d}", category=rng.choice(server.CATEGORIES)["id"],
+        selling_price=rng.randint(20, 5000), quantity=rng.randint(0, 100), low_stock_threshold=10,
+    ).model_dump(), shop_id) for i in range(products)]
+    await server.db.products.insert_many(product_docs, ordered=False)
+
+    start = datetime.now(timezone.utc) - timedelta(days=SALES_DAYS)
+    sale_docs = []
+    for _ in range(sales):
+        product = rng.choice(product_docs)
+        item = server.SaleItem(product_id=product["id"], product_name=product["name_en"], quantity=1,
+                               unit_price=product["selling_price"], total=product["selling_price"])
+        sale_docs.append(server.to_sales_storage(server.with_shop(server.Sale(
+            items=[item], subtotal=item.total, total=item.total, payment_type="cash",
+            created_at=start + timedelta(seconds=rng.randrange(SALES_DAYS * 86400)),
+        ).model_dump(), shop_id)))
+    await server.sales_collection().insert_many(sale_docs, ordered=False)
+
+
+def route_calls(shop_id: str):
+    date_from = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+    return {
+        "products": lambda: server.get_products(shop_id=shop_id),
+        "sales_7d": lambda: server.get_sales(date_from=date_from, shop_id=shop_id),
+        "low_stock": lambda: server.get_low_stock_alerts(shop_id=shop_id),
+        "dashboard": lambda: server.get_dashboard_stats(shop_id=shop_id),
+    }
+
+
+async def measure(tenants: int, samples: int, rng: random.Random):
+    timings = {}
+    for _ in range(samples):
+        for route, call in route_calls(shop_id_for(rng.randrange(tenants))).items():
+            started = time.perf_counter()
+            await call()
+            timings.setdefault(route, []).append((time.perf_counter() - started) * 1000)
+    return {route: common.percentiles(values) for route, values in timings.items()}
+
+
+async def run(args):
+    server.connect_db()
+    for name in ("shop_config", "products"):
+        await server.db[name].drop()
+    await server.sales_collection().drop()
+    await server.ensure_indexes()
+
+    rng = random.Random(42)
+    steps = [int(s) for s in args.steps.split(",")]
+    rows = []
+    seeded = 0
+    for tenants in steps:
+        while seeded < tenants:
+            await seed_shop(seeded, args.products, args.sales, rng)
+            seeded += 1
+        for route, summary in (await measure(tenants, args.samples, rng)).items():
+            rows.append({"tenants": tenants, "route": route, **summary})
+    server.close_db()
+
+    common.print_table(rows, ["tenants", "route", "n", "p50", "p95", "p99", "max"])
+
+    worst = 0.0
+    for route in {row["route"] for row in rows}:
+        first = next(r for r in rows if r["route"] == route and r["tenants"] == steps[0])
+        last = next(r for r in rows if r["route"] == route and r["tenants"] == steps[-1])
+        worst = max(worst, last["p50"] / first["p50"] if first["p50"] else 0.0)
+    print(f"\nWorst p50 growth from {steps[0]} to {steps[-1]} tenants: {worst:.2f}x (limit {args.max_ratio:.2f}x)")
+
+    if args.output:
+        common.write_results(args.output, "tenant_scaling", {"params": vars(args), "rows": rows, "worst_ratio": worst})
+    if worst > args.max_ratio:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", default="1,10,100,1000", help="cumulative tenant counts to measure at")
+    parser.add_argument("--products", type=int, default=200, help="products per shop")
+    parser.add_argument("--sales", type=int, default=300, help="sales per shop over the last 90 days")
+    parser.add_argument("--samples", type=int, default=50, help="shops sampled per step")
+    parser.add_argument("--max-ratio", type=float, default=1.5)
+    parser.add_argument("--output", help="write JSON results to this path")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Copy sales between the plain ``sales`` collection and the time-series
+``sales_ts`` collection, then check that both hold the same sales.
+
+Stop the app (or accept that sales made during the copy stay behind),
+run the copy, then set SALES_STORAGE to the new mode and restart. The
+source collection is kept unless --drop-source is given, and is only
+dropped after the check passes.
+
+    cd backend
+    python migrate_sales_storage.py --to timeseries
+    python migrate_sales_storage.py --to plain --replace
+"""
+import argparse
+import asyncio
+import time
+
+import server
+
+STORAGE_MODES = ("plain", "timeseries")
+
+
+def use_storage(mode: str):
+    server.SALES_STORAGE = mode
+    return server.sales_collection()
+
+
+async def totals(mode: str) -> dict:
+    """shop_id -> (sale count, total) as stored in one mode"""
+    collection = use_storage(mode)
+    rows = await collection.aggregate(server.sales_pipeline([
+        {"$match": {}},
+        {"$group": {"_id": "$shop_id", "count": {"$sum": 1}, "total": {"$sum": "$total"}}},
+    ])).to_list(None)
+    return {row["_id"]: (row["count"], round(row["total"], 2)) for row in rows}
+
+
+async def migrate(args):
+    server.connect_db()
+    db = server.db
+    source_mode = next(mode for mode in STORAGE_MODES if mode != args.to)
+    try:
+        source = use_storage(source_mode)
+        # From here on the server helpers read and write in the target's shape
+        target = use_storage(args.to)
+        if await target.estimated_document_count():
+            if not args.replace:
+                raise SystemExit(f"{target.name} already holds sales; pass --replace to overwrite it")
+            await target.drop()
+        await server.ensure_sales_storage()
+
+        started = time.perf_counter()
+        copied = 0
+        batch = []
+        async for doc in source.find({}).batch_size(args.batch_size):
+            batch.append(server.to_sales_storage(server.from_sales_storage(doc)))
+            if len(batch) >= args.batch_size:
+                await target.insert_many(batch, ordered=False)
+                copied += len(batch)
+                batch = []
+                print(f"  {copied} sales copied", end="\r")
+        if batch:
+            await target.insert_many(batch, ordered=False)
+            copied += len(batch)
+        print(f"Copied {copied} sales from {source.name} to {target.name} in {time.perf_counter() - started:.1f} s")
+
+        before, after = await totals(source_mode), await totals(args.to)
+        mismatched = sorted(shop for shop in set(before) | set(after) if before.get(shop) != after.get(shop))
+        if mismatched:
+            raise SystemExit(f"Counts or totals differ for {len(mismatched)} shops, e.g. {mismatched[:5]}")
+        print(f"Verified {len(after)} shops")
+
+        if args.drop_source:
+            await db.drop_collection(source.name)
+            print(f"Dropped {source.name}")
+        print(f"Set SALES_STORAGE={args.to} and restart the backend")
+    finally:
+        server.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", choices=STORAGE_MODES, required=True, help="storage mode to copy into")
+    parser.add_argument("--replace", action="store_true", help="overwrite sales already in the target collection")
+    parser.add_argument("--drop-source", action="store_true", help="drop the old collection once verified")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    asyncio.run(migrate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
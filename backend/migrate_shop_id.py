@@ -0,0 +1,64 @@
+"""
+Stamp existing data with its shop_id and rebuild indexes for multi-tenant use.
+
+Databases created before data was partitioned by shop hold exactly one shop
+and no shop_id on anything else. This script copies that shop's id onto
+every document still missing one (or holding an empty one), then creates
+the shop_id-led indexes. Re-running it is safe.
+
+    cd backend
+    python migrate_shop_id.py            # the database's only shop
+    python migrate_shop_id.py --shop-id <id>
+"""
+import argparse
+import asyncio
+
+import server
+
+TENANT_COLLECTIONS = [
+    "users", "categories", "locations", "products", "sales", "suppliers", "purchases",
+    "scans", "scan_jobs", "scan_daily_summaries", "stock_movements", "stock_snapshots",
+]
+
+# Users were saved with the model default shop_id "" before data was partitioned by shop
+UNSTAMPED = {"$or": [{"shop_id": {"$exists": False}}, {"shop_id": {"$in": [None, ""]}}]}
+
+
+async def migrate(shop_id, dry_run: bool):
+    server.connect_db()
+    db = server.db
+    try:
+        if shop_id is None:
+            shop_ids = await db.shop_config.distinct("id")
+            if len(shop_ids) != 1:
+                raise SystemExit(f"Found {len(shop_ids)} shops; pass --shop-id to choose one")
+            shop_id = shop_ids[0]
+        elif not await db.shop_config.find_one({"id": shop_id}, {"_id": 1}):
+            raise SystemExit(f"No shop with id {shop_id}")
+
+        print(f"Stamping documents without shop_id with {shop_id}")
+        for name in TENANT_COLLECTIONS:
+            if dry_run:
+                count = await db[name].count_documents(UNSTAMPED)
+            else:
+                count = (await db[name].update_many(UNSTAMPED, {"$set": {"shop_id": shop_id}})).modified_count
+            print(f"  {name}: {count}")
+
+        if not dry_run:
+            print("Building shop_id indexes...")
+            await server.ensure_indexes()
+        print("Done")
+    finally:
+        server.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shop-id", help="shop to assign unstamped documents to (required with several shops)")
+    parser.add_argument("--dry-run", action="store_true", help="only count the documents that would change")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.shop_id, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+Generate a large, realistic shop for scale testing.
+
+Creates (or refills) one shop with the default categories and locations,
+N products with Nepali names, suppliers, purchases and M sales spread over
+several years. Sales follow shop hours in Nepal time, a weekly rhythm with
+busy Saturdays, slow monsoon months, wedding-season bumps and Dashain/Tihar
+peaks (brass and steel sell most around Dhanteras). Everything, ids
+included, is derived from --seed and --end-date, so the same arguments always
+produce the same data. Refilling a shop that already has data needs --drop.
+
+Documents go in as large unordered batches with several inserts in flight,
+and indexes are built once at the end. The stock ledger is not backfilled:
+seeded products start with their current quantity.
+
+    cd backend
+    python seed_data.py --db pasal_sathi_scale --products 3000 --sales 1000000 --years 5
+    python seed_data.py --db pasal_sathi_scale --shop-id <id> --drop --sales 50000
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+# Nepal Standard Time; shop hours and festival days are local
+NPT = timezone(timedelta(hours=5, minutes=45))
+OPEN_HOUR_WEIGHTS = {7: 2, 8: 4, 9: 6, 10: 8, 11: 8, 12: 6, 13: 5, 14: 5, 15: 6, 16: 8, 17: 10, 18: 10, 19: 8, 20: 4}
+# Saturday is the weekly holiday, when families shop
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 1.1, 1.35, 1.05]
+# Monsoon is slow; wedding seasons (Mangsir-Magh, Baisakh-Jestha) are busier
+MONTH_WEIGHTS = {1: 1.1, 2: 1.05, 3: 0.95, 4: 1.0, 5: 1.15, 6: 1.0, 7: 0.8, 8: 0.8, 9: 0.95, 10: 1.0, 11: 1.2, 12: 1.2}
+# Generated history ends the day before this unless --end-date says otherwise
+DEFAULT_END_DATE = date(2026, 1, 1)
+YEARLY_GROWTH = 0.12
+PRICE_INFLATION = 0.06
+
+# Vijaya Dashami and Laxmi Puja follow the lunar calendar; other years use a typical date
+DASHAMI = {2018: date(2018, 10, 19), 2019: date(2019, 10, 8), 2020: date(2020, 10, 26), 2021: date(2021, 10, 15),
+           2022: date(2022, 10, 5), 2023: date(2023, 10, 24), 2024: date(2024, 10, 12), 2025: date(2025, 10, 2),
+           2026: date(2026, 10, 21)}
+LAXMI_PUJA = {2018: date(2018, 11, 7), 2019: date(2019, 10, 27), 2020: date(2020, 11, 14), 2021: date(2021, 11, 4),
+              2022: date(2022, 10, 24), 2023: date(2023, 11, 12), 2024: date(2024, 11, 1), 2025: date(2025, 10, 21),
+              2026: date(2026, 11, 8)}
+
+# (name_en, name_np, price range, locations)
+CATALOG = {
+    "steel": [
+        ("Steel Plate", "स्टिल थाली", (80, 400), ["shelf_top"]),
+        ("Steel Glass", "स्टिल गिलास", (40, 150), ["shelf_top"]),
+        ("Steel Bowl", "स्टिल कचौरा", (50, 250), ["shelf_bottom"]),
+        ("Steel Bucket", "स्टिल बाल्टिन", (500, 2000), ["storage"]),
+        ("Steel Tiffin", "स्टिल टिफिन", (300, 1200), ["shelf_top"]),
+        ("Steel Karahi", "स्टिल कराई", (400, 2500), ["shelf_bottom"]),
+        ("Steel Jug", "स्टिल जग", (300, 900), ["shelf_top"]),
+        ("Steel Spoon Set", "स्टिल चम्चा सेट", (100, 500), ["counter"]),
+    ],
+    "brass": [
+        ("Brass Diya", "पीतल दियो", (100, 800), ["front_display"]),
+        ("Brass Kalash", "पीतल कलश", (500, 4000), ["front_display"]),
+        ("Brass Puja Thali", "पीतल पूजा थाली", (400, 3000), ["front_display"]),
+        ("Brass Bell", "पीतल घण्टी", (200, 1500), ["front_display"]),
+        ("Brass Karuwa", "पीतल करुवा", (800, 5000), ["front_display"]),
+        ("Copper Jug", "तामाको जग", (600, 3000), ["shelf_top"]),
+        ("Incense Stand", "धूपदानी", (80, 500), ["counter"]),
+    ],
+    "plastic": [
+        ("Plastic Bucket", "प्लास्टिक बाल्टिन", (150, 600), ["storage"]),
+        ("Plastic Jug", "प्लास्टिक जग", (80, 300), ["shelf_bottom"]),
+        ("Plastic Chair", "प्लास्टिक कुर्सी", (600, 1500), ["storage"]),
+        ("Water Bottle", "पानी बोतल", (50, 300), ["hanging"]),
+        ("Plastic Basket", "प्लास्टिक टोकरी", (60, 350), ["hanging"]),
+        ("Storage Container", "भाँडा डब्बा", (100, 700), ["shelf_bottom"]),
+        ("Plastic Mug", "प्लास्टिक मग", (30, 120), ["shelf_bottom"]),
+    ],
+    "electric": [
+        ("Electric Kettle", "बिजुली केटली", (1200, 3500), ["counter"]),
+        ("Rice Cooker", "राइस कुकर", (2500, 7000), ["storage"]),
+        ("LED Bulb", "एलईडी बल्ब", (100, 450), ["counter"]),
+        ("Extension Board", "एक्सटेन्सन बोर्ड", (300, 1200), ["counter"]),
+        ("Electric Iron", "इस्त्री", (1200, 3000), ["shelf_top"]),
+        ("Induction Stove", "इन्डक्सन चुलो", (3500, 9000), ["storage"]),
+        ("Table Fan", "टेबल पंखा", (1800, 4500), ["storage"]),
+        ("Decoration Lights", "झिलिमिली बत्ती", (150, 900), ["hanging"]),
+    ],
+    "cleaning": [
+        ("Broom", "कुचो", (80, 250), ["hanging"]),
+        ("Mop", "पोछा", (250, 900), ["hanging"]),
+        ("Toilet Brush", "ट्वाइलेट ब्रस", (100, 300), ["hanging"]),
+        ("Dustpan", "धुलो उठाउने", (60, 200), ["hanging"]),
+        ("Dish Scrubber", "भाँडा माझ्ने", (20, 80), ["counter"]),
+        ("Phenyl", "फिनाइल", (80, 300), ["shelf_bottom"]),
+        ("Washing Powder", "लुगा धुने पाउडर", (60, 400), ["shelf_bottom"]),
+    ],
+    "boxed": [
+        ("Pressure Cooker", "प्रेसर कुकर", (1500, 4500), ["storage"]),
+        ("Dinner Set", "डिनर सेट", (2500, 12000), ["storage"]),
+        ("Gas Stove", "ग्याँस चुलो", (2500, 8000), ["storage"]),
+        ("Thermos Flask", "थर्मस", (600, 2500), ["shelf_top"]),
+        ("Mixer Grinder", "मिक्सर ग्राइन्डर", (3500, 9000), ["storage"]),
+        ("Casserole Set", "क्यासरोल सेट", (1200, 4000), ["storage"]),
+    ],
+    "other": [
+        ("Umbrella", "छाता", (250, 900), ["hanging"]),
+        ("Torch Light", "टर्च लाइट", (150, 800), ["counter"]),
+        ("Padlock", "ताल्चा", (100, 900), ["counter"]),
+        ("Doko Basket", "डोको", (300, 900), ["hanging"]),
+        ("Gundri Mat", "गुन्द्री", (300, 1500), ["storage"]),
+        ("Rope", "डोरी", (50, 300), ["hanging"]),
+    ],
+}
+# Share of everyday sales per category
+CATEGORY_WEIGHTS = {"steel": 25, "brass": 10, "plastic": 22, "electric": 10, "cleaning": 18, "boxed": 7, "other": 8}
+BRANDS = [("Everest", "एभरेष्ट"), ("Himalayan", "हिमालयन"), ("Gorkha", "गोर्खा"), ("Sagarmatha", "सगरमाथा"),
+          ("Janakpur", "जनकपुर"), ("Patan", "पाटन"), ("Local", "स्थानीय")]
+SIZES = [("Small", "सानो"), ("Medium", "मध्यम"), ("Large", "ठूलो")]
+
+SURNAMES = ["Shrestha", "Maharjan", "Tamang", "Gurung", "Rai", "Limbu", "Thapa", "Karki", "Adhikari", "Joshi",
+            "Pradhan", "Tuladhar", "Bajracharya", "Shakya", "Agrawal", "Sharma", "Khadka", "Magar", "Poudel", "KC"]
+FIRST_NAMES = ["Ram", "Sita", "Hari", "Gita", "Krishna", "Laxmi", "Bikash", "Sunita", "Prakash", "Anita", "Suresh",
+               "Kamala", "Rajesh", "Sarita", "Dipak", "Binita", "Santosh", "Puja", "Nabin", "Manisha"]
+SUPPLIER_SUFFIXES = ["Traders", "Suppliers", "Enterprises", "Udhyog", "Distributors", "Wholesale", "Brothers", "Hardware"]
+CITIES = ["Ason, Kathmandu", "Indra Chowk, Kathmandu", "Mangal Bazar, Lalitpur", "Bhaktapur", "Pokhara", "Birgunj",
+          "Biratnagar", "Butwal", "Hetauda", "Dharan", "Nepalgunj"]
+
+
+# Per-shop collections --drop clears; sales live in server.sales_collection() and are cleared separately
+SHOP_COLLECTIONS = [
+    "users", "categories", "locations", "products", "suppliers", "purchases", "sales_archive",
+    "sales_daily_summaries", "sales_rollups", "report_cache", "stock_movements", "stock_snapshots",
+    "scans", "scan_jobs", "scan_daily_summaries",
+]
+
+
+def make_id(rng: random.Random) -> str:
+    """A uuid4-shaped id drawn from the seeded generator"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def phone(rng: random.Random) -> str:
+    return f"98{rng.randrange(10 ** 8):08d}"
+
+
+def festival_days(year: int):
+    """(day, sales multiplier, category boosts) around Dashain and Tihar"""
+    dashami = DASHAMI.get(year, date(year, 10, 15))
+    laxmi_puja = LAXMI_PUJA.get(year, date(year, 11, 5))
+    days = {}
+    # Ghatasthapana to Navami builds up; shops are quiet for a few days after Dashami
+    for offset in range(10):
+        days[dashami - timedelta(days=9 - offset)] = (1.6 + offset * 0.15, {"brass": 2.0, "steel": 1.5})
+    for offset in range(1, 5):
+        days[dashami + timedelta(days=offset)] = (0.5, {})
+    # Dhanteras is for buying metal; Laxmi Puja for lights and diyas
+    days[laxmi_puja - timedelta(days=2)] = (3.5, {"steel": 3.0, "brass": 3.0})
+    days[laxmi_puja - timedelta(days=1)] = (2.2, {"electric": 2.0, "brass": 1.5})
+    days[laxmi_puja] = (2.8, {"electric": 2.5, "brass": 2.0})
+    days[laxmi_puja + timedelta(days=1)] = (1.4, {})
+    days[laxmi_puja + timedelta(days=2)] = (0.7, {})
+    return days
+
+
+def day_plan(start: date, end: date):
+    """Relative sales weight and category boosts for every day in [start, end)"""
+    festivals = {}
+    for year in range(start.year, end.year + 1):
+        festivals.update(festival_days(year))
+    plan = []
+    day = start
+    while day < end:
+        years_in = (day - start).days / 365
+        weight = (1 + YEARLY_GROWTH) ** years_in * WEEKDAY_WEIGHTS[day.weekday()] * MONTH_WEIGHTS[day.month]
+        festival_weight, boosts = festivals.get(day, (1.0, {}))
+        plan.append((day, weight * festival_weight, boosts))
+        day += timedelta(days=1)
+    return plan
+
+
+def spread(total: int, weights, rng: random.Random):
+    """Split ``total`` into integer counts proportional to ``weights``"""
+    scale = total / sum(weights)
+    counts = []
+    for weight in weights:
+        expected = weight * scale
+        counts.append(int(expected) + (rng.random() < expected - int(expected)))
+    return counts
+
+
+def local_time(day: date, rng: random.Random, hours, hour_weights) -> datetime:
+    hour = rng.choices(hours, hour_weights)[0]
+    local = datetime(day.year, day.month, day.day, hour, rng.randrange(60), rng.randrange(60), tzinfo=NPT)
+    return local.astimezone(timezone.utc)
+
+
+def price_then(price: float, day: date, end: date) -> float:
+    """Older sales were cheaper"""
+    return round(price / (1 + PRICE_INFLATION) ** ((end - day).days / 365))
+
+
+class Catalog:
+    """Products grouped by category with a long-tail popularity per product"""
+
+    def __init__(self, products):
+        self.by_category = {}
+        for product in products:
+            self.by_category.setdefault(product["category"], []).append(product)
+        self.popularity = {}
+        for category, items in self.by_category.items():
+            # Zipf-like: a few best sellers, a long tail
+            weights = [1 / (rank + 1) ** 0.9 for rank in range(len(items))]
+            self.popularity[category] = list(itertools.accumulate(weights))
+        self.categories = [c for c in CATEGORY_WEIGHTS if c in self.by_category]
+
+    def pick(self, rng: random.Random, boosts: dict):
+        weights = [CATEGORY_WEIGHTS[c] * boosts.get(c, 1.0) for c in self.categories]
+        category = rng.choices(self.categories, weights)[0]
+        return rng.choices(self.by_category[category], cum_weights=self.popularity[category])[0]
+
+
+def build_products(server, shop_id: str, count: int, suppliers, created_at: datetime, rng: random.Random):
+    bases = [(category, *entry) for category, entries in CATALOG.items() for entry in entries]
+    products = []
+    for n in range(count):
+        category, name_en, name_np, (low, high), locations = bases[n % len(bases)]
+        brand_en, brand_np = BRANDS[(n // len(bases)) % len(BRANDS)]
+        size_en, size_np = SIZES[(n // (len(bases) * len(BRANDS))) % len(SIZES)]
+        series = n // (len(bases) * len(BRANDS) * len(SIZES))
+        suffix = f" {series + 1}" if series else ""
+        price = round(rng.uniform(low, high) / 5) * 5
+        products.append(server.with_shop(server.Product(
+            id=make_id(rng),
+            name_en=f"{brand_en} {name_en} {size_en}{suffix}",
+            name_np=f"{brand_np} {name_np} {size_np}{suffix}",
+            category=category,
+            location=rng.choice(locations),
+            cost_price=round(price * rng.uniform(0.65, 0.85)),
+            selling_price=price,
+            quantity=rng.randint(0, 60),
+            low_stock_threshold=rng.choice([3, 5, 5, 10]),
+            supplier_id=rng.choice(suppliers)["id"],
+            created_at=created_at,
+            updated_at=created_at,
+        ).model_dump(), shop_id))
+    return products
+
+
+def build_suppliers(server, shop_id: str, count: int, created_at: datetime, rng: random.Random):
+    return [server.with_shop(server.Supplier(
+        id=make_id(rng),
+        name=f"{rng.choice(SURNAMES)} {rng.choice(SUPPLIER_SUFFIXES)}",
+        phone=phone(rng),
+        address=rng.choice(CITIES),
+        created_at=created_at,
+    ).model_dump(), shop_id) for _ in range(count)]
+
+
+class BatchWriter:
+    """insert_many in unordered batches, a few in flight while the next one is built"""
+
+    def __init__(self, collection, batch_size: int, concurrency: int):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.slots = asyncio.Semaphore(concurrency)
+        self.pending = set()
+        self.batch = []
+        self.written = 0
+
+    async def add(self, doc: dict):
+        self.batch.append(doc)
+        if len(self.batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        await self.slots.acquire()
+        task = asyncio.create_task(self._insert(batch))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _insert(self, batch):
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        await self.flush()
+        await asyncio.gather(*self.pending)
+
+
+async def seed_purchases(server, writer, shop_id, products, suppliers, plan, end, count, rng):
+    suppliers_by_id = {s["id"]: s for s in suppliers}
+    # Shops stock up in the month before Dashain
+    stock_up = set()
+    for year in range(plan[0][0].year, plan[-1][0].year + 1):
+        ghatasthapana = DASHAMI.get(year, date(year, 10, 15)) - timedelta(days=9)
+        stock_up.update(ghatasthapana - timedelta(days=d) for d in range(1, 31))
+    weights = [weight * (3.0 if day in stock_up else 1.0) for day, weight, _ in plan]
+    for (day, _, _), n in zip(plan, spread(count, weights, rng)):
+        for _ in range(n):
+            product = rng.choice(products)
+            supplier = suppliers_by_id[product["supplier_id"]]
+            quantity = rng.randint(5, 100) if product["selling_price"] < 500 else rng.randint(2, 20)
+            cost = price_then(product["cost_price"], day, end)
+            await writer.add(server.with_shop(server.Purchase(
+                id=make_id(rng),
+                supplier_id=supplier["id"], supplier_name=supplier["name"],
+                product_id=product["id"], product_name=product["name_en"],
+                quantity=quantity, cost_per_unit=cost, total_cost=cost * quantity,
+                created_at=local_time(day, rng, [9, 10, 11, 12, 13, 14], [1, 2, 2, 2, 1, 1]),
+            ).model_dump(), shop_id))
+
+
+async def seed_sales(server, writer, shop_id, catalog, users, plan, end, count, rng):
+    hours, hour_weights = list(OPEN_HOUR_WEIGHTS), list(OPEN_HOUR_WEIGHTS.values())
+    for (day, _, boosts), n in zip(plan, spread(count, [w for _, w, _ in plan], rng)):
+        # A day's sales go in time order, like the real collection
+        times = sorted(local_time(day, rng, hours, hour_weights) for _ in range(n))
+        for created_at in times:
+            items = []
+            for _ in range(rng.choices([1, 2, 3, 4, 5], [50, 25, 13, 7, 5])[0]):
+                product = catalog.pick(rng, boosts)
+                price = price_then(product["selling_price"], day, end)
+                quantity = rng.randint(1, 6) if price < 200 else 1
+                items.append(server.SaleItem(product_id=product["id"], product_name=product["name_en"],
+                                             quantity=quantity, unit_price=price, total=price * quantity))
+            subtotal = sum(item.total for item in items)
+            # Round the bill down to the nearest 10 now and then
+            discount = subtotal % 10 if rng.random() < 0.15 else 0
+            credit = rng.random() < 0.2
+            user = rng.choice(users)
+            await writer.add(server.to_sales_storage(server.with_shop(server.Sale(
+                id=make_id(rng), items=items, subtotal=subtotal, discount=discount, total=subtotal - discount,
+                payment_type="credit" if credit else "cash",
+                customer_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}" if credit else None,
+                customer_phone=phone(rng) if credit else None,
+                user_id=user["id"], user_name=user["name"], created_at=created_at,
+            ).model_dump(), shop_id)))
+
+
+async def seed(args):
+    import server
+
+    server.connect_db()
+    db = server.db
+    rng = random.Random(args.seed)
+    end = args.end_date
+    start = end - timedelta(days=round(args.years * 365))
+    opened_at = datetime(start.year, start.month, start.day, 9, tzinfo=NPT).astimezone(timezone.utc)
+    shop_id = args.shop_id or make_id(rng)
+
+    try:
+        if args.drop:
+            # Everything seeded here plus everything derived from it, so nothing old mixes with the new ids
+            for name in SHOP_COLLECTIONS:
+                await db[name].delete_many({"shop_id": shop_id})
+            await server.sales_collection().delete_many(server.sales_filter({"shop_id": shop_id}))
+            await db.low_stock_state.delete_one({"_id": shop_id})
+            await db.shop_config.delete_many({"id": shop_id})
+        else:
+            # Ids come from --seed, so a second run would collide with the first one's documents
+            for collection, query in [(db.products, {"shop_id": shop_id}), (db.suppliers, {"shop_id": shop_id}),
+                                      (db.purchases, {"shop_id": shop_id}), (db.sales_archive, {"shop_id": shop_id}),
+                                      (server.sales_collection(), server.sales_filter({"shop_id": shop_id}))]:
+                if await collection.find_one(query, {"_id": 1}):
+                    raise SystemExit(f"Shop {shop_id} already has {collection.name}; rerun with --drop to replace its data")
+
+        if not await db.shop_config.find_one({"id": shop_id}, {"_id": 1}):
+            pin_hash = server.hash_pin(args.pin)
+            await db.shop_config.insert_one(server.ShopConfig(
+                id=shop_id, shop_name="नमुना भाँडा पसल", shop_name_en="Sample Bhanda Pasal", pin_hash=pin_hash,
+                owner_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}", phone=phone(rng),
+                address=rng.choice(CITIES), created_at=opened_at, updated_at=opened_at,
+            ).model_dump())
+            users = [server.User(id=make_id(rng), shop_id=shop_id, name=f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}",
+                                 pin_hash=pin_hash, role=role, created_at=opened_at).model_dump()
+                     for role in ["owner", "cashier", "cashier"]]
+            await db.users.insert_many(users)
+            print(f"Created shop {shop_id} (PIN {args.pin})")
+        if not await db.categories.find_one({"shop_id": shop_id}, {"_id": 1}):
+            await db.categories.insert_many(server.get_default_categories(shop_id))
+            await db.locations.insert_many(server.get_default_locations(shop_id))
+        users = await db.users.find({"shop_id": shop_id, "is_active": True}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+
+        phase_started = time.perf_counter()
+        suppliers = build_suppliers(server, shop_id, args.suppliers, opened_at, random.Random(f"{args.seed}-suppliers"))
+        products = build_products(server, shop_id, args.products, suppliers, opened_at,
+                                  random.Random(f"{args.seed}-products"))
+        await db.suppliers.insert_many(suppliers, ordered=False)
+        await db.products.insert_many(products, ordered=False)
+        print(f"{len(suppliers)} suppliers, {len(products)} products in {time.perf_counter() - phase_started:.1f} s")
+
+        # Sales go wherever SALES_STORAGE keeps them; a time-series collection must exist first
+        await server.ensure_sales_storage()
+        plan = day_plan(start, end)
+        for collection, count, fill in [
+            (db.purchases, args.purchases,
+             lambda w: seed_purchases(server, w, shop_id, products, suppliers, plan, end, args.purchases,
+                                      random.Random(f"{args.seed}-purchases"))),
+            (server.sales_collection(), args.sales,
+             lambda w: seed_sales(server, w, shop_id, Catalog(products), users, plan, end, args.sales,
+                                  random.Random(f"{args.seed}-sales"))),
+        ]:
+            if count <= 0:
+                continue
+            phase_started = time.perf_counter()
+            writer = BatchWriter(collection, args.batch_size, args.concurrency)
+            await fill(writer)
+            await writer.close()
+            elapsed = time.perf_counter() - phase_started
+            print(f"{writer.written} {collection.name} in {elapsed:.1f} s ({writer.written / elapsed:,.0f}/s)")
+
+        # Clients holding a catalog snapshot from before this run refetch it
+        await server.bump_catalog_version(shop_id)
+
+        phase_started = time.perf_counter()
+        await server.ensure_indexes()
+        print(f"Indexes ready in {time.perf_counter() - phase_started:.1f} s")
+        print(f"Shop {shop_id}: {start} to {end}")
+    finally:
+        server.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="database to fill (defaults to DB_NAME)")
+    parser.add_argument("--shop-id", help="fill this shop instead of creating one")
+    parser.add_argument("--drop", action="store_true", help="delete the shop's existing data first")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--suppliers", type=int, default=40)
+    parser.add_argument("--purchases", type=int, default=20000)
+    parser.add_argument("--sales", type=int, default=200000)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=DEFAULT_END_DATE,
+                        help=f"history runs up to the day before this (default {DEFAULT_END_DATE})")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pin", default="1234", help="PIN for the created owner and cashiers")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert batches in flight")
+    args = parser.parse_args()
+    if args.db:
+        os.environ['DB_NAME'] = args.db
+    asyncio.run(seed(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,416 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
 import os
+import asyncio
+import base64
+import binascii
+import hashlib
+import itertools
+import json
 import logging
+import math
+import orjson
+import random
+import re
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from bson import ObjectId, json_util
+from prometheus_client import Counter, Gauge, Histogram
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+from pydantic_core import PydanticUndefined
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 from jose import JWTError, jwt
 import bcrypt
+import importlib
 import io
-from openpyxl import Workbook
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
+
+try:
+    import brotli
+except ImportError:  # optional; responses fall back to gzip
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+DB_NAME = os.environ['DB_NAME']
+
+# Connection pool, compression and timeouts; the hosted cluster is far from the app server
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '5'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000'))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
+MONGO_ZLIB_LEVEL = int(os.environ.get('MONGO_ZLIB_LEVEL', '-1'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '0'))  # 0 = no timeout
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters per server, fed by pymongo's pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.servers = {}
+
+    def _stats(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self.servers:
+            self.servers[key] = {
+                "open": 0, "checked_out": 0, "created": 0, "closed": 0,
+                "checkouts": 0, "checkout_failures": 0, "cleared": 0
+            }
+        return self.servers[key]
+
+    def _bump(self, address, **changes):
+        with self._lock:
+            stats = self._stats(address)
+            for name, change in changes.items():
+                stats[name] += change
+
+    def pool_created(self, event):
+        self._bump(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._bump(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._bump(event.address, created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(event.address, closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._bump(event.address, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._bump(event.address, checkouts=1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._bump(event.address, checked_out=-1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {address: dict(stats) for address, stats in self.servers.items()}
+
+pool_monitor = PoolMonitor()
+
+# ============ METRICS ============
+
+# Latency buckets (seconds) sized for a small API talking to a remote database
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ["method"])
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ["collection", "command"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter("mongo_command_failures_total", "MongoDB commands that failed", ["collection", "command"])
+CACHE_EVENTS = Counter("cache_events_total", "In-process cache lookups", ["cache", "result"])
+SCANS = Counter("scans_total", "AI inventory scans", ["mode", "provider", "status"])
+SCAN_DURATION = Histogram("scan_duration_seconds", "End-to-end AI scan time", ["provider"], buckets=LATENCY_BUCKETS)
+SCAN_PROMPT_TOKENS = Histogram(
+    "scan_prompt_tokens", "Estimated prompt tokens per scan", ["mode"],
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 5000, 10000)
+)
+REPORT_RENDERS = Counter("report_renders_total", "Rendered report downloads", ["report", "format"])
+REPORT_RENDER_DURATION = Histogram(
+    "report_render_duration_seconds", "Report query and render time", ["report", "format"], buckets=LATENCY_BUCKETS
+)
+
+@contextmanager
+def track_report_render(report: str, fmt: str):
+    started = time.perf_counter()
+    yield
+    REPORT_RENDERS.labels(report, fmt).inc()
+    REPORT_RENDER_DURATION.labels(report, fmt).observe(time.perf_counter() - started)
+
+# ============ SLOW QUERY LOG ============
+
+# Commands slower than this are recorded (0 turns the log off)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+# Fraction of slow commands re-run with explain("executionStats")
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', '200'))
+
+# Commands explain can wrap; explain never applies the writes of update/delete/findAndModify
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Only the query shape is kept, so inserted documents and update payloads (PIN hashes) never reach the log
+SLOW_QUERY_SHAPE_FIELDS = ("filter", "query", "sort", "projection", "fields", "pipeline", "key", "hint", "limit", "skip")
+
+# ASGI scope of the request being served; motor copies the context into its executor threads,
+# so command listeners can see which route issued a query
+request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+def current_route() -> str:
+    scope = request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', None) or scope['path']}"
+
+def _truncate(value, max_items: int = 5):
+    """Keep long $in lists and pipelines readable"""
+    if isinstance(value, dict):
+        return {k: _truncate(v, max_items) for k, v in value.items()}
+    if isinstance(value, list):
+        head = [_truncate(v, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            head.append(f"... (+{len(value) - max_items})")
+        return head
+    return value
+
+def command_shape(command_name: str, command: dict) -> dict:
+    shape = {k: command[k] for k in SLOW_QUERY_SHAPE_FIELDS if k in command}
+    if command_name == "update":
+        shape["updates"] = [{"q": u.get("q"), "multi": u.get("multi", False)} for u in command.get("updates", [])]
+    elif command_name == "delete":
+        shape["deletes"] = [{"q": d.get("q")} for d in command.get("deletes", [])]
+    # Relaxed extended JSON turns dates and other BSON types into plain JSON
+    return _truncate(json.loads(json_util.dumps(shape)))
+
+def summarize_explain(result: dict) -> dict:
+    """Winning plan stages and the counters that show a collection scan"""
+    planner = result.get("queryPlanner") or {}
+    stats = result.get("executionStats") or {}
+    # aggregate puts the query stage under the first pipeline stage
+    if not planner and result.get("stages"):
+        cursor = result["stages"][0].get("$cursor", {})
+        planner = cursor.get("queryPlanner") or {}
+        stats = cursor.get("executionStats") or {}
+    plan = planner.get("winningPlan") or {}
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        plan = plan.get("inputStage") or next(iter(plan.get("inputStages") or []), None)
+    stages = [stage for stage in stages if stage]
+    return {
+        "plan": " <- ".join(stages),
+        "collection_scan": "COLLSCAN" in stages,
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+class SlowQueryLog:
+    """Ring buffer of slow commands, fed from the command listener's threads"""
+
+    def __init__(self, size: int):
+        self.entries = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._explain_queue: Optional[asyncio.Queue] = None
+
+    def attach(self, loop: Optional[asyncio.AbstractEventLoop], queue: Optional[asyncio.Queue]):
+        self._loop = loop
+        self._explain_queue = queue
+
+    def record(self, event, command: dict, route: str):
+        entry = {
+            "id": next(self._ids),
+            "at": datetime.now(timezone.utc),
+            "database": event.database_name,
+            "collection": CommandMonitor.collection_of(event.command_name, command),
+            "command": event.command_name,
+            "duration_ms": round(event.duration_micros / 1000, 2),
+            "route": route,
+            "shape": command_shape(event.command_name, command),
+            "explain": None,
+        }
+        self.entries.append(entry)
+        logger.warning(
+            f"Slow {entry['command']} on {entry['collection']} ({entry['duration_ms']} ms) from {route}: {entry['shape']}"
+        )
+        if (self._loop is not None and event.command_name in EXPLAINABLE_COMMANDS
+                and random.random() < SLOW_QUERY_EXPLAIN_RATE):
+            entry["explain"] = {"status": "pending"}
+            # Session and cluster-time fields belong to the original request, not to the explain
+            plain = {k: v for k, v in command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber")}
+            self._loop.call_soon_threadsafe(self._enqueue, entry, plain)
+
+    def _enqueue(self, entry: dict, command: dict):
+        try:
+            self._explain_queue.put_nowait((entry, command))
+        except asyncio.QueueFull:
+            entry["explain"] = {"status": "skipped"}
+
+    def recent(self, limit: int) -> List[dict]:
+        return list(self.entries)[-limit:][::-1]
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_BUFFER_SIZE)
+
+class CommandMonitor(monitoring.CommandListener):
+    """Times every MongoDB command, labelled by collection and command name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+
+    @staticmethod
+    def collection_of(command_name: str, command: dict) -> str:
+        target = command.get(command_name)
+        if isinstance(target, str):
+            return target
+        # getMore carries the cursor id in its first field
+        return command.get("collection", "") or ""
+
+    def started(self, event):
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (event.command, current_route())
+
+    def _finish(self, event):
+        with self._lock:
+            return self._started.pop((event.connection_id, event.request_id), ({}, "background"))
+
+    def _observe(self, event) -> str:
+        command, route = self._finish(event)
+        collection = self.collection_of(event.command_name, command)
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        # Explains issued by the slow-query log are slow by design
+        if SLOW_QUERY_MS and event.command_name != "explain" and event.duration_micros >= SLOW_QUERY_MS * 1000:
+            try:
+                slow_query_log.record(event, command, route)
+            except Exception as e:
+                logger.error(f"Slow query log failed: {e}")
+        return collection
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        collection = self._observe(event)
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+
+command_monitor = CommandMonitor()
+
+class MetricsMiddleware:
+    """Records latency per matched route template (never the raw path) and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_scope.reset(token)
+            in_flight.dec()
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(method, path, str(status)).observe(time.perf_counter() - started)
+
+def available_compressors(requested: str) -> List[str]:
+    """Drop compressors whose Python module is missing instead of letting pymongo warn"""
+    optional_modules = {"zstd": "zstandard", "snappy": "snappy"}
+    compressors = []
+    for name in (c.strip() for c in requested.split(',')):
+        if not name:
+            continue
+        module = optional_modules.get(name)
+        if module:
+            try:
+                __import__(module)
+            except ImportError:
+                continue
+        compressors.append(name)
+    return compressors
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "appname": "pasal-sathi",
+        "event_listeners": [pool_monitor, command_monitor],
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    compressors = available_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+        options["zlibCompressionLevel"] = MONGO_ZLIB_LEVEL
+    return AsyncIOMotorClient(mongo_url, **options)
+
+# Created by connect_db() when the app starts (scripts call it directly)
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def connect_db():
+    global client, db
+    client = create_mongo_client()
+    db = client[DB_NAME]
+
+def close_db():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_db()
+    await start_background_workers()
+    try:
+        yield
+    finally:
+        await stop_background_workers()
+        close_db()
 
 # JWT Settings
 SECRET_KEY = os.environ.get('JWT_SECRET', 'pasal-sathi-secret-key-nepal-2024')
@@ -37,7 +421,7 @@ ACCESS_TOKEN_EXPIRE_DAYS = 30
 security = HTTPBearer(auto_error=False)
 
 # Create the main app
-app = FastAPI(title="Pasal Sathi API", version="1.0.0")
+app = FastAPI(title="Pasal Sathi API", version="1.0.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ============ MODELS ============
@@ -55,6 +439,7 @@ class ShopConfig(BaseModel):
 
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    shop_id: str = ""
     name: str
     pin_hash: str
     role: str = "cashier"  # owner, manager, cashier
@@ -119,8 +504,8 @@ class LocationCreate(BaseModel):
     name_np: str
 
 # Default Product Categories
-def get_default_categories():
-    return [
+def get_default_categories(shop_id: str):
+    return [{**category, "shop_id": shop_id} for category in [
     {"id": "steel", "name_en": "Steel Utensils", "name_np": "स्टिल भाँडा", "icon": "pot-steaming", "color": "#6B7280", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "brass", "name_en": "Brass & Religious", "name_np": "पीतल/पूजा सामान", "icon": "lamp", "color": "#D4AF37", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "plastic", "name_en": "Plastic Items", "name_np": "प्लास्टिक सामान", "icon": "cup-soda", "color": "#3B82F6", "is_active": True, "created_at": datetime.now(timezone.utc)},
@@ -128,7 +513,7 @@ def get_default_categories():
     {"id": "cleaning", "name_en": "Cleaning Tools", "name_np": "सफाई सामान", "icon": "brush", "color": "#10B981", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "boxed", "name_en": "Boxed Items", "name_np": "बक्स सामान", "icon": "package", "color": "#8B5CF6", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "other", "name_en": "Other Items", "name_np": "अन्य सामान", "icon": "grid-3x3", "color": "#6B7280", "is_active": True, "created_at": datetime.now(timezone.utc)}
-]
+]]
 
 # Kept for backward compatibility
 CATEGORIES = [
@@ -142,15 +527,15 @@ CATEGORIES = [
 ]
 
 # Default Locations
-def get_default_locations():
-    return [
+def get_default_locations(shop_id: str):
+    return [{**location, "shop_id": shop_id} for location in [
     {"id": "hanging", "name_en": "Hanging", "name_np": "झुण्डिएको", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "shelf_top", "name_en": "Top Shelf", "name_np": "माथि शेल्फ", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "shelf_bottom", "name_en": "Bottom Shelf", "name_np": "तल शेल्फ", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "front_display", "name_en": "Front Display", "name_np": "अगाडि राखेको", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "storage", "name_en": "Storage Room", "name_np": "गोदाम", "is_active": True, "created_at": datetime.now(timezone.utc)},
     {"id": "counter", "name_en": "Counter", "name_np": "काउन्टर", "is_active": True, "created_at": datetime.now(timezone.utc)}
-]
+]]
 
 # Kept for backward compatibility
 LOCATIONS = [
@@ -264,10 +649,41 @@ class Purchase(BaseModel):
 class PurchaseCreate(BaseModel):
     supplier_id: str
     product_id: str
-    quantity: int
-    cost_per_unit: float
+    quantity: int = Field(gt=0)
+    cost_per_unit: float = Field(ge=0)
     notes: Optional[str] = ""
 
+# Far more than any one delivery note; keeps a single request's bulk write bounded
+PURCHASE_BATCH_MAX_LINES = 500
+
+class PurchaseBatchCreate(BaseModel):
+    lines: List[PurchaseCreate] = Field(max_length=PURCHASE_BATCH_MAX_LINES)
+
+# ============ FAST LIST RESPONSES ============
+
+# List routes return documents we wrote ourselves through these models, so they skip
+# building a model per document and FastAPI's second validation pass on response_model.
+
+@lru_cache(maxsize=None)
+def model_projection(model: type) -> dict:
+    """Only the model's fields, so extra keys on stored documents never leak out"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+@lru_cache(maxsize=None)
+def model_defaults(model: type) -> dict:
+    """Static defaults, filled in for documents written before a field existed"""
+    return {
+        name: field.default for name, field in model.model_fields.items()
+        if field.default is not PydanticUndefined
+    }
+
+def fast_list_response(model: type, docs: List[dict]) -> ORJSONResponse:
+    defaults = model_defaults(model)
+    if defaults:
+        docs = [{**defaults, **doc} for doc in docs]
+    # orjson encodes datetimes as ISO 8601 itself
+    return ORJSONResponse(docs)
+
 # ============ AUTH HELPERS ============
 
 def hash_pin(pin: str) -> str:
@@ -276,6 +692,10 @@ def hash_pin(pin: str) -> str:
 def verify_pin(pin: str, hashed: str) -> bool:
     return bcrypt.checkpw(pin.encode(), hashed.encode())
 
+def with_shop(doc: dict, shop_id: str) -> dict:
+    """Stamp a document with its tenant before it is written"""
+    return {**doc, "shop_id": shop_id}
+
 def create_token(shop_id: str, user_id: str) -> str:
     expire = datetime.now(timezone.utc) + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     to_encode = {"sub": shop_id, "user_id": user_id, "exp": expire}
@@ -301,27 +721,244 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id, "is_active": True}, {"_id": 0})
-        if not user:
+        user = await user_cache.get(user_id)
+        # A token only works for the shop it was issued for
+        if not user or user.get("shop_id") != payload.get("sub"):
             raise HTTPException(status_code=401, detail="User not found")
         return User(**user)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ============ CATALOG CACHE ============
+
+# Categories, locations and the shop config change rarely but are read on almost every screen
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '60'))
+
+# Users are re-read at most this often per process when the invalidation bus is down
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+
+class CatalogCache:
+    """Per-process TTL cache around one loader, keyed by shop (or user); writers publish_invalidation()"""
+
+    def __init__(self, name: str, loader, ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS):
+        self.name = name
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        # key -> (value, loaded_at); unkeyed caches use the key None
+        self._entries = {}
+        # Bumped by invalidate(); a load that raced with a write is not kept as fresh
+        self._generation = 0
+        self._locks = {}
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl_seconds:
+            CACHE_EVENTS.labels(self.name, "hit").inc()
+            return True, entry[0]
+        return False, None
+
+    async def get(self, key=None):
+        found, value = self._lookup(key)
+        if found:
+            return value
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            found, value = self._lookup(key)
+            if found:
+                return value
+            CACHE_EVENTS.labels(self.name, "miss").inc()
+            generation = self._generation
+            value = await (self.loader() if key is None else self.loader(key))
+            if generation == self._generation:
+                self._entries[key] = (value, time.monotonic())
+            return value
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything when key is None"""
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+async def load_categories(shop_id: str) -> List[dict]:
+    query = {"shop_id": shop_id, "is_active": True}
+    categories = await db.categories.find(query, model_projection(Category)).sort("name_en", 1).to_list(100)
+    # Auto-initialize if empty
+    if not categories:
+        await db.categories.insert_many(get_default_categories(shop_id))
+        categories = await db.categories.find(query, model_projection(Category)).sort("name_en", 1).to_list(100)
+    return categories
+
+async def load_locations(shop_id: str) -> List[dict]:
+    query = {"shop_id": shop_id, "is_active": True}
+    locations = await db.locations.find(query, model_projection(Location)).sort("name_en", 1).to_list(100)
+    # Auto-initialize if empty
+    if not locations:
+        await db.locations.insert_many(get_default_locations(shop_id))
+        locations = await db.locations.find(query, model_projection(Location)).sort("name_en", 1).to_list(100)
+    return locations
+
+async def load_shop_config(shop_id: str) -> Optional[dict]:
+    return await db.shop_config.find_one({"id": shop_id}, {"_id": 0})
+
+async def load_active_user(user_id: str) -> Optional[dict]:
+    return await db.users.find_one({"id": user_id, "is_active": True}, {"_id": 0})
+
+category_cache = CatalogCache("categories", load_categories)
+location_cache = CatalogCache("locations", load_locations)
+shop_config_cache = CatalogCache("shop_config", load_shop_config)
+CATALOG_CACHES = [category_cache, location_cache, shop_config_cache]
+user_cache = CatalogCache("users", load_active_user, ttl_seconds=USER_CACHE_TTL_SECONDS)
+CACHES = {cache.name: cache for cache in CATALOG_CACHES + [user_cache]}
+
+# ============ CACHE INVALIDATION BUS ============
+
+# With several uvicorn workers each process has its own caches. Writers append to a small capped
+# collection that every process tails; the cache TTLs still bound staleness if the bus is down.
+PROCESS_ID = uuid.uuid4().hex
+INVALIDATION_CAP_BYTES = int(os.environ.get('INVALIDATION_CAP_BYTES', str(1024 * 1024)))
+INVALIDATION_CAP_DOCS = int(os.environ.get('INVALIDATION_CAP_DOCS', '1000'))
+INVALIDATION_RETRY_SECONDS = float(os.environ.get('INVALIDATION_RETRY_SECONDS', '2'))
+# Messages this old are replayed after (re)connecting, covering clock skew between app servers
+INVALIDATION_REPLAY_SECONDS = 30
+
+INVALIDATIONS = Counter("cache_invalidations_total", "Cache invalidations by topic", ["topic", "source"])
+invalidation_state = {"connected": False, "received": 0, "published": 0, "last_error": None}
+
+def apply_invalidation(topic: str, key=None):
+    cache = CACHES.get(topic)
+    if cache is not None:
+        cache.invalidate(key)
+
+async def publish_invalidation(topic: str, key=None):
+    """Invalidate locally right away, then tell the other processes"""
+    apply_invalidation(topic, key)
+    INVALIDATIONS.labels(topic, "local").inc()
+    try:
+        await db.invalidations.insert_one({
+            "topic": topic, "key": key, "origin": PROCESS_ID, "at": datetime.now(timezone.utc)
+        })
+        invalidation_state["published"] += 1
+    except Exception as e:
+        # Other processes catch up when their TTL expires
+        logger.warning(f"Could not publish invalidation for {topic}: {e}")
+
+async def ensure_invalidation_collection():
+    try:
+        await db.create_collection("invalidations", capped=True, size=INVALIDATION_CAP_BYTES, max=INVALIDATION_CAP_DOCS)
+    except CollectionInvalid:
+        pass
+    # A tailable cursor on an empty capped collection dies immediately
+    if await db.invalidations.estimated_document_count() == 0:
+        await db.invalidations.insert_one({"topic": "_seed", "key": None, "origin": PROCESS_ID, "at": datetime.now(timezone.utc)})
+
+async def invalidation_listener():
+    # Caches filled since this moment are covered by the replay window
+    listening_until = time.monotonic()
+    while True:
+        try:
+            await ensure_invalidation_collection()
+            since = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=INVALIDATION_REPLAY_SECONDS))
+            # Messages from a longer outage are gone from the replay window; anything may have changed
+            if time.monotonic() - listening_until >= INVALIDATION_REPLAY_SECONDS - 1:
+                for cache in CACHES.values():
+                    cache.invalidate()
+            cursor = db.invalidations.find({"_id": {"$gt": since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+            invalidation_state.update(connected=True, last_error=None)
+            while cursor.alive:
+                async for message in cursor:
+                    if message.get("origin") == PROCESS_ID or message.get("topic") == "_seed":
+                        continue
+                    apply_invalidation(message["topic"], message.get("key"))
+                    INVALIDATIONS.labels(message["topic"], "remote").inc()
+                    invalidation_state["received"] += 1
+                listening_until = time.monotonic()
+            invalidation_state["connected"] = False
+        except asyncio.CancelledError:
+            invalidation_state["connected"] = False
+            raise
+        except Exception as e:
+            invalidation_state.update(connected=False, last_error=str(e))
+            logger.warning(f"Invalidation listener lost its cursor: {e}")
+        await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
+# ============ REQUEST COALESCING ============
+
+# Several tablets in a shop poll the same summaries at the same moment. Identical concurrent reads
+# (same route, tenant and query) share one computation; with a micro-TTL above 0 the result is also
+# reused for that long, which bounds how stale a poll can be.
+COALESCE_TTL_SECONDS = float(os.environ.get('COALESCE_TTL_SECONDS', '0'))
+# Results kept per route before expired ones are dropped
+COALESCE_MAX_RESULTS = 1000
+
+# The coalescing ratio is (joined + cached) / all
+COALESCED_REQUESTS = Counter("coalesced_requests_total", "Coalesced reads by route and role", ["route", "result"])
+
+class SingleFlight:
+    """Runs one computation per key at a time; callers arriving meanwhile await the same result"""
+
+    def __init__(self, route: str, ttl_seconds: float = COALESCE_TTL_SECONDS):
+        self.route = route
+        self.ttl_seconds = ttl_seconds
+        self._in_flight = {}
+        # key -> (value, expires_at)
+        self._results = {}
+
+    async def run(self, key, compute):
+        entry = self._results.get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            COALESCED_REQUESTS.labels(self.route, "cached").inc()
+            return entry[0]
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            self._in_flight[key] = task
+            COALESCED_REQUESTS.labels(self.route, "leader").inc()
+        else:
+            COALESCED_REQUESTS.labels(self.route, "joined").inc()
+        # A caller that disconnects must not cancel the computation the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        try:
+            value = await compute()
+            if self.ttl_seconds > 0:
+                now = time.monotonic()
+                if len(self._results) >= COALESCE_MAX_RESULTS:
+                    self._results = {k: v for k, v in self._results.items() if v[1] > now}
+                self._results[key] = (value, now + self.ttl_seconds)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
 # ============ AUTH ROUTES ============
 
+# When false (a single-shop install), /auth/setup only works once; when true, every setup creates a new shop
+MULTI_TENANT = os.environ.get('MULTI_TENANT', 'false').lower() == 'true'
+
+async def resolve_shop_id(shop_id: Optional[str]) -> Optional[str]:
+    """Shop for unauthenticated routes: the shop_id parameter, or the only shop of a single-shop install"""
+    if shop_id:
+        return shop_id
+    configs = await db.shop_config.find({}, {"_id": 0, "id": 1}).limit(2).to_list(2)
+    if len(configs) > 1:
+        raise HTTPException(status_code=400, detail="shop_id is required")
+    return configs[0]["id"] if configs else None
+
 @api_router.get("/auth/check")
-async def check_setup():
+async def check_setup(shop_id: Optional[str] = None):
     """Check if shop is already set up"""
-    config = await db.shop_config.find_one({}, {"_id": 0})
+    shop_id = await resolve_shop_id(shop_id)
+    config = await shop_config_cache.get(shop_id) if shop_id else None
     return {"is_setup": config is not None, "shop_name": config.get("shop_name") if config else None}
 
 @api_router.post("/auth/setup", response_model=TokenResponse)
 async def setup_shop(data: PINSetup):
     """Initial shop setup with PIN"""
-    existing = await db.shop_config.find_one()
-    if existing:
-        raise HTTPException(status_code=400, detail="Shop already configured")
+    if not MULTI_TENANT:
+        existing = await db.shop_config.find_one()
+        if existing:
+            raise HTTPException(status_code=400, detail="Shop already configured")
     
     if len(data.pin) < 4 or len(data.pin) > 6:
         raise HTTPException(status_code=400, detail="PIN must be 4-6 digits")
@@ -332,9 +969,11 @@ async def setup_shop(data: PINSetup):
         shop_name_en=data.shop_name_en or "My Shop"
     )
     await db.shop_config.insert_one(config.model_dump())
+    await publish_invalidation("shop_config", config.id)
     
     # Create default owner user
     owner = User(
+        shop_id=config.id,
         name="Owner / मालिक",
         pin_hash=hash_pin(data.pin),
         role="owner"
@@ -342,8 +981,10 @@ async def setup_shop(data: PINSetup):
     await db.users.insert_one(owner.model_dump())
     
     # Initialize default categories and locations
-    await db.categories.insert_many(get_default_categories())
-    await db.locations.insert_many(get_default_locations())
+    await db.categories.insert_many(get_default_categories(config.id))
+    await db.locations.insert_many(get_default_locations(config.id))
+    await publish_invalidation("categories", config.id)
+    await publish_invalidation("locations", config.id)
     
     token = create_token(config.id, owner.id)
     return TokenResponse(
@@ -355,26 +996,28 @@ async def setup_shop(data: PINSetup):
     )
 
 @api_router.get("/auth/users")
-async def get_users_for_login():
+async def get_users_for_login(shop_id: Optional[str] = None):
     """Get list of users for login (without requiring auth)"""
-    config = await db.shop_config.find_one({}, {"_id": 0})
+    shop_id = await resolve_shop_id(shop_id)
+    config = await shop_config_cache.get(shop_id) if shop_id else None
     if not config:
         raise HTTPException(status_code=404, detail="Shop not configured")
     
-    users = await db.users.find({"is_active": True}, {"_id": 0, "pin_hash": 0}).to_list(50)
+    users = await db.users.find({"shop_id": shop_id, "is_active": True}, {"_id": 0, "pin_hash": 0}).to_list(50)
     return {"users": users, "shop_name": config["shop_name"]}
 
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(data: LoginRequest):
     """Login with user ID and PIN"""
-    config = await db.shop_config.find_one({}, {"_id": 0})
-    if not config:
-        raise HTTPException(status_code=404, detail="Shop not configured")
-    
+    # The user picked on the login screen determines the shop
     user = await db.users.find_one({"id": data.user_id, "is_active": True}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    config = await shop_config_cache.get(user.get("shop_id"))
+    if not config:
+        raise HTTPException(status_code=404, detail="Shop not configured")
+    
     if not verify_pin(data.pin, user["pin_hash"]):
         raise HTTPException(status_code=401, detail="Invalid PIN")
     
@@ -397,9 +1040,10 @@ async def change_pin(old_pin: str, new_pin: str, user: User = Depends(get_curren
         raise HTTPException(status_code=400, detail="PIN must be 4-6 digits")
     
     await db.users.update_one(
-        {"id": user.id}, 
+        {"shop_id": user.shop_id, "id": user.id}, 
         {"$set": {"pin_hash": hash_pin(new_pin)}}
     )
+    await publish_invalidation("users", user.id)
     return {"message": "PIN changed successfully"}
 
 # ============ USER MANAGEMENT ============
@@ -410,7 +1054,7 @@ async def get_users(user: User = Depends(get_current_user)):
     if user.role not in ["owner", "manager"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    users = await db.users.find({"is_active": True}, {"_id": 0}).to_list(50)
+    users = await db.users.find({"shop_id": user.shop_id, "is_active": True}, {"_id": 0}).to_list(50)
     return [User(**u) for u in users]
 
 @api_router.post("/users", response_model=User)
@@ -423,6 +1067,7 @@ async def create_user(data: UserCreate, user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="PIN must be 4-6 digits")
     
     new_user = User(
+        shop_id=user.shop_id,
         name=data.name,
         pin_hash=hash_pin(data.pin),
         role=data.role or "cashier"
@@ -449,12 +1094,13 @@ async def update_user(user_id: str, data: UserUpdate, user: User = Depends(get_c
         update_data["is_active"] = data.is_active
     
     result = await db.users.find_one_and_update(
-        {"id": user_id},
+        {"shop_id": user.shop_id, "id": user_id},
         {"$set": update_data},
         return_document=True
     )
     if not result:
         raise HTTPException(status_code=404, detail="User not found")
+    await publish_invalidation("users", user_id)
     result.pop("_id", None)
     return User(**result)
 
@@ -467,7 +1113,8 @@ async def delete_user(user_id: str, user: User = Depends(get_current_user)):
     if user_id == user.id:
         raise HTTPException(status_code=400, detail="Cannot delete yourself")
     
-    await db.users.update_one({"id": user_id}, {"$set": {"is_active": False}})
+    await db.users.update_one({"shop_id": user.shop_id, "id": user_id}, {"$set": {"is_active": False}})
+    await publish_invalidation("users", user_id)
     return {"message": "User deactivated"}
 
 # ============ CATEGORIES & LOCATIONS ============
@@ -475,102 +1122,100 @@ async def delete_user(user_id: str, user: User = Depends(get_current_user)):
 @api_router.post("/categories/initialize")
 async def initialize_categories(shop_id: str = Depends(get_current_shop)):
     """Initialize default categories if none exist"""
-    count = await db.categories.count_documents({})
+    count = await db.categories.count_documents({"shop_id": shop_id})
     if count == 0:
-        await db.categories.insert_many(get_default_categories())
+        await db.categories.insert_many(get_default_categories(shop_id))
+        await asyncio.gather(publish_invalidation("categories", shop_id), bump_catalog_version(shop_id))
         return {"message": "Default categories initialized", "count": 7}
     return {"message": "Categories already exist", "count": count}
 
 @api_router.get("/categories", response_model=List[Category])
 async def get_categories(shop_id: str = Depends(get_current_shop)):
-    categories = await db.categories.find({"is_active": True}, {"_id": 0}).sort("name_en", 1).to_list(100)
-    # Auto-initialize if empty
-    if not categories:
-        await db.categories.insert_many(get_default_categories())
-        categories = await db.categories.find({"is_active": True}, {"_id": 0}).sort("name_en", 1).to_list(100)
-    return [Category(**c) for c in categories]
+    return fast_list_response(Category, await category_cache.get(shop_id))
 
 @api_router.post("/categories", response_model=Category)
 async def create_category(data: CategoryCreate, shop_id: str = Depends(get_current_shop)):
     category = Category(**data.model_dump())
-    await db.categories.insert_one(category.model_dump())
+    await db.categories.insert_one(with_shop(category.model_dump(), shop_id))
+    await asyncio.gather(publish_invalidation("categories", shop_id), bump_catalog_version(shop_id))
     return category
 
 @api_router.put("/categories/{category_id}", response_model=Category)
 async def update_category(category_id: str, data: CategoryCreate, shop_id: str = Depends(get_current_shop)):
     update_data = data.model_dump()
     result = await db.categories.find_one_and_update(
-        {"id": category_id},
+        {"shop_id": shop_id, "id": category_id},
         {"$set": update_data},
         return_document=True
     )
     if not result:
         raise HTTPException(status_code=404, detail="Category not found")
+    await asyncio.gather(publish_invalidation("categories", shop_id), bump_catalog_version(shop_id))
     result.pop("_id", None)
     return Category(**result)
 
 @api_router.delete("/categories/{category_id}")
 async def delete_category(category_id: str, shop_id: str = Depends(get_current_shop)):
     # Check if any products use this category
-    products_count = await db.products.count_documents({"category": category_id, "is_active": True})
+    products_count = await db.products.count_documents({"shop_id": shop_id, "category": category_id, "is_active": True})
     if products_count > 0:
         raise HTTPException(status_code=400, detail=f"Cannot delete category. {products_count} products are using it.")
     
-    await db.categories.update_one({"id": category_id}, {"$set": {"is_active": False}})
+    await db.categories.update_one({"shop_id": shop_id, "id": category_id}, {"$set": {"is_active": False}})
+    await asyncio.gather(publish_invalidation("categories", shop_id), bump_catalog_version(shop_id))
     return {"message": "Category deleted"}
 
 @api_router.post("/locations/initialize")
 async def initialize_locations(shop_id: str = Depends(get_current_shop)):
     """Initialize default locations if none exist"""
-    count = await db.locations.count_documents({})
+    count = await db.locations.count_documents({"shop_id": shop_id})
     if count == 0:
-        await db.locations.insert_many(get_default_locations())
+        await db.locations.insert_many(get_default_locations(shop_id))
+        await asyncio.gather(publish_invalidation("locations", shop_id), bump_catalog_version(shop_id))
         return {"message": "Default locations initialized", "count": 6}
     return {"message": "Locations already exist", "count": count}
 
 @api_router.get("/locations", response_model=List[Location])
 async def get_locations(shop_id: str = Depends(get_current_shop)):
-    locations = await db.locations.find({"is_active": True}, {"_id": 0}).sort("name_en", 1).to_list(100)
-    # Auto-initialize if empty
-    if not locations:
-        await db.locations.insert_many(get_default_locations())
-        locations = await db.locations.find({"is_active": True}, {"_id": 0}).sort("name_en", 1).to_list(100)
-    return [Location(**l) for l in locations]
+    return fast_list_response(Location, await location_cache.get(shop_id))
 
 @api_router.post("/locations", response_model=Location)
 async def create_location(data: LocationCreate, shop_id: str = Depends(get_current_shop)):
     location = Location(**data.model_dump())
-    await db.locations.insert_one(location.model_dump())
+    await db.locations.insert_one(with_shop(location.model_dump(), shop_id))
+    await asyncio.gather(publish_invalidation("locations", shop_id), bump_catalog_version(shop_id))
     return location
 
 @api_router.put("/locations/{location_id}", response_model=Location)
 async def update_location(location_id: str, data: LocationCreate, shop_id: str = Depends(get_current_shop)):
     update_data = data.model_dump()
     result = await db.locations.find_one_and_update(
-        {"id": location_id},
+        {"shop_id": shop_id, "id": location_id},
         {"$set": update_data},
         return_document=True
     )
     if not result:
         raise HTTPException(status_code=404, detail="Location not found")
+    await asyncio.gather(publish_invalidation("locations", shop_id), bump_catalog_version(shop_id))
     result.pop("_id", None)
     return Location(**result)
 
 @api_router.delete("/locations/{location_id}")
 async def delete_location(location_id: str, shop_id: str = Depends(get_current_shop)):
     # Check if any products use this location
-    products_count = await db.products.count_documents({"location": location_id, "is_active": True})
+    products_count = await db.products.count_documents({"shop_id": shop_id, "location": location_id, "is_active": True})
     if products_count > 0:
         raise HTTPException(status_code=400, detail=f"Cannot delete location. {products_count} products are using it.")
     
-    await db.locations.update_one({"id": location_id}, {"$set": {"is_active": False}})
+    await db.locations.update_one({"shop_id": shop_id, "id": location_id}, {"$set": {"is_active": False}})
+    await asyncio.gather(publish_invalidation("locations", shop_id), bump_catalog_version(shop_id))
     return {"message": "Location deleted"}
 
 # ============ PRODUCTS ============
 
 @api_router.get("/products", response_model=List[Product])
 async def get_products(category: Optional[str] = None, location: Optional[str] = None, search: Optional[str] = None, shop_id: str = Depends(get_current_shop)):
-    query = {"is_active": True}
+    query = {"shop_id": shop_id, "is_active": True}
     if category:
         query["category"] = category
     if location:
@@ -581,74 +1226,601 @@ async def get_products(category: Optional[str] = None, location: Optional[str] =
             {"name_np": {"$regex": search, "$options": "i"}}
         ]
     
-    products = await db.products.find(query, {"_id": 0}).sort("name_en", 1).to_list(1000)
-    return [Product(**p) for p in products]
+    products = await db.products.find(query, model_projection(Product)).sort("name_en", 1).to_list(1000)
+    return fast_list_response(Product, products)
 
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str, shop_id: str = Depends(get_current_shop)):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    product = await db.products.find_one({"shop_id": shop_id, "id": product_id}, {"_id": 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return Product(**product)
 
 @api_router.post("/products", response_model=Product)
-async def create_product(data: ProductCreate, shop_id: str = Depends(get_current_shop)):
+async def create_product(data: ProductCreate, user: User = Depends(get_current_user)):
     product = Product(**data.model_dump())
-    await db.products.insert_one(product.model_dump())
+    writes = [db.products.insert_one(with_shop(product.model_dump(), user.shop_id))]
+    if product.quantity:
+        writes.append(record_stock_movements([
+            stock_movement(user.shop_id, product.id, "initial", product.quantity, product.created_at,
+                           user_id=user.id, quantity_after=product.quantity)
+        ]))
+    await asyncio.gather(*writes)
+    await bump_catalog_version(user.shop_id)
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, data: ProductUpdate, shop_id: str = Depends(get_current_shop)):
+async def update_product(product_id: str, data: ProductUpdate, user: User = Depends(get_current_user)):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc)
     
+    # Fetch the old document so a quantity edit can be logged as a movement
     result = await db.products.find_one_and_update(
-        {"id": product_id},
+        {"shop_id": user.shop_id, "id": product_id},
         {"$set": update_data},
-        return_document=True
+        return_document=ReturnDocument.BEFORE
     )
     if not result:
         raise HTTPException(status_code=404, detail="Product not found")
+    await bump_catalog_version(user.shop_id)
     
     result.pop("_id", None)
+    result.pop("shop_id", None)
+    old_quantity = result.get("quantity", 0)
+    result.update(update_data)
+    if "quantity" in update_data and update_data["quantity"] != old_quantity:
+        await record_stock_movements([
+            stock_movement(user.shop_id, product_id, "adjustment", update_data["quantity"] - old_quantity, update_data["updated_at"],
+                           user_id=user.id, quantity_after=update_data["quantity"])
+        ])
     return Product(**result)
 
 @api_router.delete("/products/{product_id}")
 async def delete_product(product_id: str, shop_id: str = Depends(get_current_shop)):
-    await db.products.update_one({"id": product_id}, {"$set": {"is_active": False}})
+    await db.products.update_one({"shop_id": shop_id, "id": product_id}, {"$set": {"is_active": False}})
+    await bump_catalog_version(shop_id)
     return {"message": "Product deleted"}
 
 @api_router.put("/products/{product_id}/stock")
-async def update_stock(product_id: str, quantity: int, shop_id: str = Depends(get_current_shop)):
+async def update_stock(product_id: str, quantity: int, user: User = Depends(get_current_user)):
     """Quick stock update"""
-    await db.products.update_one(
-        {"id": product_id},
-        {"$set": {"quantity": quantity, "updated_at": datetime.now(timezone.utc)}}
+    now = datetime.now(timezone.utc)
+    before = await db.products.find_one_and_update(
+        {"shop_id": user.shop_id, "id": product_id},
+        {"$set": {"quantity": quantity, "updated_at": now}},
+        projection={"_id": 0, "quantity": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if before is not None and before.get("quantity", 0) != quantity:
+        await bump_catalog_version(user.shop_id)
+        await record_stock_movements([
+            stock_movement(user.shop_id, product_id, "adjustment", quantity - before.get("quantity", 0), now,
+                           user_id=user.id, quantity_after=quantity)
+        ])
     return {"message": "Stock updated"}
 
+# ============ STOCK MOVEMENTS ============
+
+# Per-product stock snapshots are rolled forward from the ledger this often; 0 disables them
+STOCK_SNAPSHOT_INTERVAL_HOURS = float(os.environ.get('STOCK_SNAPSHOT_INTERVAL_HOURS', '24'))
+# Snapshots stop this far in the past so in-flight writes have landed in the ledger
+STOCK_SNAPSHOT_SETTLE_SECONDS = 60
+
+def stock_movement(shop_id: str, product_id: str, kind: str, delta: int, created_at: datetime, ref_id: Optional[str] = None,
+                   user_id: Optional[str] = None, quantity_after: Optional[int] = None) -> dict:
+    """One append-only ledger entry.
+
+    kind is one of initial, sale, purchase, adjustment (manual set) or count (scan/stock-take).
+    quantity_after is stored when the change set an absolute quantity.
+    """
+    movement = {"shop_id": shop_id, "product_id": product_id, "kind": kind, "delta": delta, "created_at": created_at}
+    if ref_id is not None:
+        movement["ref_id"] = ref_id
+    if user_id is not None:
+        movement["user_id"] = user_id
+    if quantity_after is not None:
+        movement["quantity_after"] = quantity_after
+    return movement
+
+async def record_stock_movements(movements: List[dict]):
+    if movements:
+        await db.stock_movements.insert_many(movements, ordered=False)
+
+async def roll_forward(quantities: dict, shop_id: str, after: datetime, until: datetime, product_filter: Optional[dict] = None):
+    """Apply ledger movements in (after, until] to ``quantities`` in place.
+
+    Movements that set an absolute quantity (counts, manual sets) are anchors: a product
+    restarts from its last anchor's quantity_after, and only the deltas after it are added.
+    Count deltas come from a read just before the write, so they are not trusted on their own.
+    """
+    window = {"shop_id": shop_id, "created_at": {"$gt": after, "$lte": until}, **(product_filter or {})}
+    anchors = await db.stock_movements.aggregate([
+        {"$match": {**window, "quantity_after": {"$exists": True}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": "$product_id", "at": {"$first": "$created_at"}, "quantity": {"$first": "$quantity_after"}}}
+    ]).to_list(None)
+    after_anchor = [{"product_id": {"$nin": [a["_id"] for a in anchors]}}]
+    after_anchor += [{"product_id": a["_id"], "created_at": {"$gt": a["at"]}} for a in anchors]
+    deltas = await db.stock_movements.aggregate([
+        {"$match": {**window, "$or": after_anchor}},
+        {"$group": {"_id": "$product_id", "delta": {"$sum": "$delta"}}}
+    ]).to_list(None)
+    for anchor in anchors:
+        quantities[anchor["_id"]] = anchor["quantity"]
+    for row in deltas:
+        quantities[row["_id"]] = quantities.get(row["_id"], 0) + row["delta"]
+
+async def take_stock_snapshot(shop_id: str, as_of: Optional[datetime] = None) -> int:
+    """Roll the shop's latest snapshot forward to ``as_of`` using the ledger.
+
+    The very first snapshot is seeded from products.quantity less the movements
+    after ``as_of``, since stock that predates the ledger has no movements.
+    Returns the number of products written.
+    """
+    if as_of is None:
+        as_of = datetime.now(timezone.utc) - timedelta(seconds=STOCK_SNAPSHOT_SETTLE_SECONDS)
+    previous = await db.stock_snapshots.find_one(
+        {"shop_id": shop_id, "as_of": {"$lt": as_of}}, {"_id": 0, "as_of": 1}, sort=[("as_of", -1)]
+    )
+
+    if previous is None:
+        products = await db.products.find({"shop_id": shop_id}, {"_id": 0, "id": 1, "quantity": 1}).to_list(None)
+        quantities = {p["id"]: p.get("quantity", 0) for p in products}
+        # Current stock already includes movements after as_of; take them back out so
+        # roll-forwards and stock_at do not count them twice
+        later = await db.stock_movements.aggregate([
+            {"$match": {"shop_id": shop_id, "created_at": {"$gt": as_of}}},
+            {"$group": {"_id": "$product_id", "delta": {"$sum": "$delta"}}}
+        ]).to_list(None)
+        for row in later:
+            if row["_id"] in quantities:
+                quantities[row["_id"]] -= row["delta"]
+    else:
+        base = await db.stock_snapshots.find(
+            {"shop_id": shop_id, "as_of": previous["as_of"]}, {"_id": 0, "product_id": 1, "quantity": 1}
+        ).to_list(None)
+        quantities = {s["product_id"]: s["quantity"] for s in base}
+        await roll_forward(quantities, shop_id, previous["as_of"], as_of)
+
+    if quantities:
+        await db.stock_snapshots.insert_many(
+            [{"shop_id": shop_id, "product_id": pid, "quantity": qty, "as_of": as_of} for pid, qty in quantities.items()],
+            ordered=False
+        )
+    return len(quantities)
+
+async def stock_at(shop_id: str, at: datetime, product_id: Optional[str] = None) -> dict:
+    """Stock per product at ``at``: nearest earlier snapshot rolled forward through the ledger"""
+    product_filter = {"product_id": product_id} if product_id else {}
+    snapshot = await db.stock_snapshots.find_one(
+        {"shop_id": shop_id, "as_of": {"$lte": at}}, {"_id": 0, "as_of": 1}, sort=[("as_of", -1)]
+    )
+    if snapshot is None:
+        # Nothing is known before the first snapshot
+        return {"snapshot_as_of": None, "quantities": {}}
+
+    base = await db.stock_snapshots.find(
+        {"shop_id": shop_id, "as_of": snapshot["as_of"], **product_filter},
+        {"_id": 0, "product_id": 1, "quantity": 1}
+    ).to_list(None)
+    quantities = {s["product_id"]: s["quantity"] for s in base}
+    await roll_forward(quantities, shop_id, snapshot["as_of"], at, product_filter)
+    return {"snapshot_as_of": snapshot["as_of"], "quantities": quantities}
+
+async def take_due_stock_snapshots() -> int:
+    """Snapshot every shop whose latest snapshot is older than the interval; returns products written"""
+    written = 0
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=STOCK_SNAPSHOT_INTERVAL_HOURS)
+    for shop_id in await db.shop_config.distinct("id"):
+        latest = await db.stock_snapshots.find_one({"shop_id": shop_id}, {"_id": 0, "as_of": 1}, sort=[("as_of", -1)])
+        # Another worker (or a previous run) may have taken it already
+        if latest is None or latest["as_of"].replace(tzinfo=timezone.utc) <= cutoff:
+            written += await take_stock_snapshot(shop_id)
+    if written:
+        logger.info(f"Stock snapshot written for {written} products")
+    return written
+
+@api_router.get("/stock/at")
+async def get_stock_at(date: str, product_id: Optional[str] = None, shop_id: str = Depends(get_current_shop)):
+    """Stock level per product at a point in time"""
+    at = datetime.fromisoformat(date.replace('Z', '+00:00'))
+    result = await stock_at(shop_id, at, product_id)
+    return {
+        "at": at,
+        "snapshot_as_of": result["snapshot_as_of"],
+        "items": [{"product_id": pid, "quantity": qty} for pid, qty in result["quantities"].items()]
+    }
+
+@api_router.get("/stock/movements")
+async def get_stock_movements(product_id: Optional[str] = None, date_from: Optional[str] = None,
+                              limit: int = 100, shop_id: str = Depends(get_current_shop)):
+    """Stock movement history, newest first"""
+    query = {"shop_id": shop_id}
+    if product_id:
+        query["product_id"] = product_id
+    if date_from:
+        query["created_at"] = {"$gte": datetime.fromisoformat(date_from.replace('Z', '+00:00'))}
+    return await db.stock_movements.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+
+@api_router.post("/admin/stock/snapshot")
+async def create_stock_snapshot(user: User = Depends(get_current_user)):
+    """Take a stock snapshot now (owner only)"""
+    if user.role != "owner":
+        raise HTTPException(status_code=403, detail="Only owner can take stock snapshots")
+    count = await take_stock_snapshot(user.shop_id)
+    return {"message": f"Snapshot written for {count} products", "count": count}
+
+# ============ SALES STORAGE ============
+
+# "plain" keeps one document per sale in db.sales; "timeseries" stores them in a MongoDB
+# time-series collection (5.0+) bucketed by shop, payment type and cashier. Switch existing
+# data over with migrate_sales_storage.py.
+SALES_STORAGE = os.environ.get('SALES_STORAGE', 'plain')
+SALES_TIMESERIES_COLLECTION = "sales_ts"
+SALES_TIMESERIES_GRANULARITY = os.environ.get('SALES_TIMESERIES_GRANULARITY', 'hours')
+# Sale fields kept in the time-series metaField
+SALES_META_FIELDS = ("shop_id", "payment_type", "user_id")
+
+if SALES_STORAGE not in ("plain", "timeseries"):
+    raise RuntimeError(f"SALES_STORAGE must be 'plain' or 'timeseries', not {SALES_STORAGE!r}")
+
+def sales_timeseries() -> bool:
+    return SALES_STORAGE == "timeseries"
+
+def sales_collection():
+    return db[SALES_TIMESERIES_COLLECTION] if sales_timeseries() else db.sales
+
+def to_sales_storage(doc: dict) -> dict:
+    """A db.sales document in the shape SALES_STORAGE keeps it"""
+    if not sales_timeseries():
+        return doc
+    stored = {key: value for key, value in doc.items() if key not in SALES_META_FIELDS}
+    stored["meta"] = {field: doc.get(field) for field in SALES_META_FIELDS}
+    return stored
+
+def from_sales_storage(doc: dict) -> dict:
+    meta = doc.pop("meta", None)
+    if meta:
+        doc.update(meta)
+    return doc
+
+def sales_filter(query: dict) -> dict:
+    """Rewrite a db.sales filter (top-level fields only) for SALES_STORAGE"""
+    if not sales_timeseries():
+        return query
+    return {f"meta.{key}" if key in SALES_META_FIELDS else key: value for key, value in query.items()}
+
+def sales_projection(projection: dict) -> dict:
+    if not sales_timeseries():
+        return projection
+    return {f"meta.{key}" if key in SALES_META_FIELDS else key: value for key, value in projection.items()}
+
+def sales_pipeline(pipeline: List[dict]) -> List[dict]:
+    """Adapt a pipeline that starts with a $match on db.sales fields to SALES_STORAGE"""
+    if not sales_timeseries():
+        return pipeline
+    match, rest = pipeline[0]["$match"], pipeline[1:]
+    # The metaField goes first so the match can prune whole buckets
+    return [
+        {"$match": sales_filter(match)},
+        {"$set": {field: f"$meta.{field}" for field in SALES_META_FIELDS}},
+        *rest,
+    ]
+
+async def find_stored_sales(query: dict, projection: Optional[dict] = None, limit: int = 1000) -> List[dict]:
+    """db.sales-shaped documents matching a db.sales filter, newest first"""
+    cursor = sales_collection().find(sales_filter(query), sales_projection(projection or {"_id": 0}))
+    return [from_sales_storage(doc) for doc in await cursor.sort("created_at", -1).to_list(limit)]
+
+async def ensure_sales_storage():
+    if not sales_timeseries():
+        await db.sales.create_index([("shop_id", 1), ("created_at", -1)])
+        return
+    try:
+        await db.create_collection(SALES_TIMESERIES_COLLECTION, timeseries={
+            "timeField": "created_at", "metaField": "meta", "granularity": SALES_TIMESERIES_GRANULARITY
+        })
+    except CollectionInvalid:
+        pass
+    await sales_collection().create_index([("meta.shop_id", 1), ("created_at", -1)])
+
+# ============ SALES ARCHIVE ============
+
+# Sales older than this move from db.sales to db.sales_archive, keeping per-day summaries;
+# 0 disables archival. Must stay longer than any window the dashboard reads from db.sales.
+SALES_ARCHIVE_AFTER_DAYS = int(os.environ.get('SALES_ARCHIVE_AFTER_DAYS', '365'))
+SALES_ARCHIVE_INTERVAL_HOURS = float(os.environ.get('SALES_ARCHIVE_INTERVAL_HOURS', '24'))
+SALES_ARCHIVE_DAYS_PER_BATCH = 31
+
+class SalesDailySummary(BaseModel):
+    day: str  # YYYY-MM-DD (UTC)
+    sale_count: int
+    total: float
+    discount: float = 0
+    cash_total: float = 0
+    credit_total: float = 0
+    items_sold: int = 0
+    products: List[dict] = []  # per product: quantity and revenue
+
+async def load_sales_archive_boundary() -> Optional[datetime]:
+    """Sales created before this are read from sales_archive; None until the first archival"""
+    state = await db.archive_state.find_one({"_id": "sales"})
+    return state["archived_before"].replace(tzinfo=timezone.utc) if state else None
+
+sales_archive_boundary = CatalogCache("sales_archive_boundary", load_sales_archive_boundary)
+CACHES[sales_archive_boundary.name] = sales_archive_boundary
+
+def as_utc(at: datetime) -> datetime:
+    """Treat naive datetimes (as stored by Mongo or sent without an offset) as UTC"""
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+def utc_day_start(at: datetime) -> datetime:
+    return as_utc(at).astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def created_at_range(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                     before: Optional[datetime] = None) -> dict:
+    created_at = {}
+    if date_from is not None:
+        created_at["$gte"] = date_from
+    if date_to is not None:
+        created_at["$lte"] = date_to
+    if before is not None:
+        created_at["$lt"] = before
+    return {"created_at": created_at} if created_at else {}
+
+async def find_sales(shop_id: str, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                     projection: Optional[dict] = None, limit: int = 1000) -> List[dict]:
+    """Sales in [date_from, date_to], newest first, read across the hot and archived tiers"""
+    projection = projection or {"_id": 0}
+    date_from = as_utc(date_from) if date_from else None
+    date_to = as_utc(date_to) if date_to else None
+    boundary = await sales_archive_boundary.get()
+    sales = []
+    if boundary is None or date_to is None or date_to >= boundary:
+        # Archived copies still awaiting deletion sit below the boundary and are skipped
+        hot_from = date_from if boundary is None else max(date_from or boundary, boundary)
+        query = {"shop_id": shop_id, **created_at_range(hot_from, date_to)}
+        sales = await find_stored_sales(query, projection, limit)
+    if boundary is not None and len(sales) < limit and (date_from is None or date_from < boundary):
+        query = {"shop_id": shop_id, **created_at_range(date_from, date_to, before=boundary)}
+        remaining = limit - len(sales)
+        sales += await db.sales_archive.find(query, projection).sort("created_at", -1).to_list(remaining)
+    return sales
+
+def daily_sales_pipeline(match: dict) -> List[dict]:
+    """Aggregate sales into one SalesDailySummary-shaped document per shop and UTC day"""
+    first_line = {"$eq": ["$line", 0]}
+    return [
+        {"$match": match},
+        {"$unwind": {"path": "$items", "includeArrayIndex": "line"}},
+        # One row per product and day; sale-level amounts are counted on each sale's first line only
+        {"$group": {
+            "_id": {
+                "shop_id": "$shop_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                "product_id": "$items.product_id",
+            },
+            "product_name": {"$last": "$items.product_name"},
+            "quantity": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": "$items.total"},
+            "sale_count": {"$sum": {"$cond": [first_line, 1, 0]}},
+            "total": {"$sum": {"$cond": [first_line, "$total", 0]}},
+            "discount": {"$sum": {"$cond": [first_line, "$discount", 0]}},
+            "cash_total": {"$sum": {"$cond": [{"$and": [first_line, {"$eq": ["$payment_type", "cash"]}]}, "$total", 0]}},
+            "credit_total": {"$sum": {"$cond": [{"$and": [first_line, {"$eq": ["$payment_type", "credit"]}]}, "$total", 0]}},
+        }},
+        {"$group": {
+            "_id": {"shop_id": "$_id.shop_id", "day": "$_id.day"},
+            "sale_count": {"$sum": "$sale_count"},
+            "total": {"$sum": "$total"},
+            "discount": {"$sum": "$discount"},
+            "cash_total": {"$sum": "$cash_total"},
+            "credit_total": {"$sum": "$credit_total"},
+            "items_sold": {"$sum": "$quantity"},
+            "products": {"$push": {
+                "product_id": "$_id.product_id", "product_name": "$product_name",
+                "quantity": "$quantity", "total": "$revenue"
+            }},
+        }},
+        {"$project": {
+            "_id": 0, "shop_id": "$_id.shop_id", "day": "$_id.day", "sale_count": 1, "total": 1, "discount": 1,
+            "cash_total": 1, "credit_total": 1, "items_sold": 1, "products": 1
+        }},
+    ]
+
+async def archive_sales() -> int:
+    """Move sales older than SALES_ARCHIVE_AFTER_DAYS into sales_archive, a month at a time.
+
+    Each batch copies sales with $merge, rebuilds the affected days' summaries from the
+    archive, moves the boundary that readers use, and only then deletes the hot copies, so
+    a run that died part-way is safe to repeat. Returns the number of sales moved.
+    """
+    # Time-series buckets already keep old sales compact, and ranged deletes on them need MongoDB 7
+    if SALES_ARCHIVE_AFTER_DAYS <= 0 or sales_timeseries():
+        return 0
+    horizon = utc_day_start(datetime.now(timezone.utc)) - timedelta(days=SALES_ARCHIVE_AFTER_DAYS)
+    shop_ids = await db.shop_config.distinct("id")
+    moved = 0
+    while True:
+        # Per-shop lookups use the (shop_id, created_at) index instead of scanning all sales
+        oldest = {}
+        for shop_id in shop_ids:
+            sale = await db.sales.find_one(
+                {"shop_id": shop_id, "created_at": {"$lt": horizon}}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)]
+            )
+            if sale:
+                oldest[shop_id] = utc_day_start(sale["created_at"])
+        if not oldest:
+            break
+        batch_end = min(horizon, min(oldest.values()) + timedelta(days=SALES_ARCHIVE_DAYS_PER_BATCH))
+
+        for shop_id, since in oldest.items():
+            if since >= batch_end:
+                continue
+            await db.sales.aggregate([
+                {"$match": {"shop_id": shop_id, "created_at": {"$lt": batch_end}}},
+                {"$merge": {"into": "sales_archive", "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}},
+            ]).to_list(None)
+            await db.sales_archive.aggregate(daily_sales_pipeline(
+                {"shop_id": shop_id, "created_at": {"$gte": since, "$lt": batch_end}}
+            ) + [
+                {"$merge": {"into": "sales_daily_summaries", "on": ["shop_id", "day"],
+                            "whenMatched": "replace", "whenNotMatched": "insert"}},
+            ]).to_list(None)
+
+        await db.archive_state.update_one(
+            {"_id": "sales"}, {"$max": {"archived_before": batch_end}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        await publish_invalidation(sales_archive_boundary.name)
+        for shop_id, since in oldest.items():
+            if since < batch_end:
+                result = await db.sales.delete_many({"shop_id": shop_id, "created_at": {"$lt": batch_end}})
+                moved += result.deleted_count
+        if batch_end >= horizon:
+            break
+    if moved:
+        logger.info(f"Archived {moved} sales older than {horizon.date()}")
+    return moved
+
+@api_router.get("/sales/daily", response_model=List[SalesDailySummary])
+async def get_sales_daily(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                          shop_id: str = Depends(get_current_shop)):
+    """Per-day sales totals (default last 30 days), from summaries and rollups where they exist, live for the rest"""
+    to_date = as_utc(datetime.fromisoformat(date_to.replace('Z', '+00:00'))) if date_to else datetime.now(timezone.utc)
+    from_date = as_utc(datetime.fromisoformat(date_from.replace('Z', '+00:00'))) if date_from else to_date - timedelta(days=30)
+    boundary = await sales_archive_boundary.get()
+
+    summaries = []
+    if boundary is not None and from_date < boundary:
+        last_archived = min(to_date, boundary - timedelta(microseconds=1))
+        summaries = await db.sales_daily_summaries.find({
+            "shop_id": shop_id,
+            "day": {"$gte": utc_day_start(from_date).strftime("%Y-%m-%d"), "$lte": utc_day_start(last_archived).strftime("%Y-%m-%d")}
+        }, {"_id": 0}).to_list(None)
+    if boundary is None or to_date >= boundary:
+        # Hot days are aggregated from whole days so each matches its archived summary
+        since = max(utc_day_start(from_date), boundary) if boundary is not None else utc_day_start(from_date)
+        rolled, since = await rolled_up_days(shop_id, since, to_date)
+        summaries += rolled
+        summaries += await sales_collection().aggregate(sales_pipeline(daily_sales_pipeline(
+            {"shop_id": shop_id, "created_at": {"$gte": since, "$lte": to_date}}
+        ))).to_list(None)
+    summaries.sort(key=lambda s: s["day"], reverse=True)
+    return [SalesDailySummary(**s) for s in summaries]
+
+@api_router.post("/admin/sales/archive")
+async def run_sales_archival(user: User = Depends(get_current_user)):
+    """Archive old sales now (owner only)"""
+    if user.role != "owner":
+        raise HTTPException(status_code=403, detail="Only owner can archive sales")
+    moved = await archive_sales()
+    return {"message": f"Archived {moved} sales", "moved": moved}
+
+# ============ SALES ROLLUPS ============
+
+# Whole UTC days within this window get one rollup per shop, so the dashboard's week and
+# /sales/daily read a few small documents instead of every sale; 0 disables rollups
+DAY_ROLLUP_DAYS = int(os.environ.get('DAY_ROLLUP_DAYS', '31'))
+DAY_ROLLUP_INTERVAL_MINUTES = float(os.environ.get('DAY_ROLLUP_INTERVAL_MINUTES', '15'))
+# A day is rolled up only this long after it ends, so in-flight sales have landed
+DAY_ROLLUP_SETTLE_SECONDS = 60
+
+def rollup_window_days() -> int:
+    # Archived days are summarised by archival; keeping the window on the hot side avoids racing it
+    if SALES_ARCHIVE_AFTER_DAYS > 0 and not sales_timeseries():
+        return max(0, min(DAY_ROLLUP_DAYS, SALES_ARCHIVE_AFTER_DAYS - 1))
+    return DAY_ROLLUP_DAYS
+
+def rollup_window_start(now: Optional[datetime] = None) -> datetime:
+    today = utc_day_start((now or datetime.now(timezone.utc)) - timedelta(seconds=DAY_ROLLUP_SETTLE_SECONDS))
+    return today - timedelta(days=rollup_window_days())
+
+async def rollup_sales_days(shop_id: Optional[str] = None) -> int:
+    """Roll up every whole day in the window that has no rollup yet; returns the days written.
+
+    Sales are always stamped with the time they are made, so a finished day never changes
+    and its rollup stays exact. Days without sales are stored with zero totals, letting
+    readers tell "no sales" from "not rolled up yet". Without ``shop_id`` every shop is done.
+    """
+    window = rollup_window_days()
+    if window <= 0:
+        return 0
+    window_start = rollup_window_start()
+    window_days = [(window_start + timedelta(days=n)).strftime("%Y-%m-%d") for n in range(window)]
+    shop_ids = [shop_id] if shop_id else await db.shop_config.distinct("id")
+    written = 0
+    for shop in shop_ids:
+        done = set(await db.sales_rollups.distinct("day", {"shop_id": shop, "day": {"$gte": window_days[0]}}))
+        missing = [day for day in window_days if day not in done]
+        if not missing:
+            continue
+        since = datetime.strptime(missing[0], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        rows = await sales_collection().aggregate(sales_pipeline(daily_sales_pipeline(
+            {"shop_id": shop, "created_at": {"$gte": since, "$lt": window_start + timedelta(days=window)}}
+        ))).to_list(None)
+        by_day = {row["day"]: row for row in rows}
+        now = datetime.now(timezone.utc)
+        operations = []
+        for day in missing:
+            summary = by_day.get(day) or SalesDailySummary(day=day, sale_count=0, total=0).model_dump()
+            summary.update(shop_id=shop, rolled_at=now)
+            operations.append(UpdateOne({"shop_id": shop, "day": day}, {"$set": summary}, upsert=True))
+        await db.sales_rollups.bulk_write(operations, ordered=False)
+        written += len(operations)
+    if written:
+        logger.info(f"Rolled up {written} shop-days of sales")
+    return written
+
+async def rolled_up_days(shop_id: str, since: datetime, until: datetime):
+    """Rollups for the consecutive whole days from ``since`` that end by ``until``.
+
+    Returns the summaries of days that had sales and the moment live reads must resume from.
+    """
+    if rollup_window_days() <= 0 or since < rollup_window_start():
+        return [], since
+    days = []
+    day = since
+    while day + timedelta(days=1) <= until:
+        days.append(day)
+        day += timedelta(days=1)
+    if not days:
+        return [], since
+    docs = await db.sales_rollups.find(
+        {"shop_id": shop_id, "day": {"$in": [d.strftime("%Y-%m-%d") for d in days]}}, {"_id": 0, "rolled_at": 0}
+    ).to_list(None)
+    rollups = {doc["day"]: doc for doc in docs}
+    summaries = []
+    for day in days:
+        rollup = rollups.get(day.strftime("%Y-%m-%d"))
+        if rollup is None:
+            break
+        if rollup["sale_count"]:
+            summaries.append(rollup)
+        since = day + timedelta(days=1)
+    return summaries, since
+
 # ============ SALES ============
 
 @api_router.get("/sales", response_model=List[Sale])
 async def get_sales(date_from: Optional[str] = None, date_to: Optional[str] = None, shop_id: str = Depends(get_current_shop)):
-    query = {}
-    if date_from:
-        query["created_at"] = {"$gte": datetime.fromisoformat(date_from.replace('Z', '+00:00'))}
-    if date_to:
-        if "created_at" in query:
-            query["created_at"]["$lte"] = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-        else:
-            query["created_at"] = {"$lte": datetime.fromisoformat(date_to.replace('Z', '+00:00'))}
+    from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00')) if date_from else None
+    to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00')) if date_to else None
     
-    sales = await db.sales.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [Sale(**s) for s in sales]
+    sales = await find_sales(shop_id, from_date, to_date, model_projection(Sale))
+    return fast_list_response(Sale, sales)
+
+today_sales_flight = SingleFlight("/api/sales/today")
 
 @api_router.get("/sales/today")
 async def get_today_sales(shop_id: str = Depends(get_current_shop)):
     """Get today's sales summary"""
+    return await today_sales_flight.run(shop_id, lambda: compute_today_sales(shop_id))
+
+async def compute_today_sales(shop_id: str) -> dict:
     today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     
-    sales = await db.sales.find({"created_at": {"$gte": today_start}}, {"_id": 0}).to_list(1000)
+    sales = await find_stored_sales({"shop_id": shop_id, "created_at": {"$gte": today_start}})
     
     total_sales = sum(s["total"] for s in sales)
     total_cash = sum(s["total"] for s in sales if s["payment_type"] == "cash")
@@ -665,14 +1837,26 @@ async def get_today_sales(shop_id: str = Depends(get_current_shop)):
 @api_router.post("/sales", response_model=Sale)
 async def create_sale(data: SaleCreate, user: User = Depends(get_current_user)):
     sale = Sale(**data.model_dump(), user_id=user.id, user_name=user.name)
-    await db.sales.insert_one(sale.model_dump())
     
-    # Update product quantities
-    for item in sale.items:
-        await db.products.update_one(
-            {"id": item.product_id},
-            {"$inc": {"quantity": -item.quantity}}
-        )
+    # Update product quantities, logging each change to the ledger in the same batch
+    operations = [
+        UpdateOne({"shop_id": user.shop_id, "id": item.product_id},
+                  {"$inc": {"quantity": -item.quantity}, "$set": {"updated_at": sale.created_at}})
+        for item in sale.items
+    ]
+    movements = [
+        stock_movement(user.shop_id, item.product_id, "sale", -item.quantity, sale.created_at, ref_id=sale.id, user_id=user.id)
+        for item in sale.items
+    ]
+    writes = [
+        sales_collection().insert_one(to_sales_storage(with_shop(sale.model_dump(), user.shop_id))),
+        record_stock_movements(movements)
+    ]
+    if operations:
+        writes.append(db.products.bulk_write(operations, ordered=False))
+    await asyncio.gather(*writes)
+    if operations:
+        await bump_catalog_version(user.shop_id)
     
     return sale
 
@@ -680,49 +1864,73 @@ async def create_sale(data: SaleCreate, user: User = Depends(get_current_user)):
 
 @api_router.get("/suppliers", response_model=List[Supplier])
 async def get_suppliers(shop_id: str = Depends(get_current_shop)):
-    suppliers = await db.suppliers.find({"is_active": True}, {"_id": 0}).to_list(100)
-    return [Supplier(**s) for s in suppliers]
+    suppliers = await db.suppliers.find({"shop_id": shop_id, "is_active": True}, model_projection(Supplier)).to_list(100)
+    return fast_list_response(Supplier, suppliers)
 
 @api_router.post("/suppliers", response_model=Supplier)
 async def create_supplier(data: SupplierCreate, shop_id: str = Depends(get_current_shop)):
     supplier = Supplier(**data.model_dump())
-    await db.suppliers.insert_one(supplier.model_dump())
+    await db.suppliers.insert_one(with_shop(supplier.model_dump(), shop_id))
+    await bump_catalog_version(shop_id)
     return supplier
 
 @api_router.put("/suppliers/{supplier_id}", response_model=Supplier)
 async def update_supplier(supplier_id: str, data: SupplierCreate, shop_id: str = Depends(get_current_shop)):
     update_data = data.model_dump()
     result = await db.suppliers.find_one_and_update(
-        {"id": supplier_id},
+        {"shop_id": shop_id, "id": supplier_id},
         {"$set": update_data},
         return_document=True
     )
     if not result:
         raise HTTPException(status_code=404, detail="Supplier not found")
+    await bump_catalog_version(shop_id)
     result.pop("_id", None)
     return Supplier(**result)
 
 @api_router.delete("/suppliers/{supplier_id}")
 async def delete_supplier(supplier_id: str, shop_id: str = Depends(get_current_shop)):
-    await db.suppliers.update_one({"id": supplier_id}, {"$set": {"is_active": False}})
+    await db.suppliers.update_one({"shop_id": shop_id, "id": supplier_id}, {"$set": {"is_active": False}})
+    await bump_catalog_version(shop_id)
     return {"message": "Supplier deleted"}
 
 # ============ PURCHASES ============
 
 @api_router.get("/purchases", response_model=List[Purchase])
 async def get_purchases(supplier_id: Optional[str] = None, shop_id: str = Depends(get_current_shop)):
-    query = {}
+    query = {"shop_id": shop_id}
     if supplier_id:
         query["supplier_id"] = supplier_id
     
-    purchases = await db.purchases.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
-    return [Purchase(**p) for p in purchases]
+    purchases = await db.purchases.find(query, model_projection(Purchase)).sort("created_at", -1).to_list(500)
+    return fast_list_response(Purchase, purchases)
+
+def weighted_cost_update(quantity: int, total_cost: float, now: datetime) -> list:
+    """Update pipeline adding stock and blending its cost into a weighted-average cost_price.
+
+    Runs server-side so it always averages against the quantity actually on hand;
+    oversold (negative) stock counts as zero.
+    """
+    on_hand = {"$max": [{"$ifNull": ["$quantity", 0]}, 0]}
+    new_on_hand = {"$add": [on_hand, quantity]}
+    return [{"$set": {
+        "cost_price": {"$cond": [
+            {"$gt": [new_on_hand, 0]},
+            {"$divide": [
+                {"$add": [{"$multiply": [on_hand, {"$ifNull": ["$cost_price", 0]}]}, total_cost]},
+                new_on_hand
+            ]},
+            {"$ifNull": ["$cost_price", 0]}
+        ]},
+        "quantity": {"$add": [{"$ifNull": ["$quantity", 0]}, quantity]},
+        "updated_at": now
+    }}]
 
 @api_router.post("/purchases", response_model=Purchase)
-async def create_purchase(data: PurchaseCreate, shop_id: str = Depends(get_current_shop)):
+async def create_purchase(data: PurchaseCreate, user: User = Depends(get_current_user)):
     # Get supplier and product names
-    supplier = await db.suppliers.find_one({"id": data.supplier_id}, {"_id": 0})
-    product = await db.products.find_one({"id": data.product_id}, {"_id": 0})
+    supplier = await db.suppliers.find_one({"shop_id": user.shop_id, "id": data.supplier_id}, {"_id": 0})
+    product = await db.products.find_one({"shop_id": user.shop_id, "id": data.product_id}, {"_id": 0})
     
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
@@ -739,63 +1947,180 @@ async def create_purchase(data: PurchaseCreate, shop_id: str = Depends(get_curre
         total_cost=data.quantity * data.cost_per_unit,
         notes=data.notes or ""
     )
-    await db.purchases.insert_one(purchase.model_dump())
     
-    # Update product quantity and cost price
-    await db.products.update_one(
-        {"id": data.product_id},
-        {
-            "$inc": {"quantity": data.quantity},
-            "$set": {"cost_price": data.cost_per_unit, "updated_at": datetime.now(timezone.utc)}
-        }
+    # Add the stock and blend its cost into the weighted-average cost price
+    await asyncio.gather(
+        db.purchases.insert_one(with_shop(purchase.model_dump(), user.shop_id)),
+        db.products.update_one(
+            {"shop_id": user.shop_id, "id": data.product_id},
+            weighted_cost_update(data.quantity, purchase.total_cost, purchase.created_at)
+        ),
+        record_stock_movements([
+            stock_movement(user.shop_id, data.product_id, "purchase", data.quantity, purchase.created_at, ref_id=purchase.id, user_id=user.id)
+        ])
     )
+    await bump_catalog_version(user.shop_id)
     
     return purchase
 
+@api_router.post("/purchases/batch", response_model=List[Purchase])
+async def create_purchase_batch(data: PurchaseBatchCreate, user: User = Depends(get_current_user)):
+    """Record a multi-line supplier delivery in a handful of round trips"""
+    if not data.lines:
+        raise HTTPException(status_code=400, detail="Purchase has no lines")
+
+    supplier_ids = list({line.supplier_id for line in data.lines})
+    product_ids = list({line.product_id for line in data.lines})
+    suppliers, products = await asyncio.gather(
+        db.suppliers.find({"shop_id": user.shop_id, "id": {"$in": supplier_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None),
+        db.products.find({"shop_id": user.shop_id, "id": {"$in": product_ids}}, {"_id": 0, "id": 1, "name_en": 1}).to_list(None)
+    )
+    supplier_names = {s["id"]: s["name"] for s in suppliers}
+    product_names = {p["id"]: p["name_en"] for p in products}
+
+    missing_suppliers = [i for i in supplier_ids if i not in supplier_names]
+    if missing_suppliers:
+        raise HTTPException(status_code=404, detail=f"Supplier not found: {', '.join(missing_suppliers)}")
+    missing_products = [i for i in product_ids if i not in product_names]
+    if missing_products:
+        raise HTTPException(status_code=404, detail=f"Product not found: {', '.join(missing_products)}")
+
+    purchases = []
+    # Several lines for the same product become one stock/cost update
+    received = {}
+    for line in data.lines:
+        purchase = Purchase(
+            supplier_id=line.supplier_id,
+            supplier_name=supplier_names[line.supplier_id],
+            product_id=line.product_id,
+            product_name=product_names[line.product_id],
+            quantity=line.quantity,
+            cost_per_unit=line.cost_per_unit,
+            total_cost=line.quantity * line.cost_per_unit,
+            notes=line.notes or ""
+        )
+        purchases.append(purchase)
+        quantity, total_cost = received.get(line.product_id, (0, 0.0))
+        received[line.product_id] = (quantity + purchase.quantity, total_cost + purchase.total_cost)
+
+    now = datetime.now(timezone.utc)
+    operations = [
+        UpdateOne({"shop_id": user.shop_id, "id": product_id}, weighted_cost_update(quantity, total_cost, now))
+        for product_id, (quantity, total_cost) in received.items()
+    ]
+    movements = [
+        stock_movement(user.shop_id, p.product_id, "purchase", p.quantity, now, ref_id=p.id, user_id=user.id)
+        for p in purchases
+    ]
+    await asyncio.gather(
+        db.purchases.insert_many([with_shop(p.model_dump(), user.shop_id) for p in purchases], ordered=False),
+        db.products.bulk_write(operations, ordered=False),
+        record_stock_movements(movements)
+    )
+    await bump_catalog_version(user.shop_id)
+    
+    return purchases
+
 # ============ LOW STOCK ALERTS ============
 
+# Products at or below their threshold carry low_stock: true, refreshed on a schedule. Alerts read
+# the flagged products plus those changed since the last refresh and re-check the threshold, so
+# they stay exact between refreshes without scanning the whole catalog.
+LOW_STOCK_REFRESH_INTERVAL_MINUTES = float(os.environ.get('LOW_STOCK_REFRESH_INTERVAL_MINUTES', '10'))
+# Changes this close to a refresh are still read directly, covering in-flight writes and clock skew
+LOW_STOCK_REFRESH_OVERLAP_SECONDS = 60
+
+LOW_STOCK_EXPR = {"$lte": ["$quantity", "$low_stock_threshold"]}
+
+async def load_low_stock_fresh_since(shop_id: str) -> Optional[datetime]:
+    """Flags are accurate for products not updated since this; None before the first refresh"""
+    state = await db.low_stock_state.find_one({"_id": shop_id})
+    return state["fresh_since"] if state else None
+
+# A stale value is only ever older, which widens the read, so it needs no invalidation
+low_stock_state_cache = CatalogCache("low_stock_state", load_low_stock_fresh_since)
+
+async def low_stock_query(shop_id: str) -> dict:
+    query = {"shop_id": shop_id, "is_active": True, "$expr": LOW_STOCK_EXPR}
+    fresh_since = await low_stock_state_cache.get(shop_id)
+    if fresh_since is not None:
+        # shop_id inside each branch lets both use an index
+        query["$or"] = [{"shop_id": shop_id, "low_stock": True}, {"shop_id": shop_id, "updated_at": {"$gte": fresh_since}}]
+    return query
+
+async def refresh_low_stock_flags(shop_id: Optional[str] = None) -> int:
+    """Flag products at or below their threshold and unflag the rest; returns the flags changed"""
+    shop_ids = [shop_id] if shop_id else await db.shop_config.distinct("id")
+    changed = 0
+    for shop in shop_ids:
+        started = datetime.now(timezone.utc)
+        flagged = await db.products.update_many(
+            {"shop_id": shop, "is_active": True, "low_stock": {"$ne": True}, "$expr": LOW_STOCK_EXPR},
+            {"$set": {"low_stock": True}}
+        )
+        cleared = await db.products.update_many(
+            {"shop_id": shop, "low_stock": True, "$or": [{"is_active": {"$ne": True}}, {"$expr": {"$not": [LOW_STOCK_EXPR]}}]},
+            {"$unset": {"low_stock": ""}}
+        )
+        await db.low_stock_state.update_one(
+            {"_id": shop}, {"$max": {"fresh_since": started - timedelta(seconds=LOW_STOCK_REFRESH_OVERLAP_SECONDS)}},
+            upsert=True
+        )
+        changed += flagged.modified_count + cleared.modified_count
+    return changed
+
+low_stock_flight = SingleFlight("/api/alerts/low-stock")
+
 @api_router.get("/alerts/low-stock")
 async def get_low_stock_alerts(shop_id: str = Depends(get_current_shop)):
     """Get products below their low stock threshold"""
-    products = await db.products.find(
-        {"is_active": True, "$expr": {"$lte": ["$quantity", "$low_stock_threshold"]}},
-        {"_id": 0}
-    ).to_list(100)
+    return await low_stock_flight.run(shop_id, lambda: compute_low_stock_alerts(shop_id))
+
+async def compute_low_stock_alerts(shop_id: str) -> List[Product]:
+    products = await db.products.find(await low_stock_query(shop_id), {"_id": 0}).to_list(100)
     
     return [Product(**p) for p in products]
 
 # ============ DASHBOARD STATS ============
 
+dashboard_stats_flight = SingleFlight("/api/dashboard/stats")
+
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(shop_id: str = Depends(get_current_shop)):
     """Get dashboard statistics"""
+    return await dashboard_stats_flight.run(shop_id, lambda: compute_dashboard_stats(shop_id))
+
+async def compute_dashboard_stats(shop_id: str) -> dict:
     today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     week_start = today_start - timedelta(days=7)
     
     # Today's sales
-    today_sales = await db.sales.find({"created_at": {"$gte": today_start}}, {"_id": 0}).to_list(1000)
+    today_sales = await find_stored_sales({"shop_id": shop_id, "created_at": {"$gte": today_start}})
     today_total = sum(s["total"] for s in today_sales)
     
-    # This week's sales
-    week_sales = await db.sales.find({"created_at": {"$gte": week_start}}, {"_id": 0}).to_list(1000)
-    week_total = sum(s["total"] for s in week_sales)
+    # This week's sales: the past seven days from their rollups once all exist, plus today
+    rolled, rolled_until = await rolled_up_days(shop_id, week_start, today_start)
+    if rolled_until >= today_start:
+        week_total = sum(r["total"] for r in rolled) + today_total
+        week_count = sum(r["sale_count"] for r in rolled) + len(today_sales)
+    else:
+        week_sales = await find_stored_sales({"shop_id": shop_id, "created_at": {"$gte": week_start}})
+        week_total = sum(s["total"] for s in week_sales)
+        week_count = len(week_sales)
     
     # Product counts
-    total_products = await db.products.count_documents({"is_active": True})
-    low_stock_count = await db.products.count_documents({
-        "is_active": True,
-        "$expr": {"$lte": ["$quantity", "$low_stock_threshold"]}
-    })
+    total_products = await db.products.count_documents({"shop_id": shop_id, "is_active": True})
+    low_stock_count = await db.products.count_documents(await low_stock_query(shop_id))
     
     # Inventory value
-    products = await db.products.find({"is_active": True}, {"_id": 0}).to_list(1000)
+    products = await db.products.find({"shop_id": shop_id, "is_active": True}, {"_id": 0}).to_list(1000)
     inventory_value = sum(p.get("selling_price", 0) * p.get("quantity", 0) for p in products)
     
     return {
         "today_sales": today_total,
         "today_count": len(today_sales),
         "week_sales": week_total,
-        "week_count": len(week_sales),
+        "week_count": week_count,
         "total_products": total_products,
         "low_stock_count": low_stock_count,
         "inventory_value": inventory_value
@@ -803,14 +2128,11 @@ async def get_dashboard_stats(shop_id: str = Depends(get_current_shop)):
 
 # ============ REPORTS ============
 
-@api_router.get("/reports/sales/excel")
-async def export_sales_excel(date_from: str, date_to: str, shop_id: str = Depends(get_current_shop)):
-    """Export sales report as Excel"""
-    from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-    to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-    
-    sales = await db.sales.find({"created_at": {"$gte": from_date, "$lte": to_date}}, {"_id": 0}).to_list(1000)
-    
+# openpyxl and reportlab are imported on first use (or by warm_up_imports) to keep cold starts fast
+
+def render_sales_excel(sales: List[dict]) -> bytes:
+    from openpyxl import Workbook
+
     wb = Workbook()
     ws = wb.active
     ws.title = "Sales Report"
@@ -833,19 +2155,11 @@ async def export_sales_excel(date_from: str, date_to: str, shop_id: str = Depend
     # Save to bytes
     output = io.BytesIO()
     wb.save(output)
-    output.seek(0)
-    
-    return Response(
-        content=output.getvalue(),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=sales_report_{date_from[:10]}_{date_to[:10]}.xlsx"}
-    )
+    return output.getvalue()
+
+def render_inventory_excel(products: List[dict]) -> bytes:
+    from openpyxl import Workbook
 
-@api_router.get("/reports/inventory/excel")
-async def export_inventory_excel(shop_id: str = Depends(get_current_shop)):
-    """Export inventory report as Excel"""
-    products = await db.products.find({"is_active": True}, {"_id": 0}).to_list(1000)
-    
     wb = Workbook()
     ws = wb.active
     ws.title = "Inventory Report"
@@ -867,22 +2181,15 @@ async def export_inventory_excel(shop_id: str = Depends(get_current_shop)):
     
     output = io.BytesIO()
     wb.save(output)
-    output.seek(0)
-    
-    return Response(
-        content=output.getvalue(),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=inventory_report_{datetime.now().strftime('%Y%m%d')}.xlsx"}
-    )
+    return output.getvalue()
+
+def render_sales_pdf(sales: List[dict], date_from: str, date_to: str) -> bytes:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
 
-@api_router.get("/reports/sales/pdf")
-async def export_sales_pdf(date_from: str, date_to: str, shop_id: str = Depends(get_current_shop)):
-    """Export sales report as PDF"""
-    from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-    to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-    
-    sales = await db.sales.find({"created_at": {"$gte": from_date, "$lte": to_date}}, {"_id": 0}).to_list(1000)
-    
     output = io.BytesIO()
     doc = SimpleDocTemplate(output, pagesize=A4)
     elements = []
@@ -924,19 +2231,131 @@ async def export_sales_pdf(date_from: str, date_to: str, shop_id: str = Depends(
     elements.append(table)
     
     doc.build(elements)
-    output.seek(0)
+    return output.getvalue()
+
+# Rendered sales reports for ranges that have fully passed are kept this long and shared by all workers
+REPORT_CACHE_HOURS = float(os.environ.get('REPORT_CACHE_HOURS', '48'))
+# Reports at least this close to MongoDB's 16 MB document limit are not cached
+REPORT_CACHE_MAX_BYTES = 15 * 1024 * 1024
+SALES_REPORT_RENDERERS = {
+    "excel": lambda sales, date_from, date_to: render_sales_excel(sales),
+    "pdf": render_sales_pdf,
+}
+
+def report_cache_key(fmt: str, date_from: str, date_to: str) -> str:
+    return f"sales:{fmt}:{date_from}:{date_to}"
+
+async def sales_report(shop_id: str, fmt: str, date_from: str, date_to: str, in_thread: bool = False) -> bytes:
+    """Rendered sales report, from db.report_cache when the range is over and was rendered before.
+
+    Sales are stamped with the time they are made, so a range that has ended never changes.
+    The key is the raw query strings, since the PDF prints them.
+    """
+    from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+    to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+    key = report_cache_key(fmt, date_from, date_to)
+    cacheable = REPORT_CACHE_HOURS > 0 and as_utc(to_date) < datetime.now(timezone.utc) - timedelta(seconds=DAY_ROLLUP_SETTLE_SECONDS)
+    if cacheable:
+        cached = await db.report_cache.find_one({"shop_id": shop_id, "key": key}, {"_id": 0, "content": 1})
+        if cached is not None:
+            CACHE_EVENTS.labels("report", "hit").inc()
+            return cached["content"]
+        CACHE_EVENTS.labels("report", "miss").inc()
+
+    sales = await find_sales(shop_id, from_date, to_date)
+    # find_sales returns newest first; reports list sales in the order they were made
+    sales.reverse()
+    render = SALES_REPORT_RENDERERS[fmt]
+    with track_report_render("sales", fmt):
+        if in_thread:
+            content = await asyncio.to_thread(render, sales, date_from, date_to)
+        else:
+            content = render(sales, date_from, date_to)
+    if cacheable and len(content) < REPORT_CACHE_MAX_BYTES:
+        await db.report_cache.update_one(
+            {"shop_id": shop_id, "key": key},
+            {"$set": {"content": content, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    return content
+
+@api_router.get("/reports/sales/excel")
+async def export_sales_excel(date_from: str, date_to: str, shop_id: str = Depends(get_current_shop)):
+    """Export sales report as Excel"""
+    content = await sales_report(shop_id, "excel", date_from, date_to)
     
     return Response(
-        content=output.getvalue(),
+        content=content,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f"attachment; filename=sales_report_{date_from[:10]}_{date_to[:10]}.xlsx"}
+    )
+
+@api_router.get("/reports/inventory/excel")
+async def export_inventory_excel(shop_id: str = Depends(get_current_shop)):
+    """Export inventory report as Excel"""
+    products = await db.products.find({"shop_id": shop_id, "is_active": True}, {"_id": 0}).to_list(1000)
+    with track_report_render("inventory", "excel"):
+        content = render_inventory_excel(products)
+    
+    return Response(
+        content=content,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f"attachment; filename=inventory_report_{datetime.now().strftime('%Y%m%d')}.xlsx"}
+    )
+
+@api_router.get("/reports/sales/pdf")
+async def export_sales_pdf(date_from: str, date_to: str, shop_id: str = Depends(get_current_shop)):
+    """Export sales report as PDF"""
+    content = await sales_report(shop_id, "pdf", date_from, date_to)
+    
+    return Response(
+        content=content,
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename=sales_report_{date_from[:10]}_{date_to[:10]}.pdf"}
     )
 
+# The PWA asks for reports by the shop's local day; yesterday's are rendered ahead in this zone
+SHOP_TZ_OFFSET_MINUTES = int(os.environ.get('SHOP_TZ_OFFSET_MINUTES', '345'))  # Nepal, UTC+05:45
+REPORT_WARM_INTERVAL_MINUTES = float(os.environ.get('REPORT_WARM_INTERVAL_MINUTES', '15'))
+
+def js_iso(at: datetime) -> str:
+    """The format of JavaScript's Date.toISOString(), which the PWA sends"""
+    at = as_utc(at).astimezone(timezone.utc)
+    return at.strftime("%Y-%m-%dT%H:%M:%S.") + f"{at.microsecond // 1000:03d}Z"
+
+async def warm_report_cache() -> int:
+    """Render yesterday's sales reports for every shop that sold something; returns reports rendered"""
+    if REPORT_CACHE_HOURS <= 0:
+        return 0
+    now = datetime.now(timezone.utc)
+    offset = timedelta(minutes=SHOP_TZ_OFFSET_MINUTES)
+    today_start = (now + offset).replace(hour=0, minute=0, second=0, microsecond=0) - offset
+    # Same bounds as the PWA's date picker: local midnight to 23:59:59.999
+    day_start, day_end = today_start - timedelta(days=1), today_start - timedelta(milliseconds=1)
+    if day_end >= now - timedelta(seconds=DAY_ROLLUP_SETTLE_SECONDS):
+        return 0
+    date_from, date_to = js_iso(day_start), js_iso(day_end)
+    rendered = 0
+    for shop_id in await db.shop_config.distinct("id"):
+        if not await find_sales(shop_id, day_start, day_end, {"_id": 0, "id": 1}, limit=1):
+            continue
+        for fmt in SALES_REPORT_RENDERERS:
+            key = report_cache_key(fmt, date_from, date_to)
+            if await db.report_cache.find_one({"shop_id": shop_id, "key": key}, {"_id": 1}):
+                continue
+            # Off the event loop, so requests keep being served while a batch of shops renders
+            await sales_report(shop_id, fmt, date_from, date_to, in_thread=True)
+            rendered += 1
+    if rendered:
+        logger.info(f"Warmed {rendered} sales reports for {(day_start + offset).date()}")
+    return rendered
+
 # ============ AI INVENTORY SCANNING ============
 
 class ScanImageRequest(BaseModel):
     image_base64: str
     mode: str = "smart"  # "quick" or "smart"
+    location: Optional[str] = None  # shelf/area being scanned, sharpens the smart-mode shortlist
 
 class DetectedItem(BaseModel):
     name: str
@@ -945,34 +2364,317 @@ class DetectedItem(BaseModel):
     count: int
     confidence: str  # "high", "medium", "low"
     location_hint: Optional[str] = None
+    matches_existing: Optional[str] = None
 
 class ScanResult(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     mode: str
+    location: Optional[str] = None
     detected_items: List[DetectedItem]
     total_items_counted: int
     scan_notes: str
     matched_products: List[dict] = []
+    prompt_stats: dict = {}  # shortlist size, prompt tokens, match rate
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-@api_router.post("/scan/analyze", response_model=ScanResult)
-async def analyze_inventory_image(data: ScanImageRequest, shop_id: str = Depends(get_current_shop)):
-    """Analyze image using GPT-4o to count and identify products"""
-    import openai
-    import json
-    import re
-    
-    # Support both EMERGENT_LLM_KEY and OPENAI_API_KEY
-    api_key = os.environ.get('OPENAI_API_KEY') or os.environ.get('EMERGENT_LLM_KEY')
-    if not api_key:
-        raise HTTPException(status_code=500, detail="AI service not configured. Set OPENAI_API_KEY.")
-    
-    # Get existing products for matching
-    existing_products = await db.products.find({"is_active": True}, {"_id": 0}).to_list(500)
-    product_list = [{"name": p["name_en"], "name_np": p.get("name_np", ""), "category": p["category"]} for p in existing_products]
-    
-    # Build prompt based on mode
-    if data.mode == "quick":
+# Vision provider settings. "stub" answers locally and deterministically (benchmarks, load tests)
+VISION_PROVIDER = os.environ.get('VISION_PROVIDER', 'openai')
+VISION_MODEL = os.environ.get('VISION_MODEL', 'gpt-4o')
+VISION_MAX_TOKENS = int(os.environ.get('VISION_MAX_TOKENS', '2000'))
+VISION_STUB_LATENCY_MS = float(os.environ.get('VISION_STUB_LATENCY_MS', '0'))
+VISION_STUB_ITEMS = int(os.environ.get('VISION_STUB_ITEMS', '5'))
+# Photos are downscaled to this longest side before upload; the model resizes larger ones anyway
+SCAN_IMAGE_MAX_SIDE = int(os.environ.get('SCAN_IMAGE_MAX_SIDE', '2048'))
+
+class VisionReply(BaseModel):
+    text: str
+    prompt_tokens: Optional[int] = None  # as counted by the provider, when it reports usage
+    completion_tokens: Optional[int] = None
+
+class VisionProvider(ABC):
+    """Turns a shop photo plus prompts into the model's raw text reply"""
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, system_prompt: str, user_prompt: str, image_base64: str) -> VisionReply:
+        ...
+
+class OpenAIVisionProvider(VisionProvider):
+    name = "openai"
+
+    def __init__(self, model: str = VISION_MODEL, max_tokens: int = VISION_MAX_TOKENS):
+        self.model = model
+        self.max_tokens = max_tokens
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import openai
+
+            # Support both EMERGENT_LLM_KEY and OPENAI_API_KEY
+            api_key = os.environ.get('OPENAI_API_KEY') or os.environ.get('EMERGENT_LLM_KEY')
+            if not api_key:
+                raise HTTPException(status_code=500, detail="AI service not configured. Set OPENAI_API_KEY.")
+            self._client = openai.OpenAI(api_key=api_key)
+        return self._client
+
+    async def complete(self, system_prompt: str, user_prompt: str, image_base64: str) -> VisionReply:
+        client = self._get_client()
+        # The SDK call is blocking; keep it off the event loop
+        response = await asyncio.to_thread(
+            client.chat.completions.create,
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": user_prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{image_base64}"
+                            }
+                        }
+                    ]
+                }
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=self.max_tokens
+        )
+        usage = response.usage
+        return VisionReply(
+            text=response.choices[0].message.content,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None
+        )
+
+# Fixed catalogue the stub provider "sees"; names line up with typical shop products
+STUB_SCAN_ITEMS = [
+    {"name": "Steel Plate Large", "name_np": "स्टिल थाली ठूलो", "category": "steel", "location_hint": "shelf_top"},
+    {"name": "Steel Glass", "name_np": "स्टिल गिलास", "category": "steel", "location_hint": "shelf_top"},
+    {"name": "Steel Bowl Medium", "name_np": "स्टिल कचौरा मध्यम", "category": "steel", "location_hint": "shelf_bottom"},
+    {"name": "Brass Diya", "name_np": "पीतल दियो", "category": "brass", "location_hint": "front_display"},
+    {"name": "Brass Kalash", "name_np": "पीतल कलश", "category": "brass", "location_hint": "front_display"},
+    {"name": "Plastic Bucket", "name_np": "प्लास्टिक बाल्टिन", "category": "plastic", "location_hint": "storage"},
+    {"name": "Plastic Jug", "name_np": "प्लास्टिक जग", "category": "plastic", "location_hint": "shelf_bottom"},
+    {"name": "Electric Kettle", "name_np": "बिजुली केटली", "category": "electric", "location_hint": "counter"},
+    {"name": "Broom", "name_np": "कुचो", "category": "cleaning", "location_hint": "hanging"},
+    {"name": "Pressure Cooker 5L", "name_np": "प्रेसर कुकर ५ लिटर", "category": "boxed", "location_hint": "storage"},
+]
+
+class StubVisionProvider(VisionProvider):
+    """Offline provider: same image in, same items out, after a configurable delay"""
+    name = "stub"
+
+    def __init__(self, latency_ms: float = VISION_STUB_LATENCY_MS, item_count: int = VISION_STUB_ITEMS):
+        self.latency_ms = latency_ms
+        self.item_count = item_count
+
+    async def complete(self, system_prompt: str, user_prompt: str, image_base64: str) -> VisionReply:
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        digest = hashlib.sha256(image_base64.encode()).digest()
+        start = digest[0] % len(STUB_SCAN_ITEMS)
+        items = []
+        for i in range(min(self.item_count, len(STUB_SCAN_ITEMS))):
+            item = STUB_SCAN_ITEMS[(start + i) % len(STUB_SCAN_ITEMS)]
+            items.append({
+                **item,
+                "count": 1 + digest[(i + 1) % len(digest)] % 30,
+                "confidence": ("high", "medium", "low")[digest[(i + 2) % len(digest)] % 3],
+                "matches_existing": item["name"]
+            })
+        text = json.dumps({
+            "items": items,
+            "total_counted": sum(i["count"] for i in items),
+            "notes": "Stub scan result"
+        }, ensure_ascii=False)
+        return VisionReply(
+            text=text,
+            prompt_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+            completion_tokens=estimate_tokens(text)
+        )
+
+VISION_PROVIDERS = {
+    "openai": OpenAIVisionProvider,
+    "stub": StubVisionProvider,
+}
+
+_vision_provider: Optional[VisionProvider] = None
+
+def get_vision_provider() -> VisionProvider:
+    global _vision_provider
+    if _vision_provider is None:
+        provider_cls = VISION_PROVIDERS.get(VISION_PROVIDER)
+        if provider_cls is None:
+            raise HTTPException(status_code=500, detail=f"Unknown VISION_PROVIDER: {VISION_PROVIDER}")
+        _vision_provider = provider_cls()
+    return _vision_provider
+
+def decode_scan_image(image_base64: str) -> bytes:
+    """Decode the uploaded photo, accepting a bare base64 string or a data URL"""
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.split(",", 1)[-1]
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid image data")
+
+def preprocess_scan_image(raw: bytes) -> str:
+    """Downscale oversized photos and re-encode as JPEG; returns base64 for the provider"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid image data")
+
+    if max(image.size) <= SCAN_IMAGE_MAX_SIDE and image.format == "JPEG":
+        return base64.b64encode(raw).decode()
+
+    # Phone photos carry their rotation in EXIF, which re-encoding would drop
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((SCAN_IMAGE_MAX_SIDE, SCAN_IMAGE_MAX_SIDE))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85)
+    return base64.b64encode(output.getvalue()).decode()
+
+# Smart-mode shortlist: token budget for the product list and the signals used to rank it
+SCAN_PROMPT_TOKEN_BUDGET = int(os.environ.get('SCAN_PROMPT_TOKEN_BUDGET', '1500'))
+# Products considered per scan, each set fetched through an index rather than reading the catalog
+SCAN_CANDIDATE_LIMIT = int(os.environ.get('SCAN_CANDIDATE_LIMIT', '300'))
+SCAN_MATCH_CANDIDATE_LIMIT = int(os.environ.get('SCAN_MATCH_CANDIDATE_LIMIT', '100'))
+SCAN_HISTORY_DEPTH = int(os.environ.get('SCAN_HISTORY_DEPTH', '10'))
+SCAN_VELOCITY_DAYS = int(os.environ.get('SCAN_VELOCITY_DAYS', '30'))
+SCAN_VELOCITY_CACHE_SECONDS = 600
+
+# Fields the scan pipeline needs from each product
+SCAN_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "name_en": 1, "name_np": 1, "category": 1, "location": 1, "quantity": 1}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: ~4 ASCII characters per token, ~2 for Devanagari and other scripts"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return -(-ascii_chars // 4) + -(-(len(text) - ascii_chars) // 2)
+
+# shop_id -> (expires, units sold per product)
+_sales_velocity_cache = {}
+
+async def load_sales_velocity(shop_id: str) -> dict:
+    """Units sold per product over the last SCAN_VELOCITY_DAYS, refreshed every few minutes"""
+    expires, value = _sales_velocity_cache.get(shop_id, (0.0, {}))
+    if expires > time.monotonic():
+        CACHE_EVENTS.labels("sales_velocity", "hit").inc()
+        return value
+    CACHE_EVENTS.labels("sales_velocity", "miss").inc()
+
+    since = datetime.now(timezone.utc) - timedelta(days=SCAN_VELOCITY_DAYS)
+    rows = await sales_collection().aggregate(sales_pipeline([
+        {"$match": {"shop_id": shop_id, "created_at": {"$gte": since}}},
+        {"$unwind": "$items"},
+        {"$group": {"_id": "$items.product_id", "units": {"$sum": "$items.quantity"}}}
+    ])).to_list(None)
+    velocity = {row["_id"]: row["units"] for row in rows}
+    _sales_velocity_cache[shop_id] = (time.monotonic() + SCAN_VELOCITY_CACHE_SECONDS, velocity)
+    return velocity
+
+async def load_shelf_history(shop_id: str, location: Optional[str]) -> dict:
+    """How often each product was matched in recent scans of the same shelf"""
+    if not location:
+        return {}
+    scans = await db.scans.find(
+        {"shop_id": shop_id, "location": location},
+        {"_id": 0, "matched_products.product_id": 1}
+    ).sort("created_at", -1).limit(SCAN_HISTORY_DEPTH).to_list(SCAN_HISTORY_DEPTH)
+    history = {}
+    for scan in scans:
+        for match in scan.get("matched_products", []):
+            history[match["product_id"]] = history.get(match["product_id"], 0) + 1
+    return history
+
+async def load_scan_shortlist(shop_id: str, location: Optional[str]) -> tuple:
+    """(candidates, shelf_history, velocity) for the smart-mode shortlist.
+
+    Candidates are the products stocked at the location, seen on that shelf lately or
+    selling fastest, topped up to SCAN_CANDIDATE_LIMIT so small catalogs are listed whole.
+    """
+    def fetch(query: dict, limit: int):
+        return db.products.find({"shop_id": shop_id, "is_active": True, **query}, SCAN_PRODUCT_PROJECTION).to_list(limit)
+
+    lookups = [load_shelf_history(shop_id, location), load_sales_velocity(shop_id), fetch({}, SCAN_CANDIDATE_LIMIT)]
+    if location:
+        lookups.append(fetch({"location": location}, SCAN_CANDIDATE_LIMIT))
+    shelf_history, velocity, *found = await asyncio.gather(*lookups)
+
+    candidates = {p["id"]: p for products in found for p in products}
+    fastest = sorted(velocity, key=velocity.get, reverse=True)[:SCAN_CANDIDATE_LIMIT]
+    missing = [pid for pid in dict.fromkeys([*shelf_history, *fastest]) if pid not in candidates]
+    if missing:
+        for p in await fetch({"id": {"$in": missing}}, len(missing)):
+            candidates[p["id"]] = p
+    return list(candidates.values()), shelf_history, velocity
+
+async def load_match_candidates(shop_id: str, detected_items: List[DetectedItem], shortlist: List[dict]) -> List[dict]:
+    """Products a detected item could be: the shortlist the model saw, then a text-index
+    search on the detected names, best scoring first"""
+    terms = " ".join(name for item in detected_items for name in (item.name, item.matches_existing) if name)
+    if not terms:
+        return shortlist
+    found = await db.products.find(
+        {"shop_id": shop_id, "is_active": True, "$text": {"$search": terms}},
+        {**SCAN_PRODUCT_PROJECTION, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(SCAN_MATCH_CANDIDATE_LIMIT).to_list(SCAN_MATCH_CANDIDATE_LIMIT)
+    listed = {p["id"] for p in shortlist}
+    return shortlist + [p for p in found if p["id"] not in listed]
+
+def rank_scan_candidates(products: List[dict], location: Optional[str] = None,
+                         shelf_history: Optional[dict] = None, velocity: Optional[dict] = None) -> List[dict]:
+    """Order products by how likely they are to be in the photo.
+
+    Being stocked at the scanned location weighs most, then appearing in recent
+    scans of that shelf, then recent sales. Ties fall back to name order.
+    """
+    shelf_history = shelf_history or {}
+    velocity = velocity or {}
+    max_seen = max(shelf_history.values(), default=0) or 1
+    max_sold = max(velocity.values(), default=0) or 1
+
+    def score(p):
+        return (
+            3.0 * (location is not None and p.get("location") == location)
+            + 2.0 * shelf_history.get(p["id"], 0) / max_seen
+            + 1.0 * velocity.get(p["id"], 0) / max_sold
+        )
+
+    return sorted(products, key=lambda p: (-score(p), p["name_en"]))
+
+def pack_product_shortlist(ranked: List[dict], token_budget: int) -> tuple:
+    """Fit as many ranked products as the budget allows, one compact line each.
+
+    Returns (text, included_count, tokens).
+    """
+    lines = []
+    tokens = 0
+    for p in ranked:
+        line = f"{p['name_en']}|{p.get('name_np') or ''}|{p['category']}"
+        cost = estimate_tokens(line) + 1  # newline
+        if tokens + cost > token_budget:
+            break
+        lines.append(line)
+        tokens += cost
+    return "\n".join(lines), len(lines), tokens
+
+def build_scan_prompts(mode: str, existing_products: List[dict], location: Optional[str] = None,
+                       shelf_history: Optional[dict] = None, velocity: Optional[dict] = None,
+                       token_budget: int = SCAN_PROMPT_TOKEN_BUDGET) -> tuple:
+    """Return (system_prompt, user_prompt, prompt_stats) for the given scan mode"""
+    prompt_stats = {"candidates": len(existing_products), "shortlist_size": 0, "shortlist_tokens": 0}
+    
+    if mode == "quick":
         system_prompt = """You are an inventory counting assistant for a Nepali utensil shop.
 Your task is to COUNT items visible in the image. Focus on accuracy of counts.
 
@@ -990,11 +2692,14 @@ Respond ONLY in this JSON format:
         user_prompt = "Count all visible products in this shop image. Be accurate with counts."
     else:
         # Smart mode - also try to match with existing inventory
+        ranked = rank_scan_candidates(existing_products, location, shelf_history, velocity)
+        shortlist, included, shortlist_tokens = pack_product_shortlist(ranked, token_budget)
+        prompt_stats.update(shortlist_size=included, shortlist_tokens=shortlist_tokens)
         system_prompt = f"""You are an inventory counting assistant for a Nepali utensil shop.
 Your task is to IDENTIFY and COUNT items visible in the image, and match them to existing inventory.
 
-Existing products in shop inventory:
-{product_list[:50]}
+Existing products in shop inventory, most likely first (name|nepali name|category):
+{shortlist}
 
 Categories: steel (utensils), brass (religious items like diya, kalash), plastic, electric, cleaning, boxed, other
 
@@ -1010,110 +2715,1116 @@ Respond ONLY in this JSON format:
     "notes": "Identified items on front display. Pressure cooker boxes visible on top shelf."
 }}"""
         user_prompt = "Identify and count all visible products. Match them to existing inventory if possible. Note their location in the shop."
+        if location:
+            user_prompt += f" This photo was taken at: {location}."
     
+    prompt_stats["prompt_tokens"] = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    return system_prompt, user_prompt, prompt_stats
+
+def parse_scan_response(response_text: str) -> dict:
+    """Pull the JSON object out of the model reply"""
+    # Extract JSON from response
+    json_match = re.search(r'\{[\s\S]*\}', response_text or "")
+    if not json_match:
+        raise HTTPException(status_code=500, detail="Failed to parse AI response")
     try:
-        # Use OpenAI SDK directly
-        client = openai.OpenAI(api_key=api_key)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": user_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{data.image_base64}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2000
-        )
-        
-        response_text = response.choices[0].message.content
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{[\s\S]*\}', response_text)
-        if not json_match:
-            raise HTTPException(status_code=500, detail="Failed to parse AI response")
-        
-        result_data = json.loads(json_match.group())
-        
-        # Build detected items
-        detected_items = []
-        for item in result_data.get("items", []):
-            detected_items.append(DetectedItem(
-                name=item.get("name", "Unknown"),
-                name_np=item.get("name_np"),
-                category=item.get("category", "other"),
-                count=item.get("count", 0),
-                confidence=item.get("confidence", "medium"),
-                location_hint=item.get("location_hint")
-            ))
-        
-        # Match with existing products
-        matched_products = []
-        for item in detected_items:
-            # Find best match in existing products
-            for product in existing_products:
-                if item.name.lower() in product["name_en"].lower() or product["name_en"].lower() in item.name.lower():
-                    matched_products.append({
-                        "detected_name": item.name,
-                        "detected_count": item.count,
-                        "product_id": product["id"],
-                        "product_name": product["name_en"],
-                        "current_stock": product["quantity"],
-                        "difference": item.count - product["quantity"]
-                    })
-                    break
-        
-        scan_result = ScanResult(
-            mode=data.mode,
-            detected_items=detected_items,
-            total_items_counted=result_data.get("total_counted", sum(i.count for i in detected_items)),
-            scan_notes=result_data.get("notes", ""),
-            matched_products=matched_products
-        )
-        
-        # Save scan to database
-        await db.scans.insert_one(scan_result.model_dump())
-        
-        return scan_result
-        
+        return json.loads(json_match.group())
     except json.JSONDecodeError as e:
         logger.error(f"JSON parse error: {e}")
         raise HTTPException(status_code=500, detail="Failed to parse AI response")
+
+def build_detected_items(result_data: dict) -> List[DetectedItem]:
+    detected_items = []
+    for item in result_data.get("items", []):
+        detected_items.append(DetectedItem(
+            name=item.get("name", "Unknown"),
+            name_np=item.get("name_np"),
+            category=item.get("category", "other"),
+            count=item.get("count", 0),
+            confidence=item.get("confidence", "medium"),
+            location_hint=item.get("location_hint"),
+            matches_existing=item.get("matches_existing")
+        ))
+    return detected_items
+
+def match_detected_items(detected_items: List[DetectedItem], existing_products: List[dict]) -> List[dict]:
+    """Pair each detected item with a product.
+
+    The model's own ``matches_existing`` answer or an exact name wins; otherwise the
+    first product whose name contains the detected name (or vice versa) is used.
+    """
+    by_name = {}
+    for product in existing_products:
+        by_name.setdefault(product["name_en"].lower(), product)
+
+    matched_products = []
+    for item in detected_items:
+        detected = item.name.lower()
+        product = by_name.get((item.matches_existing or "").lower()) or by_name.get(detected)
+        if product is None:
+            # Find best match in existing products
+            for candidate in existing_products:
+                name = candidate["name_en"].lower()
+                if detected in name or name in detected:
+                    product = candidate
+                    break
+        if product is not None:
+            matched_products.append({
+                "detected_name": item.name,
+                "detected_count": item.count,
+                "product_id": product["id"],
+                "product_name": product["name_en"],
+                "current_stock": product.get("quantity", 0),
+                "difference": item.count - product.get("quantity", 0)
+            })
+    return matched_products
+
+async def run_inventory_scan(shop_id: str, image_base64: str, mode: str, location: Optional[str] = None,
+                             timings: Optional[dict] = None) -> ScanResult:
+    """Run the full scan pipeline for one image and persist the result.
+
+    When ``timings`` is given it is filled with the milliseconds spent in each stage.
+    """
+    provider = get_vision_provider()
+    started = time.perf_counter()
+    try:
+        scan_result = await _run_scan_stages(provider, shop_id, image_base64, mode, location, timings)
+    except Exception:
+        SCANS.labels(mode, provider.name, "failed").inc()
+        raise
+    SCANS.labels(mode, provider.name, "ok").inc()
+    SCAN_DURATION.labels(provider.name).observe(time.perf_counter() - started)
+    SCAN_PROMPT_TOKENS.labels(mode).observe(scan_result.prompt_stats.get("prompt_tokens", 0))
+    return scan_result
+
+async def _run_scan_stages(provider: VisionProvider, shop_id: str, image_base64: str, mode: str,
+                           location: Optional[str], timings: Optional[dict]) -> ScanResult:
+    if timings is None:
+        timings = {}
+    mark = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[stage] = (now - mark) * 1000
+        mark = now
+
+    raw = decode_scan_image(image_base64)
+    lap("decode")
+    # Pillow work is CPU-bound; keep it off the event loop
+    prepared_image = await asyncio.to_thread(preprocess_scan_image, raw)
+    lap("preprocess")
+
+    # Smart mode lists likely products in the prompt; quick mode only counts
+    if mode == "quick":
+        existing_products, shelf_history, velocity = [], {}, {}
+    else:
+        existing_products, shelf_history, velocity = await load_scan_shortlist(shop_id, location)
+    lap("load_products")
+    system_prompt, user_prompt, prompt_stats = build_scan_prompts(
+        mode, existing_products, location, shelf_history, velocity
+    )
+    lap("prompt")
+
+    try:
+        reply = await provider.complete(system_prompt, user_prompt, prepared_image)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Scan error: {e}")
         raise HTTPException(status_code=500, detail=f"Scan failed: {str(e)}")
+    lap("provider")
+
+    result_data = parse_scan_response(reply.text)
+    detected_items = build_detected_items(result_data)
+    lap("parse")
+
+    # Match with existing products
+    candidates = await load_match_candidates(shop_id, detected_items, existing_products)
+    matched_products = match_detected_items(detected_items, candidates)
+    lap("match")
+
+    prompt_stats.update(
+        provider=provider.name,
+        provider_prompt_tokens=reply.prompt_tokens,
+        completion_tokens=reply.completion_tokens,
+        detected=len(detected_items),
+        matched=len(matched_products),
+        match_rate=round(len(matched_products) / len(detected_items), 3) if detected_items else None
+    )
+    scan_result = ScanResult(
+        mode=mode,
+        location=location,
+        detected_items=detected_items,
+        total_items_counted=result_data.get("total_counted", sum(i.count for i in detected_items)),
+        scan_notes=result_data.get("notes", ""),
+        matched_products=matched_products,
+        prompt_stats=prompt_stats
+    )
+
+    # Save scan to database
+    await db.scans.insert_one(with_shop(scan_result.model_dump(), shop_id))
+    lap("persist")
+
+    return scan_result
+
+@api_router.post("/scan/analyze", response_model=ScanResult)
+async def analyze_inventory_image(data: ScanImageRequest, shop_id: str = Depends(get_current_shop)):
+    """Analyze image with the configured vision provider to count and identify products"""
+    return await run_inventory_scan(shop_id, data.image_base64, data.mode, data.location)
+
+class StockAdjustment(BaseModel):
+    product_id: str
+    new_quantity: int
+
+class StockReconcileRequest(BaseModel):
+    scan_id: Optional[str] = None
+    items: List[StockAdjustment]
+
+class StockAdjustmentResult(BaseModel):
+    product_id: str
+    status: str  # updated, unchanged, not_found
+    old_quantity: Optional[int] = None
+    new_quantity: int
+
+class StockReconcileResponse(BaseModel):
+    scan_id: Optional[str] = None
+    updated: int
+    results: List[StockAdjustmentResult]
+
+async def apply_stock_counts(items: List[StockAdjustment], scan_id: Optional[str], user: User) -> List[StockAdjustmentResult]:
+    """Set counted quantities in one bulk write and log old/new per product to the stock ledger"""
+    # Last count wins if a product appears twice
+    counts = {item.product_id: item.new_quantity for item in items}
+    if not counts:
+        return []
+
+    current = await db.products.find(
+        {"shop_id": user.shop_id, "id": {"$in": list(counts)}},
+        {"_id": 0, "id": 1, "quantity": 1}
+    ).to_list(None)
+    old_quantities = {p["id"]: p.get("quantity", 0) for p in current}
+
+    now = datetime.now(timezone.utc)
+    results = []
+    operations = []
+    ledger = []
+    for product_id, new_quantity in counts.items():
+        if product_id not in old_quantities:
+            results.append(StockAdjustmentResult(product_id=product_id, status="not_found", new_quantity=new_quantity))
+            continue
+        old_quantity = old_quantities[product_id]
+        if old_quantity == new_quantity:
+            results.append(StockAdjustmentResult(product_id=product_id, status="unchanged", old_quantity=old_quantity, new_quantity=new_quantity))
+            continue
+        operations.append(UpdateOne(
+            {"shop_id": user.shop_id, "id": product_id, "quantity": {"$ne": new_quantity}},
+            {"$set": {"quantity": new_quantity, "updated_at": now}}
+        ))
+        # A sale landing between the read and the write makes the delta stale; roll_forward
+        # restarts from quantity_after at counts, so stock history stays exact
+        ledger.append(stock_movement(user.shop_id, product_id, "count", new_quantity - old_quantity, now,
+                                     ref_id=scan_id, user_id=user.id, quantity_after=new_quantity))
+        results.append(StockAdjustmentResult(product_id=product_id, status="updated", old_quantity=old_quantity, new_quantity=new_quantity))
+
+    if operations:
+        # Stock and ledger writes go out together rather than one after the other
+        await asyncio.gather(
+            db.products.bulk_write(operations, ordered=False),
+            record_stock_movements(ledger)
+        )
+        await bump_catalog_version(user.shop_id)
+    return results
+
+@api_router.post("/scan/reconcile", response_model=StockReconcileResponse)
+async def reconcile_stock(data: StockReconcileRequest, user: User = Depends(get_current_user)):
+    """Apply counted quantities (e.g. from a scan or stock-take) in one batch"""
+    results = await apply_stock_counts(data.items, data.scan_id, user)
+    return StockReconcileResponse(
+        scan_id=data.scan_id,
+        updated=sum(1 for r in results if r.status == "updated"),
+        results=results
+    )
 
 @api_router.post("/scan/update-stock")
-async def update_stock_from_scan(updates: List[dict], shop_id: str = Depends(get_current_shop)):
+async def update_stock_from_scan(updates: List[dict], user: User = Depends(get_current_user)):
     """Update product stock based on scan results"""
-    updated = []
-    for update in updates:
-        product_id = update.get("product_id")
-        new_quantity = update.get("new_quantity")
-        
-        if product_id and new_quantity is not None:
-            await db.products.update_one(
-                {"id": product_id},
-                {"$set": {"quantity": new_quantity, "updated_at": datetime.now(timezone.utc)}}
-            )
-            updated.append(product_id)
+    # Entries the scan could not match to a product or a count are skipped
+    try:
+        items = [
+            StockAdjustment(product_id=u["product_id"], new_quantity=u["new_quantity"])
+            for u in updates
+            if u.get("product_id") and u.get("new_quantity") is not None
+        ]
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid stock update: {e.errors()[0]['msg']}")
+    results = await apply_stock_counts(items, None, user)
+    updated = [r.product_id for r in results if r.status != "not_found"]
     
     return {"message": f"Updated {len(updated)} products", "updated_ids": updated}
 
 @api_router.get("/scans", response_model=List[ScanResult])
 async def get_scan_history(limit: int = 10, shop_id: str = Depends(get_current_shop)):
     """Get recent scan history"""
-    scans = await db.scans.find({}, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
-    return [ScanResult(**s) for s in scans]
+    scans = await db.scans.find({"shop_id": shop_id}, model_projection(ScanResult)).sort("created_at", -1).limit(limit).to_list(limit)
+    return fast_list_response(ScanResult, scans)
+
+# ============ SCAN JOBS ============
+
+# Background scan workers per process; 0 disables the worker pool
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', '2'))
+# Idle workers re-check the queue this often, so jobs posted to another process are picked up
+SCAN_JOB_POLL_SECONDS = float(os.environ.get('SCAN_JOB_POLL_SECONDS', '5'))
+# A running job whose worker died is re-queued after this long
+SCAN_JOB_STALE_MINUTES = int(os.environ.get('SCAN_JOB_STALE_MINUTES', '10'))
+SCAN_JOB_MAX_ATTEMPTS = int(os.environ.get('SCAN_JOB_MAX_ATTEMPTS', '3'))
+SCAN_JOB_RETENTION_HOURS = int(os.environ.get('SCAN_JOB_RETENTION_HOURS', '72'))
+
+class ScanJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "pending"  # pending, running, done, failed
+    mode: str = "smart"
+    location: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    result: Optional[ScanResult] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+scan_job_wakeup = asyncio.Event()
+
+async def claim_next_scan_job() -> Optional[dict]:
+    """Atomically take the oldest pending (or abandoned) job off the queue.
+
+    The queue is shared by all shops, so this is the one query not scoped by shop_id.
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = now - timedelta(minutes=SCAN_JOB_STALE_MINUTES)
+    job = await db.scan_jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": "pending"},
+                {"status": "running", "started_at": {"$lt": stale_before}}
+            ],
+            "attempts": {"$lt": SCAN_JOB_MAX_ATTEMPTS}
+        },
+        {"$set": {"status": "running", "started_at": now}, "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        job.pop("_id", None)
+    return job
+
+async def fail_abandoned_scan_jobs():
+    """Give up on jobs that kept dying mid-analysis"""
+    stale_before = datetime.now(timezone.utc) - timedelta(minutes=SCAN_JOB_STALE_MINUTES)
+    try:
+        await db.scan_jobs.update_many(
+            {"status": "running", "started_at": {"$lt": stale_before}, "attempts": {"$gte": SCAN_JOB_MAX_ATTEMPTS}},
+            {
+                "$set": {"status": "failed", "error": "Scan worker stopped repeatedly", "finished_at": datetime.now(timezone.utc)},
+                "$unset": {"image_base64": ""}
+            }
+        )
+    except Exception as e:
+        logger.error(f"Could not expire abandoned scan jobs: {e}")
+
+async def process_scan_job(job: dict):
+    try:
+        scan_result = await run_inventory_scan(job["shop_id"], job["image_base64"], job.get("mode", "smart"), job.get("location"))
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Scan job {job['id']} failed: {detail}")
+        await db.scan_jobs.update_one(
+            {"shop_id": job["shop_id"], "id": job["id"]},
+            {
+                "$set": {"status": "failed", "error": detail, "finished_at": datetime.now(timezone.utc)},
+                "$unset": {"image_base64": ""}
+            }
+        )
+        return
+
+    # The image is only needed until the analysis has run
+    await db.scan_jobs.update_one(
+        {"shop_id": job["shop_id"], "id": job["id"]},
+        {
+            "$set": {"status": "done", "result": scan_result.model_dump(), "finished_at": datetime.now(timezone.utc)},
+            "$unset": {"image_base64": ""}
+        }
+    )
+
+async def scan_job_worker(worker_no: int):
+    while True:
+        # Clear before claiming so a job posted while we look is never missed
+        scan_job_wakeup.clear()
+        try:
+            job = await claim_next_scan_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Scan worker {worker_no} could not claim a job: {e}")
+            job = None
+
+        if job is None:
+            await fail_abandoned_scan_jobs()
+            try:
+                await asyncio.wait_for(scan_job_wakeup.wait(), timeout=SCAN_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await process_scan_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Left "running"; it is retried once it goes stale
+            logger.error(f"Scan worker {worker_no} could not record job {job['id']}: {e}")
+
+@api_router.post("/scan/jobs", response_model=ScanJob, status_code=202)
+async def create_scan_job(data: ScanImageRequest, shop_id: str = Depends(get_current_shop)):
+    """Queue an image for background analysis and return immediately"""
+    job = ScanJob(mode=data.mode, location=data.location)
+    await db.scan_jobs.insert_one({**with_shop(job.model_dump(), shop_id), "image_base64": data.image_base64})
+    scan_job_wakeup.set()
+    return job
+
+@api_router.get("/scan/jobs/{job_id}", response_model=ScanJob)
+async def get_scan_job(job_id: str, shop_id: str = Depends(get_current_shop)):
+    """Poll a queued scan for its status and result"""
+    job = await db.scan_jobs.find_one({"shop_id": shop_id, "id": job_id}, {"_id": 0, "image_base64": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Scan job not found")
+    return ScanJob(**job)
+
+# ============ SCAN RETENTION ============
+
+# Raw scans are deleted by a TTL index after this many days; 0 keeps them forever
+SCAN_RETENTION_DAYS = int(os.environ.get('SCAN_RETENTION_DAYS', '180'))
+# Scans older than this are folded into per-day summaries; 0 disables compaction
+SCAN_COMPACT_AFTER_DAYS = int(os.environ.get('SCAN_COMPACT_AFTER_DAYS', '30'))
+SCAN_COMPACT_INTERVAL_HOURS = float(os.environ.get('SCAN_COMPACT_INTERVAL_HOURS', '24'))
+SCAN_COMPACT_DAYS_PER_RUN = 60
+
+class ScanDailySummary(BaseModel):
+    day: str  # YYYY-MM-DD (UTC)
+    scan_count: int
+    items_counted: int
+    by_mode: dict = {}
+    by_location: dict = {}
+    products: List[dict] = []  # per matched product: scans seen in, last detected count
+    compacted_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+def summarize_scans(day: str, scans: List[dict]) -> ScanDailySummary:
+    by_mode = {}
+    by_location = {}
+    products = {}
+    for scan in sorted(scans, key=lambda s: s["created_at"]):
+        by_mode[scan.get("mode", "smart")] = by_mode.get(scan.get("mode", "smart"), 0) + 1
+        location = scan.get("location") or "unknown"
+        by_location[location] = by_location.get(location, 0) + 1
+        for match in scan.get("matched_products", []):
+            entry = products.setdefault(match["product_id"], {
+                "product_id": match["product_id"], "product_name": match.get("product_name", ""), "scans": 0
+            })
+            entry["scans"] += 1
+            entry["last_count"] = match.get("detected_count")
+    return ScanDailySummary(
+        day=day,
+        scan_count=len(scans),
+        items_counted=sum(s.get("total_items_counted", 0) for s in scans),
+        by_mode=by_mode,
+        by_location=by_location,
+        products=list(products.values())
+    )
+
+async def compact_scan_history(shop_id: Optional[str] = None) -> int:
+    """Fold raw scans older than SCAN_COMPACT_AFTER_DAYS into one summary per shop and day.
+
+    Whole days past the horizon never receive new scans, so a day that already has a
+    summary only needs its leftover raw scans removed; re-running is safe. Without
+    ``shop_id`` every shop is compacted. Returns the number of raw scans removed.
+    """
+    if SCAN_COMPACT_AFTER_DAYS <= 0:
+        return 0
+    horizon = (datetime.now(timezone.utc) - timedelta(days=SCAN_COMPACT_AFTER_DAYS)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    shop_filter = {"shop_id": shop_id} if shop_id else {}
+    days = await db.scans.aggregate([
+        {"$match": {**shop_filter, "created_at": {"$lt": horizon}}},
+        {"$group": {"_id": {
+            "shop_id": "$shop_id",
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+        }}},
+        {"$sort": {"_id.day": 1}},
+        {"$limit": SCAN_COMPACT_DAYS_PER_RUN}
+    ]).to_list(None)
+
+    removed = 0
+    for row in days:
+        row_shop, day = row["_id"]["shop_id"], row["_id"]["day"]
+        day_start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        day_query = {"shop_id": row_shop, "created_at": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}}
+        if not await db.scan_daily_summaries.find_one({"shop_id": row_shop, "day": day}, {"_id": 1}):
+            scans = await db.scans.find(day_query, {
+                "_id": 0, "mode": 1, "location": 1, "total_items_counted": 1, "created_at": 1,
+                "matched_products.product_id": 1, "matched_products.product_name": 1,
+                "matched_products.detected_count": 1
+            }).to_list(None)
+            await db.scan_daily_summaries.insert_one(with_shop(summarize_scans(day, scans).model_dump(), row_shop))
+        result = await db.scans.delete_many(day_query)
+        removed += result.deleted_count
+    if removed:
+        logger.info(f"Compacted {removed} scans from {len(days)} shop-days")
+    return removed
+
+@api_router.get("/scans/daily", response_model=List[ScanDailySummary])
+async def get_scan_daily_summaries(limit: int = 30, shop_id: str = Depends(get_current_shop)):
+    """Get per-day summaries of compacted scan history"""
+    summaries = await db.scan_daily_summaries.find({"shop_id": shop_id}, {"_id": 0}).sort("day", -1).limit(limit).to_list(limit)
+    return [ScanDailySummary(**s) for s in summaries]
+
+@api_router.post("/admin/scans/compact")
+async def run_scan_compaction(user: User = Depends(get_current_user)):
+    """Compact old scans now (owner only)"""
+    if user.role != "owner":
+        raise HTTPException(status_code=403, detail="Only owner can compact scan history")
+    removed = await compact_scan_history(user.shop_id)
+    return {"message": f"Compacted {removed} scans", "removed": removed}
+
+# ============ DATABASE ADMIN ============
+
+async def slow_query_explain_worker():
+    """Re-runs sampled slow commands with explain("executionStats")"""
+    queue = asyncio.Queue(maxsize=100)
+    slow_query_log.attach(asyncio.get_running_loop(), queue)
+    try:
+        while True:
+            entry, command = await queue.get()
+            try:
+                result = await client[entry["database"]].command({"explain": command, "verbosity": "executionStats"})
+                entry["explain"] = {"status": "done", **summarize_explain(result)}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                entry["explain"] = {"status": "failed", "error": str(e)}
+    finally:
+        slow_query_log.attach(None, None)
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(limit: int = 50, user: User = Depends(get_current_user)):
+    """Most recent slow MongoDB commands, newest first (owner only)"""
+    if user.role != "owner":
+        raise HTTPException(status_code=403, detail="Only owner can view slow queries")
+    return {
+        "settings": {
+            "threshold_ms": SLOW_QUERY_MS,
+            "explain_rate": SLOW_QUERY_EXPLAIN_RATE,
+            "buffer_size": SLOW_QUERY_BUFFER_SIZE,
+        },
+        "queries": slow_query_log.recent(max(1, min(limit, SLOW_QUERY_BUFFER_SIZE))),
+    }
+
+@api_router.get("/admin/db/pool")
+async def get_db_pool_stats(user: User = Depends(get_current_user)):
+    """Connection pool settings and live counters (owner/manager)"""
+    if user.role not in ["owner", "manager"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {
+        "settings": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_idle_time_ms": MONGO_MAX_IDLE_TIME_MS,
+            "compressors": available_compressors(MONGO_COMPRESSORS),
+            "server_selection_timeout_ms": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "connect_timeout_ms": MONGO_CONNECT_TIMEOUT_MS,
+            "socket_timeout_ms": MONGO_SOCKET_TIMEOUT_MS or None,
+            "read_preference": MONGO_READ_PREFERENCE,
+        },
+        "servers": pool_monitor.snapshot()
+    }
+
+# ============ METRICS ENDPOINT ============
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+class PoolCollector:
+    """Exposes the connection pool counters as Prometheus gauges at scrape time"""
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        gauges = {}
+        for server_address, stats in pool_monitor.snapshot().items():
+            for name, value in stats.items():
+                if name not in gauges:
+                    gauges[name] = GaugeMetricFamily(f"mongo_pool_{name}", f"Connection pool {name} per server", labels=["server"])
+                gauges[name].add_metric([server_address], value)
+        return list(gauges.values())
+
+def metrics_registry():
+    from prometheus_client import REGISTRY, CollectorRegistry
+    from prometheus_client import multiprocess
+
+    # Under several uvicorn workers, aggregate what every process wrote to PROMETHEUS_MULTIPROC_DIR;
+    # pool gauges are then those of the worker that served the scrape
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector())
+        return registry
+    return REGISTRY
+
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    from prometheus_client import REGISTRY
+    REGISTRY.register(PoolCollector())
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return Response(content=generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+# ============ RESPONSE COMPRESSION ============
+
+# Bodies smaller than this go out as-is; the framing overhead outweighs the saving
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+# Chunks at least this large are compressed on a worker thread instead of the event loop
+COMPRESSION_THREAD_BYTES = int(os.environ.get('COMPRESSION_THREAD_BYTES', str(256 * 1024)))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+# XLSX (zip) and images are already compressed; PDFs still shrink thanks to their fonts and metadata
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/x-ndjson", "application/pdf", "application/javascript",
+    "application/openmetrics-text", "image/svg+xml", "text/",
+)
+
+RESPONSE_BYTES = Counter("http_response_bytes_total", "Response body bytes before and after compression", ["encoding", "stage"])
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+class StreamEncoder:
+    """Incremental gzip/brotli; flushes after every chunk so streamed NDJSON lines arrive promptly"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    async def encode_async(self, data: bytes, final: bool) -> bytes:
+        if len(data) >= COMPRESSION_THREAD_BYTES:
+            return await asyncio.to_thread(self.encode, data, final)
+        return self.encode(data, final)
+
+class CompressionMiddleware:
+    """gzip/brotli for compressible content types above a size threshold"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope["headers"])
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = MutableHeaders(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                passthrough = (
+                    not compressible or encoding is None or "content-encoding" in headers
+                    or message["status"] in (204, 304)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if encoder is None:
+                # A complete small body is not worth compressing
+                if not more_body and len(body) < COMPRESSION_MIN_BYTES:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = StreamEncoder(encoding)
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    compressed = await encoder.encode_async(body, final=True)
+                    headers["Content-Length"] = str(len(compressed))
+                    RESPONSE_BYTES.labels(encoding, "raw").inc(len(body))
+                    RESPONSE_BYTES.labels(encoding, "sent").inc(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(start_message)
+
+            compressed = await encoder.encode_async(body, final=not more_body)
+            RESPONSE_BYTES.labels(encoding, "raw").inc(len(body))
+            RESPONSE_BYTES.labels(encoding, "sent").inc(len(compressed))
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+# ============ CATALOG SNAPSHOT ============
+
+# GET /api/snapshot gives the PWA products, categories, locations and suppliers in one round trip.
+# Catalog writers bump the shop's version once their write has landed, so a snapshot built after
+# reading version N holds everything up to N and can be cached and revalidated under it.
+
+# Shops whose latest snapshot is kept encoded (and compressed) per process
+SNAPSHOT_CACHE_SHOPS = int(os.environ.get('SNAPSHOT_CACHE_SHOPS', '64'))
+
+async def bump_catalog_version(shop_id: str):
+    """Call after a write to products, categories, locations or suppliers has completed"""
+    await db.catalog_versions.update_one({"_id": shop_id}, {"$inc": {"version": 1}}, upsert=True)
+
+async def catalog_version(shop_id: str) -> int:
+    doc = await db.catalog_versions.find_one({"_id": shop_id})
+    return doc["version"] if doc else 0
+
+def columnar(model: type, docs: List[dict]) -> dict:
+    """One array per model field instead of one object per document"""
+    defaults = model_defaults(model)
+    return {
+        "count": len(docs),
+        "columns": {name: [doc.get(name, defaults.get(name)) for doc in docs] for name in model.model_fields},
+    }
+
+async def build_snapshot(shop_id: str, version: int) -> bytes:
+    products, categories, locations, suppliers = await asyncio.gather(
+        db.products.find({"shop_id": shop_id, "is_active": True}, model_projection(Product)).sort("name_en", 1).to_list(None),
+        # Straight from the database: a cached list could predate the version just read
+        load_categories(shop_id),
+        load_locations(shop_id),
+        db.suppliers.find({"shop_id": shop_id, "is_active": True}, model_projection(Supplier)).to_list(None),
+    )
+    return orjson.dumps({
+        "version": version,
+        "generated_at": datetime.now(timezone.utc),
+        "products": columnar(Product, products),
+        "categories": columnar(Category, categories),
+        "locations": columnar(Location, locations),
+        "suppliers": columnar(Supplier, suppliers),
+    })
+
+# shop_id -> (version, {encoding or None: body}), least recently used first
+snapshot_cache: "OrderedDict[str, tuple]" = OrderedDict()
+snapshot_flight = SingleFlight("/api/snapshot", ttl_seconds=0)
+
+@api_router.get("/snapshot")
+async def get_snapshot(request: Request, shop_id: str = Depends(get_current_shop)):
+    """The whole catalog as one versioned, columnar bundle; 304 while the client's copy is current"""
+    version = await catalog_version(shop_id)
+    # Accept-Encoding is added to Vary by the compression middleware
+    headers = {"ETag": f'W/"{shop_id}-{version}"', "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if headers["ETag"] in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    entry = snapshot_cache.get(shop_id)
+    if entry is not None and entry[0] == version:
+        CACHE_EVENTS.labels("snapshot", "hit").inc()
+        snapshot_cache.move_to_end(shop_id)
+    else:
+        CACHE_EVENTS.labels("snapshot", "miss").inc()
+        raw = await snapshot_flight.run((shop_id, version), lambda: build_snapshot(shop_id, version))
+        entry = (version, {None: raw})
+        current = snapshot_cache.get(shop_id)
+        # A slower request for an older version must not replace a newer entry
+        if current is None or current[0] <= version:
+            snapshot_cache[shop_id] = entry
+            snapshot_cache.move_to_end(shop_id)
+            while len(snapshot_cache) > SNAPSHOT_CACHE_SHOPS:
+                snapshot_cache.popitem(last=False)
+
+    bodies = entry[1]
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if len(bodies[None]) < COMPRESSION_MIN_BYTES:
+        encoding = None
+    if encoding not in bodies:
+        bodies[encoding] = await StreamEncoder(encoding).encode_async(bodies[None], final=True)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        RESPONSE_BYTES.labels(encoding, "raw").inc(len(bodies[None]))
+        RESPONSE_BYTES.labels(encoding, "sent").inc(len(bodies[encoding]))
+    return Response(content=bodies[encoding], media_type="application/json", headers=headers)
+
+# ============ ADMISSION CONTROL ============
+
+# Keeps a burst of exports or AI scans from starving checkout on the same worker.
+# Every request gets a cost class from COST_CLASS_RULES: critical requests are never
+# limited, normal and heavy ones spend a per-user token bucket, and heavy ones also
+# need one of ADMISSION_HEAVY_CONCURRENCY slots. Limits are per process.
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'true').lower() == 'true'
+# Sustained requests per second and burst size for each user's normal requests
+ADMISSION_NORMAL_RATE = float(os.environ.get('ADMISSION_NORMAL_RATE', '10'))
+ADMISSION_NORMAL_BURST = float(os.environ.get('ADMISSION_NORMAL_BURST', '40'))
+# Heavy requests per minute and burst size for each user
+ADMISSION_HEAVY_PER_MINUTE = float(os.environ.get('ADMISSION_HEAVY_PER_MINUTE', '6'))
+ADMISSION_HEAVY_BURST = float(os.environ.get('ADMISSION_HEAVY_BURST', '3'))
+# Heavy requests served at once; the next one waits up to ADMISSION_HEAVY_QUEUE_SECONDS for a slot
+ADMISSION_HEAVY_CONCURRENCY = int(os.environ.get('ADMISSION_HEAVY_CONCURRENCY', '2'))
+ADMISSION_HEAVY_QUEUE_SECONDS = float(os.environ.get('ADMISSION_HEAVY_QUEUE_SECONDS', '1'))
+# Retry-After sent when heavy work is shed because every slot is busy
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '5'))
+# Buckets kept per cost class before idle (full) ones are dropped
+ADMISSION_MAX_BUCKETS = int(os.environ.get('ADMISSION_MAX_BUCKETS', '10000'))
+
+# (cost class, method or None for any, path regex); the first match wins, anything else is normal
+COST_CLASS_RULES = [
+    # Preflights carry no token and are answered by CORS; limiting them would shed checkout by client IP
+    ("critical", "OPTIONS", r".*"),
+    ("critical", "POST", r"/api/sales"),
+    ("critical", None, r"/api/health/.*"),
+    ("critical", None, r"/metrics"),
+    ("heavy", "GET", r"/api/reports/.*"),
+    ("heavy", "POST", r"/api/scan/analyze"),
+    ("heavy", "POST", r"/api/scan/jobs"),
+    ("heavy", "POST", r"/api/admin/.*"),
+    ("heavy", "GET", r"/api/stock/at"),
+]
+_COST_CLASS_PATTERNS = [(cost_class, method, re.compile(path)) for cost_class, method, path in COST_CLASS_RULES]
+
+ADMISSION_DECISIONS = Counter("admission_decisions_total", "Admission decisions by cost class", ["cost_class", "decision"])
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Admitted requests being served by cost class", ["cost_class"])
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds", "Time heavy requests waited for a concurrency slot", buckets=LATENCY_BUCKETS
+)
+ADMISSION_BUCKETS = Gauge("admission_buckets", "Per-user token buckets held by this process", ["cost_class"])
+
+def cost_class(method: str, path: str) -> str:
+    for name, rule_method, pattern in _COST_CLASS_PATTERNS:
+        if (rule_method is None or rule_method == method) and pattern.fullmatch(path):
+            return name
+    return "normal"
+
+class TokenBuckets:
+    """One token bucket per key; take() returns 0 when admitted, else seconds until a token is due"""
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def take(self, key: str) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            self.buckets[key] = (tokens, now)
+            wait = (1 - tokens) / self.rate
+        if len(self.buckets) > ADMISSION_MAX_BUCKETS:
+            self.prune(now)
+        ADMISSION_BUCKETS.labels(self.name).set(len(self.buckets))
+        return wait
+
+    def prune(self, now: float):
+        """Forget buckets that have refilled; they would start full anyway"""
+        self.buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self.buckets.items()
+            if tokens + (now - updated) * self.rate < self.burst
+        }
+
+def admission_key(scope) -> str:
+    """The user from a valid bearer token, otherwise the client address"""
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+    if authorization.startswith("Bearer "):
+        try:
+            user_id = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("user_id")
+            if user_id:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+class AdmissionMiddleware:
+    """Sheds normal and heavy requests with 429 and Retry-After once a user or the heavy slots are saturated"""
+
+    def __init__(self, app):
+        self.app = app
+        self.buckets = {
+            "normal": TokenBuckets("normal", ADMISSION_NORMAL_RATE, ADMISSION_NORMAL_BURST),
+            "heavy": TokenBuckets("heavy", ADMISSION_HEAVY_PER_MINUTE / 60, ADMISSION_HEAVY_BURST),
+        }
+        self.heavy_slots = None
+
+    async def reject(self, scope, receive, send, name: str, decision: str, retry_after: float, detail: str):
+        ADMISSION_DECISIONS.labels(name, decision).inc()
+        response = ORJSONResponse(
+            status_code=429, content={"detail": detail}, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_CONTROL:
+            await self.app(scope, receive, send)
+            return
+
+        name = cost_class(scope["method"], scope["path"])
+        if name != "critical":
+            wait = self.buckets[name].take(admission_key(scope))
+            if wait:
+                await self.reject(scope, receive, send, name, "rate_limited", wait, "Too many requests, please retry shortly")
+                return
+
+        slot = None
+        if name == "heavy":
+            # Created on first use so it belongs to the serving event loop
+            if self.heavy_slots is None:
+                self.heavy_slots = asyncio.Semaphore(ADMISSION_HEAVY_CONCURRENCY)
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.heavy_slots.acquire(), ADMISSION_HEAVY_QUEUE_SECONDS)
+            except asyncio.TimeoutError:
+                await self.reject(scope, receive, send, name, "overloaded", ADMISSION_RETRY_AFTER_SECONDS,
+                                  "Server busy with reports and scans, please retry shortly")
+                return
+            finally:
+                ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - started)
+            slot = self.heavy_slots
+
+        ADMISSION_DECISIONS.labels(name, "admitted").inc()
+        in_flight = ADMISSION_IN_FLIGHT.labels(name)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.dec()
+            if slot is not None:
+                slot.release()
+
+# ============ HEALTH ============
+
+# Delay between readiness attempts while MongoDB is unreachable
+READINESS_RETRY_SECONDS = float(os.environ.get('READINESS_RETRY_SECONDS', '5'))
+# How many shops get their catalog caches filled before the worker reports ready
+READINESS_PRIME_SHOPS = int(os.environ.get('READINESS_PRIME_SHOPS', '50'))
+
+STARTED_AT = time.monotonic()
+readiness = {"ready": False, "attempts": 0, "steps": [], "total_ms": None, "error": None}
+
+async def prepare_readiness():
+    """Ping, pre-warm the pool, check indexes and prime caches; each step is timed for the report"""
+
+    async def warm_pool():
+        # Concurrent pings make the driver open minPoolSize connections now rather than on first use
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+        return {"connections": max(1, MONGO_MIN_POOL_SIZE)}
+
+    async def prime_caches():
+        # Only the first few shops; the rest fill their caches on first request
+        shop_ids = (await db.shop_config.distinct("id"))[:READINESS_PRIME_SHOPS]
+        for shop_id in shop_ids:
+            for cache in CATALOG_CACHES:
+                await cache.get(shop_id)
+        return {"shops": len(shop_ids)}
+
+    steps = [
+        ("mongo_ping", lambda: client.admin.command("ping")),
+        ("pool_warm", warm_pool),
+        ("indexes", ensure_indexes),
+        ("catalog_cache", prime_caches),
+    ]
+    readiness.update(ready=False, attempts=0)
+    while True:
+        readiness["attempts"] += 1
+        report = []
+        started = time.perf_counter()
+        try:
+            for name, step in steps:
+                step_started = time.perf_counter()
+                result = await step()
+                entry = {"step": name, "ms": round((time.perf_counter() - step_started) * 1000, 1)}
+                if isinstance(result, dict) and name != "mongo_ping":
+                    entry["detail"] = result
+                report.append(entry)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            readiness.update(steps=report, error=f"{name}: {e}")
+            logger.warning(f"Not ready yet ({name} failed: {e}); retrying in {READINESS_RETRY_SECONDS:.0f}s")
+            await asyncio.sleep(READINESS_RETRY_SECONDS)
+            continue
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        readiness.update(ready=True, steps=report, total_ms=total_ms, error=None)
+        logger.info(f"Ready in {total_ms:.0f} ms: " + ", ".join(f"{e['step']} {e['ms']:.0f} ms" for e in report))
+        return
+
+@api_router.get("/health/live")
+async def health_live():
+    """The process is up and serving; says nothing about MongoDB"""
+    return {"status": "ok", "uptime_seconds": round(time.monotonic() - STARTED_AT, 1)}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """200 once warm-up has finished, 503 with the partial report until then"""
+    body = {"status": "ready" if readiness["ready"] else "starting", **readiness}
+    return ORJSONResponse(body, status_code=200 if readiness["ready"] else 503)
+
+# ============ SCHEDULER ============
+
+# Periodic jobs run in every worker's event loop; a lease document per job in db.scheduled_jobs
+# makes sure only one process runs each job per interval. Each job's interval setting sits
+# with its code; 0 (or the feature being disabled) turns the job off.
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+# How often each worker checks whether a job is due
+SCHEDULER_POLL_SECONDS = float(os.environ.get('SCHEDULER_POLL_SECONDS', '60'))
+# A lease is renewed while its job runs; one left by a dead process expires after this
+SCHEDULER_LEASE_SECONDS = float(os.environ.get('SCHEDULER_LEASE_SECONDS', '300'))
+
+JOB_DURATION_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+SCHEDULED_JOB_RUNS = Counter("scheduled_job_runs_total", "Scheduled job runs by outcome", ["job", "status"])
+SCHEDULED_JOB_DURATION = Histogram("scheduled_job_duration_seconds", "Scheduled job run time", ["job"], buckets=JOB_DURATION_BUCKETS)
+
+class ScheduledJob:
+    def __init__(self, name: str, run, interval_seconds: float, enabled: bool = True):
+        self.name = name
+        self.run = run
+        self.interval_seconds = interval_seconds
+        self.enabled = enabled and interval_seconds > 0
+
+SCHEDULED_JOBS = [
+    ScheduledJob("day_rollup", rollup_sales_days, DAY_ROLLUP_INTERVAL_MINUTES * 60, enabled=DAY_ROLLUP_DAYS > 0),
+    ScheduledJob("report_warm", warm_report_cache, REPORT_WARM_INTERVAL_MINUTES * 60, enabled=REPORT_CACHE_HOURS > 0),
+    ScheduledJob("low_stock_refresh", refresh_low_stock_flags, LOW_STOCK_REFRESH_INTERVAL_MINUTES * 60),
+    ScheduledJob("scan_compaction", compact_scan_history, SCAN_COMPACT_INTERVAL_HOURS * 3600,
+                 enabled=SCAN_COMPACT_AFTER_DAYS > 0),
+    # Checks hourly; each shop is snapshotted once its latest snapshot is an interval old
+    ScheduledJob("stock_snapshot", take_due_stock_snapshots, min(STOCK_SNAPSHOT_INTERVAL_HOURS * 3600, 3600)),
+    ScheduledJob("sales_archive", archive_sales, SALES_ARCHIVE_INTERVAL_HOURS * 3600, enabled=SALES_ARCHIVE_AFTER_DAYS > 0),
+]
+
+async def acquire_job_lease(job: ScheduledJob) -> bool:
+    """Take the job's lease if it is due and nobody holds it; claims the next run at the same time"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.scheduled_jobs.find_one_and_update(
+            {"_id": job.name, "next_run_at": {"$lte": now}, "lease_until": {"$lte": now}},
+            {"$set": {
+                "owner": PROCESS_ID, "lease_until": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS),
+                "next_run_at": now + timedelta(seconds=job.interval_seconds), "last_started_at": now,
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The document exists but is not due or is leased elsewhere
+        return False
+    return True
+
+async def renew_job_lease(job: ScheduledJob):
+    while True:
+        await asyncio.sleep(SCHEDULER_LEASE_SECONDS / 3)
+        await db.scheduled_jobs.update_one(
+            {"_id": job.name, "owner": PROCESS_ID},
+            {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=SCHEDULER_LEASE_SECONDS)}}
+        )
+
+async def execute_job(job: ScheduledJob):
+    started = time.perf_counter()
+    renewer = asyncio.create_task(renew_job_lease(job))
+    status, result, error = "ok", None, None
+    try:
+        result = await job.run()
+    except asyncio.CancelledError:
+        # Shutting down; the lease runs out and another process picks the job up
+        raise
+    except Exception as e:
+        status, error = "error", str(e)
+        logger.error(f"Scheduled job {job.name} failed: {e}")
+    finally:
+        renewer.cancel()
+    duration = time.perf_counter() - started
+    SCHEDULED_JOB_RUNS.labels(job.name, status).inc()
+    SCHEDULED_JOB_DURATION.labels(job.name).observe(duration)
+    now = datetime.now(timezone.utc)
+    await db.scheduled_jobs.update_one({"_id": job.name, "owner": PROCESS_ID}, {
+        "$set": {"lease_until": now, "last_finished_at": now, "last_status": status, "last_result": result,
+                 "last_error": error, "last_duration_ms": round(duration * 1000, 1)},
+        "$inc": {"runs": 1},
+    })
+
+async def scheduler_loop(job: ScheduledJob):
+    # Jobs rely on the indexes built during readiness
+    while not readiness["ready"]:
+        await asyncio.sleep(READINESS_RETRY_SECONDS)
+    while True:
+        try:
+            if await acquire_job_lease(job):
+                await execute_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Scheduler could not run {job.name}: {e}")
+        # Jitter keeps workers started together from polling in lockstep
+        await asyncio.sleep(min(job.interval_seconds, SCHEDULER_POLL_SECONDS) * random.uniform(0.8, 1.2))
+
+@api_router.get("/admin/jobs")
+async def get_scheduled_jobs(user: User = Depends(get_current_user)):
+    """Last run, timing and next run of each scheduled job (owner only)"""
+    if user.role != "owner":
+        raise HTTPException(status_code=403, detail="Only owner can view scheduled jobs")
+    state = {doc["_id"]: doc for doc in await db.scheduled_jobs.find({}).to_list(None)}
+    jobs = []
+    for job in SCHEDULED_JOBS:
+        doc = state.get(job.name, {})
+        doc.pop("_id", None)
+        jobs.append({"name": job.name, "enabled": job.enabled, "interval_seconds": job.interval_seconds, **doc})
+    return jobs
 
 # ============ ROOT ============
 
@@ -1136,17 +3847,114 @@ if cors_origins == '*':
 else:
     allowed_origins = [origin.strip() for origin in cors_origins.split(',')]
 
+# Inside CORS, so shed responses carry the CORS headers the PWA needs to read them
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=allowed_origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
+app.add_middleware(CompressionMiddleware)
+# Outermost, so latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+background_tasks: List[asyncio.Task] = []
+
+# Report and scan libraries are imported lazily; warm them up in the background once the app
+# is serving, so neither the cold start nor the first report download pays for them
+IMPORT_WARMUP = os.environ.get('IMPORT_WARMUP', 'true').lower() == 'true'
+IMPORT_WARMUP_DELAY_SECONDS = float(os.environ.get('IMPORT_WARMUP_DELAY_SECONDS', '5'))
+WARMUP_MODULES = ["openpyxl", "reportlab.platypus", "reportlab.lib.styles", "PIL.Image"]
+
+async def warm_up_imports():
+    await asyncio.sleep(IMPORT_WARMUP_DELAY_SECONDS)
+    modules = WARMUP_MODULES + (["openai"] if VISION_PROVIDER == "openai" else [])
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(importlib.import_module, name)
+        except ImportError as e:
+            logger.warning(f"Warm-up import of {name} failed: {e}")
+            continue
+        logger.info(f"Warmed up {name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+async def ensure_ttl_index(collection, field: str, expire_seconds: int):
+    """Single-field index on ``field`` that expires documents after ``expire_seconds`` (0 = never)"""
+    name = f"{field}_1"
+    existing = (await collection.index_information()).get(name)
+    if existing is not None:
+        if existing.get("expireAfterSeconds") == (expire_seconds or None):
+            return
+        if expire_seconds and "expireAfterSeconds" in existing:
+            await db.command({"collMod": collection.name, "index": {"name": name, "expireAfterSeconds": expire_seconds}})
+            return
+        await collection.drop_index(name)
+    if expire_seconds:
+        await collection.create_index(field, expireAfterSeconds=expire_seconds)
+    else:
+        await collection.create_index(field)
+
+async def ensure_indexes():
+    # Every tenant query leads with shop_id, so one shop's data is a contiguous range
+    await db.shop_config.create_index("id", unique=True)
+    for name in ("users", "categories", "locations", "products", "suppliers"):
+        await db[name].create_index([("shop_id", 1), ("id", 1)], unique=True)
+    await db.users.create_index("id")  # token lookups resolve the user before the shop
+    await db.products.create_index([("shop_id", 1), ("is_active", 1), ("location", 1)])
+    # Low-stock alerts read flagged products plus those changed since the last flag refresh
+    await db.products.create_index([("shop_id", 1), ("low_stock", 1)], partialFilterExpression={"low_stock": True})
+    await db.products.create_index([("shop_id", 1), ("updated_at", 1)])
+    # Scan matching looks detected names up by word; no stemming or stop words, names are mixed-language
+    await db.products.create_index([("shop_id", 1), ("name_en", "text"), ("name_np", "text")], default_language="none")
+    await ensure_sales_storage()
+    await db.sales_archive.create_index([("shop_id", 1), ("created_at", -1)])
+    # Also the $merge key for archival
+    await db.sales_daily_summaries.create_index([("shop_id", 1), ("day", 1)], unique=True)
+    await db.sales_rollups.create_index([("shop_id", 1), ("day", 1)], unique=True)
+    # Rollups are only read inside the window, so they expire a week after leaving it
+    await ensure_ttl_index(db.sales_rollups, "rolled_at", (DAY_ROLLUP_DAYS + 7) * 86400)
+    await db.report_cache.create_index([("shop_id", 1), ("key", 1)], unique=True)
+    await ensure_ttl_index(db.report_cache, "created_at", int(REPORT_CACHE_HOURS * 3600))
+    await db.purchases.create_index([("shop_id", 1), ("created_at", -1)])
+    await db.purchases.create_index([("shop_id", 1), ("supplier_id", 1), ("created_at", -1)])
+    # The TTL index stays single-field: TTL indexes cannot be compound
+    await ensure_ttl_index(db.scans, "created_at", SCAN_RETENTION_DAYS * 86400)
+    await db.scans.create_index([("shop_id", 1), ("created_at", -1)])
+    await db.scans.create_index([("shop_id", 1), ("location", 1), ("created_at", -1)])
+    await db.scan_daily_summaries.create_index([("shop_id", 1), ("day", 1)], unique=True)
+    await db.stock_movements.create_index([("shop_id", 1), ("product_id", 1), ("created_at", 1)])
+    await db.stock_movements.create_index([("shop_id", 1), ("created_at", 1)])
+    await db.stock_movements.create_index([("shop_id", 1), ("ref_id", 1)], sparse=True)
+    await db.stock_snapshots.create_index([("shop_id", 1), ("as_of", 1), ("product_id", 1)])
+    await db.scan_jobs.create_index([("shop_id", 1), ("id", 1)], unique=True)
+    # The job queue is claimed across shops
+    await db.scan_jobs.create_index([("status", 1), ("created_at", 1)])
+    await ensure_ttl_index(db.scan_jobs, "finished_at", SCAN_JOB_RETENTION_HOURS * 3600)
+
+async def start_background_workers():
+    # Index checks run as part of readiness, so the app accepts connections right away
+    background_tasks.append(asyncio.create_task(prepare_readiness()))
+    background_tasks.append(asyncio.create_task(invalidation_listener()))
+    for worker_no in range(SCAN_WORKERS):
+        background_tasks.append(asyncio.create_task(scan_job_worker(worker_no)))
+    if SCHEDULER_ENABLED:
+        for job in SCHEDULED_JOBS:
+            if job.enabled:
+                background_tasks.append(asyncio.create_task(scheduler_loop(job)))
+    if SLOW_QUERY_MS and SLOW_QUERY_EXPLAIN_RATE > 0:
+        background_tasks.append(asyncio.create_task(slow_query_explain_worker()))
+    if IMPORT_WARMUP:
+        background_tasks.append(asyncio.create_task(warm_up_imports()))
+
+async def stop_background_workers():
+    # Interrupted jobs stay "running" and are re-queued once they go stale
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
@@ -0,0 +1,302 @@
+"""Cache invalidation bus: CatalogCache plus publish_invalidation / invalidation_listener.
+
+The bus tails a capped collection, which mongomock cannot do, so these tests run the
+listener against a small in-memory collection with a tailable-await cursor.
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+# A remote invalidation must reach the other process well within this
+PROPAGATION_BOUND_SECONDS = 1.0
+
+
+class FakeTailableCursor:
+    """Yields messages after ``since``, then waits briefly for more like TAILABLE_AWAIT"""
+
+    def __init__(self, collection, since):
+        self.collection = collection
+        self.position = sum(1 for doc in collection.docs if doc["_id"] <= since)
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.collection.fail_reads:
+            self.collection.fail_reads -= 1
+            self.alive = False
+            self.collection.on_failed_read()
+            raise AutoReconnect("connection closed")
+        if self.position >= len(self.collection.docs):
+            self.collection.arrived.clear()
+            try:
+                await asyncio.wait_for(self.collection.arrived.wait(), 0.05)
+            except asyncio.TimeoutError:
+                raise StopAsyncIteration
+        if self.position >= len(self.collection.docs):
+            raise StopAsyncIteration
+        doc = self.collection.docs[self.position]
+        self.position += 1
+        return doc
+
+
+class FakeInvalidations:
+    def __init__(self):
+        self.docs = []
+        self.arrived = asyncio.Event()
+        self.cursors = []
+        # Number of upcoming cursor reads that fail as if the connection dropped
+        self.fail_reads = 0
+        self.on_failed_read = lambda: None
+
+    async def insert_one(self, doc):
+        doc = {"_id": ObjectId(), **doc}
+        self.docs.append(doc)
+        self.arrived.set()
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    def find(self, query, cursor_type=None):
+        assert cursor_type == server.CursorType.TAILABLE_AWAIT
+        cursor = FakeTailableCursor(self, query["_id"]["$gt"])
+        self.cursors.append(cursor)
+        return cursor
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.invalidations = FakeInvalidations()
+
+    async def create_collection(self, name, **kwargs):
+        raise server.CollectionInvalid(f"collection {name} already exists")
+
+
+class FakeClock:
+    """Stands in for the time module in server; monotonic() only moves when advanced"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class Process:
+    """The per-process state one uvicorn worker would hold"""
+
+    def __init__(self, loads):
+        self.process_id = uuid.uuid4().hex
+
+        async def load_categories(shop_id):
+            loads.append((self.process_id, shop_id))
+            return [{"shop_id": shop_id, "load": len(loads)}]
+
+        self.category_cache = server.CatalogCache("categories", load_categories)
+        self.caches = {self.category_cache.name: self.category_cache}
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "INVALIDATION_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(server, "invalidation_state",
+                        {"connected": False, "received": 0, "published": 0, "last_error": None})
+    return database
+
+
+def use_process(monkeypatch, process):
+    monkeypatch.setattr(server, "PROCESS_ID", process.process_id)
+    monkeypatch.setattr(server, "CACHES", process.caches)
+
+
+async def wait_for(condition, timeout=PROPAGATION_BOUND_SECONDS):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+async def start_listener():
+    task = asyncio.create_task(server.invalidation_listener())
+    assert await wait_for(lambda: server.invalidation_state["connected"])
+    return task
+
+
+async def stop_listener(task):
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_invalidate_drops_key_and_reloads():
+    loads = []
+    cache = Process(loads).category_cache
+
+    async def scenario():
+        first = await cache.get("shop-a")
+        assert await cache.get("shop-a") is first
+        await cache.get("shop-b")
+        cache.invalidate("shop-a")
+        assert await cache.get("shop-a") is not first
+        assert len(loads) == 3
+        cache.invalidate()
+        await cache.get("shop-b")
+        assert len(loads) == 4
+
+    asyncio.run(scenario())
+
+
+def test_load_racing_invalidation_is_not_cached():
+    started = asyncio.Event()
+    release = asyncio.Event()
+    loads = []
+
+    async def slow_loader(shop_id):
+        loads.append(shop_id)
+        started.set()
+        await release.wait()
+        return {"load": len(loads)}
+
+    cache = server.CatalogCache("categories", slow_loader)
+
+    async def scenario():
+        pending = asyncio.create_task(cache.get("shop-a"))
+        await started.wait()
+        cache.invalidate("shop-a")
+        release.set()
+        # The caller still gets its value, but the next read goes back to the loader
+        assert await pending == {"load": 1}
+        assert await cache.get("shop-a") == {"load": 2}
+
+    asyncio.run(scenario())
+
+
+def test_publish_reaches_other_process_within_bound(bus, monkeypatch):
+    loads = []
+    writer, reader = Process(loads), Process(loads)
+
+    async def scenario():
+        use_process(monkeypatch, reader)
+        listener = await start_listener()
+        await reader.category_cache.get("shop-a")
+        await reader.category_cache.get("shop-b")
+
+        use_process(monkeypatch, writer)
+        await writer.category_cache.get("shop-a")
+        await server.publish_invalidation("categories", "shop-a")
+        use_process(monkeypatch, reader)
+
+        assert await wait_for(lambda: "shop-a" not in reader.category_cache._entries)
+        assert "shop-b" in reader.category_cache._entries
+        assert server.invalidation_state["received"] == 1
+        await stop_listener(listener)
+
+    asyncio.run(scenario())
+
+
+def test_own_messages_are_not_applied_twice(bus, monkeypatch):
+    process = Process([])
+
+    async def scenario():
+        use_process(monkeypatch, process)
+        listener = await start_listener()
+        await server.publish_invalidation("categories", "shop-a")
+        generation = process.category_cache._generation
+        await asyncio.sleep(0.1)
+        assert process.category_cache._generation == generation
+        assert server.invalidation_state["published"] == 1
+        assert server.invalidation_state["received"] == 0
+        await stop_listener(listener)
+
+    asyncio.run(scenario())
+
+
+def test_listener_restarts_after_cursor_error(bus, monkeypatch):
+    loads = []
+    writer, reader = Process(loads), Process(loads)
+
+    async def scenario():
+        use_process(monkeypatch, reader)
+        listener = await start_listener()
+        bus.invalidations.fail_reads = 1
+        # Wake the cursor so the failing read happens now
+        bus.invalidations.arrived.set()
+        assert await wait_for(lambda: server.invalidation_state["last_error"] is not None)
+        assert await wait_for(lambda: len(bus.invalidations.cursors) == 2)
+        assert await wait_for(lambda: server.invalidation_state["connected"])
+        assert server.invalidation_state["last_error"] is None
+
+        await reader.category_cache.get("shop-a")
+        use_process(monkeypatch, writer)
+        await server.publish_invalidation("categories", "shop-a")
+        use_process(monkeypatch, reader)
+        assert await wait_for(lambda: "shop-a" not in reader.category_cache._entries)
+        await stop_listener(listener)
+
+    asyncio.run(scenario())
+
+
+def test_listener_restarts_after_cursor_dies(bus, monkeypatch):
+    process = Process([])
+
+    async def scenario():
+        use_process(monkeypatch, process)
+        listener = await start_listener()
+        bus.invalidations.cursors[0].alive = False
+        assert await wait_for(lambda: len(bus.invalidations.cursors) == 2)
+        assert await wait_for(lambda: server.invalidation_state["connected"])
+        await stop_listener(listener)
+
+    asyncio.run(scenario())
+
+
+# The listener replays INVALIDATION_REPLAY_SECONDS of messages after reconnecting and keeps a
+# second of that as margin, so an outage of window - 1 s or more may have lost messages
+@pytest.mark.parametrize("outage_seconds, cleared", [
+    (server.INVALIDATION_REPLAY_SECONDS - 1.5, False),
+    (server.INVALIDATION_REPLAY_SECONDS - 0.5, True),
+    (server.INVALIDATION_REPLAY_SECONDS + 0.5, True),
+])
+def test_outage_longer_than_replay_window_clears_caches(bus, monkeypatch, outage_seconds, cleared):
+    process = Process([])
+    clock = FakeClock()
+    monkeypatch.setattr(server, "time", clock)
+    # The connection drops and stays down for outage_seconds before the listener retries
+    bus.invalidations.on_failed_read = lambda: clock.advance(outage_seconds)
+
+    async def scenario():
+        use_process(monkeypatch, process)
+        listener = await start_listener()
+        await process.category_cache.get("shop-a")
+        bus.invalidations.fail_reads = 1
+        bus.invalidations.arrived.set()
+        assert await wait_for(lambda: len(bus.invalidations.cursors) == 2)
+        assert await wait_for(lambda: server.invalidation_state["connected"])
+        assert ("shop-a" not in process.category_cache._entries) == cleared
+        await stop_listener(listener)
+
+    asyncio.run(scenario())
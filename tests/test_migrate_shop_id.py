@@ -0,0 +1,70 @@
+"""migrate_shop_id.py on a database shaped like the single-shop release, then logging in."""
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+import migrate_shop_id  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(server, "create_mongo_client", lambda: client)
+    monkeypatch.setattr(server, "ADMISSION_CONTROL", False)
+    return client[server.DB_NAME]
+
+
+async def insert_baseline_shop(db, pin: str) -> tuple:
+    """One shop as the single-shop release stored it: users with shop_id "", nothing else stamped"""
+    config = server.ShopConfig(pin_hash=server.hash_pin(pin), shop_name="मेरो पसल", shop_name_en="My Shop")
+    user_id = str(uuid.uuid4())
+    await db.shop_config.insert_one(config.model_dump())
+    await db.users.insert_one({
+        "id": user_id, "shop_id": "", "name": "Owner / मालिक", "pin_hash": server.hash_pin(pin),
+        "role": "owner", "is_active": True, "created_at": datetime.now(timezone.utc),
+    })
+    product = server.Product(name_en="Steel plate", category="steel", selling_price=250, quantity=12).model_dump()
+    product.pop("shop_id", None)
+    await db.products.insert_one(product)
+    return config.id, user_id
+
+
+def test_baseline_users_can_log_in_after_migration(mongo):
+    shop_id, user_id = asyncio.run(insert_baseline_shop(mongo, "4321"))
+
+    asyncio.run(migrate_shop_id.migrate(None, dry_run=False))
+
+    with TestClient(server.app) as client:
+        users = client.get("/api/auth/users").json()["users"]
+        assert [u["id"] for u in users] == [user_id]
+
+        login = client.post("/api/auth/login", json={"user_id": user_id, "pin": "4321"})
+        assert login.status_code == 200
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        products = client.get("/api/products", headers=headers)
+        assert products.status_code == 200
+        assert [p["name_en"] for p in products.json()] == ["Steel plate"]
+
+
+def test_dry_run_counts_empty_shop_ids(mongo, capsys):
+    asyncio.run(insert_baseline_shop(mongo, "4321"))
+
+    asyncio.run(migrate_shop_id.migrate(None, dry_run=True))
+
+    output = capsys.readouterr().out
+    assert "  users: 1" in output
+    assert "  products: 1" in output